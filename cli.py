@@ -0,0 +1,324 @@
+"""
+Запуск без графического интерфейса: серверы, Linux, параллельные прогоны.
+
+    python cli.py split    --source text.txt --chunks chunks [--clean]
+    python cli.py generate --chunks chunks --prompts prompts
+    python cli.py verify   --prompts prompts
+    python cli.py pipeline --source text.txt --chunks chunks --prompts prompts
+
+Папки и остальные настройки по умолчанию берутся из config.json (--config);
+--set ключ=значение переопределяет параметр только на этот запуск (значение
+разбирается как JSON, иначе остаётся строкой). Прогресс - строки JSON в stdout,
+по одной на событие; лог - в stderr. tkinter, gui и winsound не импортируются,
+lock-файл не создаётся: параллельные запуски разводятся --keys / --limits.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+from config.settings import ConfigManager
+from logic import job_factory
+from logic.cancellation import CancelToken
+from logic.stream_pipeline import StreamingPipeline
+from logic.text_chunker import TextChunker
+from logic.verification_processor import VerificationProcessor
+from main import create_services
+from utils.atomic_store import atomic_write_text
+from utils.logger import Logger
+
+
+class EventWriter:
+    """События прогресса: по строке JSON в stdout (потокобезопасно)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps(dict(event=event, time=round(time.time(), 3), **fields), ensure_ascii=False)
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+def parse_overrides(pairs):
+    """['ключ=значение'] → {ключ: значение} (JSON или строка)"""
+    overrides = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep or not key:
+            raise SystemExit(f"❌ --set ожидает ключ=значение, получено: {pair}")
+        try:
+            overrides[key] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key] = value
+    return overrides
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Groq Prompt Generator без графического интерфейса")
+    parser.add_argument("--config", default="config.json", help="файл настроек (по умолчанию config.json)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="КЛЮЧ=ЗНАЧЕНИЕ",
+                        help="переопределить параметр config.json на этот запуск (можно несколько раз)")
+    parser.add_argument("--keys", default="API_keys.txt", help="файл API ключей")
+    parser.add_argument("--limits", default="logs/keys_limits.json", help="файл состояния лимитов ключей")
+    parser.add_argument("--workers", type=int, default=None, help="потоков генерации (0 - авто)")
+
+    stages = parser.add_subparsers(dest="stage", required=True)
+
+    split = stages.add_parser("split", help="этап 1: разбить текст на чанки")
+    split.add_argument("--source", help="исходный текст (по умолчанию source_text_file)")
+    split.add_argument("--chunks", help="папка чанков (по умолчанию chunks_folder)")
+    split.add_argument("--clean", action="store_true", help="удалить старые .txt из папки чанков")
+
+    generate = stages.add_parser("generate", help="этап 2: создать промпты по чанкам")
+    generate.add_argument("--chunks", help="папка чанков (по умолчанию chunks_folder)")
+    generate.add_argument("--prompts", help="папка промптов (по умолчанию prompts_folder)")
+
+    verify = stages.add_parser("verify", help="этап 3: проверить промпты")
+    verify.add_argument("--prompts", help="папка промптов (по умолчанию prompts_folder)")
+
+    pipeline = stages.add_parser("pipeline", help="этапы 1 → 2 → 3 потоковым конвейером")
+    pipeline.add_argument("--source", help="исходный текст (по умолчанию source_text_file)")
+    pipeline.add_argument("--chunks", help="папка чанков (по умолчанию chunks_folder)")
+    pipeline.add_argument("--prompts", help="папка промптов (по умолчанию prompts_folder)")
+    return parser
+
+
+class HeadlessRunner:
+    """Этапы 1-3 по аргументам командной строки"""
+
+    def __init__(self, args, config, logger, events):
+        self.args = args
+        self.config = config
+        self.logger = logger
+        self.events = events
+        self.keys = None
+        self.api = None
+        self.processor = None
+        self.runner = None
+        self.cancel = CancelToken()     # для этапов без исполнителя (последовательная проверка)
+        self.stopped = False
+
+    def fail(self, message):
+        self.logger.log(message, "error")
+        self.events.emit("error", message=message)
+        return 2
+
+    def folder(self, name, config_key, default):
+        return getattr(self.args, name, None) or self.config.get(config_key) or default
+
+    def workers(self):
+        if self.args.workers is not None:
+            return self.args.workers
+        return self.config.get_max_workers()
+
+    def verification_prompt(self):
+        prompt = (self.config.get('verification_prompt') or "").strip()
+        return prompt if len(prompt) >= 20 else None
+
+    def ensure_services(self):
+        """Ключи и API клиент (этапу 1 не нужны)"""
+        if self.keys is None:
+            self.keys, self.api, self.processor = create_services(
+                self.config, self.logger, keys_file=self.args.keys, limits_file=self.args.limits
+            )
+        return bool(self.keys.api_keys)
+
+    def run(self):
+        try:
+            return getattr(self, f"run_{self.args.stage}")()
+        finally:
+            if self.keys is not None:
+                self.keys.close()
+
+    def stop(self):
+        """SIGINT / SIGTERM: остановить текущий исполнитель (запросы в полёте прерываются)"""
+        self.stopped = True
+        self.cancel.cancel()
+        if self.runner is not None:
+            self.runner.stop()
+        self.logger.log("⏹️ Остановка...", "warning")
+
+    def wait(self, target):
+        """Выполнить target в потоке, оставив главный поток для сигналов"""
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault('value', target()), daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(0.2)
+        return result.get('value')
+
+    # ---------- этапы ----------
+
+    def split_source(self):
+        """Текст источника → чанки (None - ошибка уже выведена)"""
+        source = self.folder('source', 'source_text_file', "")
+        if not source or not os.path.exists(source):
+            self.fail(f"❌ Исходный файл не найден: {source or '(не задан)'}")
+            return None
+
+        with open(source, 'r', encoding='utf-8') as f:
+            text = f.read()
+        chunks, merged = TextChunker.split_text(
+            text, self.config.get('chunk_size', 2000),
+            self.config.get('chunk_tolerance', 0.10), self.config.get('chunk_min_threshold', 0.50)
+        )
+        if not chunks:
+            self.fail("❌ Не удалось создать чанки (пустой текст?)")
+            return None
+        self.events.emit("chunks", count=len(chunks), merged=merged)
+        return chunks
+
+    def run_split(self):
+        chunks = self.split_source()
+        if chunks is None:
+            return 2
+
+        chunks_folder = self.folder('chunks', 'chunks_folder', "chunks")
+        os.makedirs(chunks_folder, exist_ok=True)
+        if self.args.clean:
+            for old in Path(chunks_folder).glob("*.txt"):
+                old.unlink()
+
+        for file_path, chunk in zip(StreamingPipeline.chunk_paths(len(chunks), chunks_folder), chunks):
+            atomic_write_text(str(file_path), chunk)
+        self.logger.log(f"✅ Создано {len(chunks)} чанков → {chunks_folder}", "success")
+        self.events.emit("done", stage="split", total=len(chunks), folder=str(chunks_folder))
+        return 0
+
+    def on_file_done(self, index, file_path, success, status, elapsed):
+        self.events.emit("file", stage="generate", index=index, file=file_path.name, success=success,
+                         status=status, elapsed=round(elapsed, 3))
+
+    def on_verified(self, done, total, filename):
+        self.events.emit("verify", done=done, total=total, file=filename)
+
+    def finish_generation(self, stage, results, total, job):
+        router = job.get('router')
+        if router:
+            router.close()
+        processed = sum(1 for result in results if result[1])
+        self.events.emit("done", stage=stage, processed=processed, total=total, stopped=self.stopped)
+        return 0 if processed == total else 1
+
+    def run_generate(self):
+        chunks_folder = self.folder('chunks', 'chunks_folder', "chunks")
+        prompts_folder = self.folder('prompts', 'prompts_folder', "prompts")
+        if not self.ensure_services():
+            return self.fail(f"❌ Нет API ключей в {self.args.keys}")
+
+        files = self.processor.get_files_to_process(chunks_folder)
+        if not files:
+            return self.fail(f"❌ Папка с чанками пуста: {chunks_folder}")
+
+        os.makedirs(prompts_folder, exist_ok=True)
+        self.keys.begin_run()
+        settings = job_factory.settings_from_config(self.config)
+        job = job_factory.create_job(self.config, self.keys, prompts_folder, len(files), settings, logger=self.logger)
+        self.runner = job_factory.create_runner(
+            self.config, self.processor, self.keys, logger=self.logger, max_workers=self.workers()
+        )
+        self.events.emit("start", stage="generate", total=len(files))
+
+        results = self.wait(lambda: self.runner.run(
+            files, job, progress_callback=self.on_file_done, delay=self.config.get_delay()
+        ))
+        return self.finish_generation("generate", results or [], len(files), job)
+
+    def run_verify(self):
+        prompts_folder = Path(self.folder('prompts', 'prompts_folder', "prompts"))
+        verification_prompt = self.verification_prompt()
+        if not verification_prompt:
+            return self.fail("❌ Не задан verification_prompt (--set verification_prompt=...)")
+        if not self.ensure_services():
+            return self.fail(f"❌ Нет API ключей в {self.args.keys}")
+
+        files = sorted(prompts_folder.glob('*.txt'))
+        if not files:
+            return self.fail(f"❌ Нет файлов промптов в {prompts_folder}")
+
+        verifier = VerificationProcessor(self.api, self.logger)
+        model, temperature = self.config.get_model(), self.config.get_temperature()
+        retry_budget = job_factory.create_retry_budget(self.config, len(files))
+        self.events.emit("start", stage="verify", total=len(files))
+
+        if job_factory.use_async_runner(self.config, self.api, self.logger):
+            self.runner = job_factory.create_async_runner(self.config, self.processor, verifier, self.logger)
+            stats = self.wait(lambda: self.runner.verify(
+                files, verification_prompt, model=model, temperature=temperature,
+                progress_callback=self.on_verified, retry_budget=retry_budget
+            ))
+        else:
+            stats = self.wait(lambda: verifier.verify_prompts_folder(
+                prompts_folder, verification_prompt, progress_callback=self.on_verified,
+                model=model, temperature=temperature, retry_budget=retry_budget, cancel=self.cancel
+            ))
+
+        self.events.emit("done", stage="verify", stopped=self.stopped, **(stats or {}))
+        return 0 if stats and not stats.get('errors') and not self.stopped else 1
+
+    def run_pipeline(self):
+        chunks_folder = self.folder('chunks', 'chunks_folder', "chunks")
+        prompts_folder = self.folder('prompts', 'prompts_folder', "prompts")
+        chunks = self.split_source()
+        if chunks is None:
+            return 2
+        if not self.ensure_services():
+            return self.fail(f"❌ Нет API ключей в {self.args.keys}")
+
+        os.makedirs(prompts_folder, exist_ok=True)
+        verification_prompt = self.verification_prompt()
+        if not verification_prompt:
+            self.logger.log("ℹ️ verification_prompt не задан - конвейер без этапа 3", "info")
+
+        self.keys.begin_run()
+        settings = job_factory.settings_from_config(self.config)
+        job = job_factory.create_job(
+            self.config, self.keys, prompts_folder, len(chunks), settings, verification_prompt, self.logger
+        )
+        verifier = VerificationProcessor(self.api, self.logger)
+        self.runner = job_factory.create_pipeline(
+            self.config, self.processor, self.keys, verifier, self.logger, max_workers=self.workers()
+        )
+        self.events.emit("start", stage="pipeline", total=len(chunks), verify=bool(verification_prompt))
+
+        results = self.wait(lambda: self.runner.run_chunks(
+            chunks, chunks_folder, job, verification_prompt,
+            progress_callback=self.on_file_done, verify_callback=self.on_verified,
+            delay=self.config.get_delay()
+        ))
+        if verification_prompt:
+            self.events.emit("verified", **verifier.stats)
+        return self.finish_generation("pipeline", results or [], len(chunks), job)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # stdout - только для событий JSON; всё остальное (лог, print модулей) - в stderr
+    events = EventWriter(sys.stdout)
+    sys.stdout = sys.stderr
+
+    try:
+        config = ConfigManager(args.config)
+    except Exception as e:
+        events.emit("error", message=str(e))
+        return 2
+    for key, value in parse_overrides(args.overrides).items():
+        config.set(key, value)
+
+    runner = HeadlessRunner(args, config, Logger(), events)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: runner.stop())
+    return runner.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,7 @@ class ConfigManager:
         
         # Проверка наличия новых параметров и добавление значений по умолчанию
         self._ensure_chunker_settings()
+        self._ensure_generation_settings()
     
     def load_config(self) -> Dict[str, Any]:
         """Загрузить конфигурацию из JSON файла."""
@@ -61,6 +62,70 @@ class ConfigManager:
             self.save_config()
             print("✅ Конфигурация обновлена с новыми параметрами")
     
+    def _ensure_generation_settings(self):
+        """Добавить настройки параллельной генерации, если их нет."""
+        defaults = {
+            'max_workers': 0,  # 0 = по числу здоровых ключей
+            'limits_flush_interval': 2.0,
+            'usage_backend': 'json',  # json | sqlite
+            'usage_db_path': 'logs/usage.db',
+            'http_pool_size': 0,  # 0 = по числу воркеров
+            'http_prewarm': True,
+            'http_prewarm_connections': 2,
+            'async_runner': False,  # этапы 2 и 3 на asyncio (нужен aiohttp)
+            'async_max_in_flight': 100,
+            'stream_responses': False,  # SSE: промпты по мере генерации, обрыв после prompts_count
+            'retry_max_attempts': 3,
+            'retry_max_wait': 60.0,  # дольше ждать не будем - файл считается неудачным
+            'retry_budget_per_file': 0.5,  # повторов на задание = файлов * 0.5 (не меньше 10)
+            'breaker_window_seconds': 60.0,
+            'breaker_min_calls': 5,
+            'breaker_failure_rate': 0.5,
+            'breaker_slow_call_seconds': 20.0,
+            'breaker_open_seconds': 30.0,
+            'response_cache': True,
+            'response_cache_dir': 'cache/responses',
+            'response_cache_max_mb': 500,
+            'response_cache_max_age_days': 30,
+            'request_timeout_min': 10.0,  # таймаут ответа = p99 задержки * 3 в этих пределах
+            'request_timeout_max': 60.0,
+            'hedge_requests': False,  # копия медленного запроса на другой ключ
+            'hedge_quantile': 0.95,
+            'hedge_budget_percent': 10.0,  # не больше 10% запросов сверх основных
+            'model_chain': [],  # запасные модели после основной (пусто - только основная)
+            'model_quotas': {},  # {модель: максимум запросов за прогон}
+            'model_max_chars': {},  # {модель: максимальная длина чанка}
+            'model_fallback_wait': 60.0,  # запасная модель - только если ключи основной освободятся позже, сек
+            'api_base_url': 'https://api.groq.com',  # или локальный заменитель utils/fake_groq_server.py
+            'pack_chunks': 1,  # чанков в одном запросе (1 - без пакетов)
+            'pack_max_chars': 6000,  # предел текста пакета, байт
+            'batch_mode': False,  # этап 2 через Batch API (ответ в пределах 24 ч)
+            'batch_poll_interval': 30.0,  # опрос состояния batch задания, сек
+            'token_estimate_output': 600,  # ожидаемый ответ в токенах до калибровки по usage
+            'admission_max_wait': 60.0,  # сколько ждать ключа с квотой под запрос, сек
+            'adaptive_concurrency': True,  # AIMD предел запросов в полёте по моделям
+            'concurrency_initial': 4,
+            'concurrency_max': 32,
+            'concurrency_latency_factor': 2.0,  # всплеск задержки = средняя выше нормы в 2 раза
+            'deferred_retries': 2,  # отложенных повторов неудачного файла в конце очереди (0 - без них)
+            'deferred_retry_cooldown': 10.0,  # остывание перед отложенным повтором, сек × номер повтора
+            'inline_max_retries': 2,  # попыток внутри запроса при включённых отложенных повторах
+            'run_journal': True,  # journal.jsonl в папке промптов: перезапуск пропускает готовые файлы
+            'pipeline_queue_size': 16,  # конвейер 1→2→3: ёмкость очередей между этапами
+            'pipeline_verify_workers': 4  # конвейер 1→2→3: потоков проверки
+        }
+        
+        updated = False
+        for key, value in defaults.items():
+            if key not in self.config:
+                self.config[key] = value
+                updated = True
+                print(f"ℹ️ Добавлен параметр конфигурации: {key} = {value}")
+        
+        if updated:
+            self.save_config()
+            print("✅ Конфигурация обновлена с новыми параметрами")
+    
     def save_config(self):
         """Сохранить конфигурацию в JSON файл."""
         try:
@@ -102,6 +167,10 @@ class ConfigManager:
         """Получить задержку между запросами."""
         return self.config.get('delay', 1)
     
+    def get_max_workers(self) -> int:
+        """Получить количество параллельных потоков (0 = авто)."""
+        return self.config.get('max_workers', 0)
+    
     def get_system_prompt(self) -> str:
         """Получить системный промпт."""
         return self.config.get('system_prompt', '')
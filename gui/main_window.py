@@ -2,9 +2,12 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 from logic.verification_processor import VerificationProcessor
+from logic import job_factory
+from logic.text_chunker import TextChunker
+import os
 import time
-import winsound
 from pathlib import Path
+from utils.sound import beep
 
 from gui.settings_tab import SettingsTab
 from gui.stats_tab import StatsTab
@@ -26,10 +29,13 @@ class MainWindow:
         self.is_paused = False
         self.stop_flag = False
         self.processed_files = 0
+        self.journaled_files = 0
+        self.verified_files = None
         self.total_files = 0
         self.start_time = None
         self.processing_times = []
         self.overwrite_all = None
+        self.pool = None
         
         # ✅ НОВОЕ: Процессор проверки промптов
         self.verifier = VerificationProcessor(self.api, self.logger)
@@ -236,6 +242,20 @@ class MainWindow:
             bd=3
         )
         self.verify_stage_button.pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(
+            row3,
+            text="🔗 Конвейер 1→2→3",
+            command=self.run_pipeline,
+            font=("Arial", 11, "bold"),
+            bg="#607D8B",
+            fg="white",
+            width=18,
+            height=1,
+            cursor="hand2",
+            relief=tk.RAISED,
+            bd=3
+        ).pack(side=tk.LEFT, padx=5)
                 
         # Периодическое обновление статистики
         self.root.after(2000, self.periodic_update)
@@ -245,7 +265,7 @@ class MainWindow:
 
     def update_status_display(self):
         """Обновление панели статуса"""
-        active, on_limit, inactive, nearest_reset = self.keys.get_stats()
+        active, on_limit, inactive, nearest_reset = self.keys.get_stats(self.settings_tab.model_var.get())
         
         reset_text = ""
         if nearest_reset:
@@ -264,7 +284,7 @@ class MainWindow:
         
         # Предупреждение о малом количестве ключей
         if active < 3 and active > 0 and self.is_processing:
-            winsound.Beep(1000, 200)
+            beep(1000, 200)
             messagebox.showwarning("⚠️ Внимание", f"Осталось только {active} активных ключей!")
     
     def periodic_update(self):
@@ -335,8 +355,7 @@ class MainWindow:
                                          "Сбросить ВСЮ статистику всех API ключей?\n\n"
                                          "Это удалит все данные об использовании ключей.")
             if result:
-                self.keys.keys_limits = {}
-                self.keys.save_keys_limits()
+                self.keys.reset_all_stats()
                 self.processed_files = 0
                 self.total_files = 0
                 self.start_time = None
@@ -408,88 +427,113 @@ class MainWindow:
         
         if not files_to_process:
             messagebox.showerror("❌ Ошибка", "Папка с чанками пуста!")
-            winsound.Beep(800, 300)
+            beep(800, 300)
             return
         
         # Инициализация
         self.files_to_process = files_to_process
         self.overwrite_all = None
+        self.begin_processing(len(files_to_process))
+        self.job = self.create_job(prompts_folder, len(files_to_process))
+        self.pool = self.create_runner()
+        
+        self.logger.log(f"🚀 Запуск обработки: {self.total_files} файлов", "info")
+        
+        # Запуск в отдельном потоке
+        threading.Thread(target=self.process_files, daemon=True).start()
+    
+    def begin_processing(self, total_files):
+        """Сброс счётчиков прогона, задержка между файлами и кнопки управления"""
         self.is_processing = True
         self.stop_flag = False
         self.is_paused = False
         self.processed_files = 0
-        self.total_files = len(files_to_process)
+        self.journaled_files = 0
+        self.verified_files = None
+        self.total_files = total_files
         self.start_time = time.time()
         self.processing_times = []
+        self.keys.begin_run()
+        
+        # Задержка между файлами (если ключей <= 5)
+        self.file_delay = self.settings_tab.delay_var.get() if len(self.keys.api_keys) <= 5 else 0
         
         # Обновление кнопок
         self.start_button.config(state=tk.DISABLED)
         self.pause_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.NORMAL)
-        
-        self.logger.log(f"🚀 Запуск обработки: {self.total_files} файлов", "info")
-        
-        # Запуск в отдельном потоке
-        threading.Thread(target=self.process_files, daemon=True).start()
+    
+    def create_job(self, prompts_folder, files_count, verification_prompt=None):
+        """Параметры задания этапа 2 с вкладки настроек (фиксируются в главном потоке - Tk не потокобезопасен)"""
+        settings = {
+            'system_prompt': self.settings_tab.system_prompt_text.get(1.0, tk.END).strip(),
+            'model': self.settings_tab.model_var.get(),
+            'temperature': self.settings_tab.temp_var.get(),
+            'prompts_count': self.settings_tab.prompts_count_var.get(),
+            'save_raw': self.settings_tab.save_raw_var.get()
+        }
+        return job_factory.create_job(
+            self.config, self.keys, prompts_folder, files_count, settings, verification_prompt, self.logger
+        )
+    
+    def create_runner(self):
+        """Исполнитель этапа 2: Batch API, асинхронный или пул потоков"""
+        return job_factory.create_runner(
+            self.config, self.processor, self.keys, self.verifier, self.logger,
+            max_workers=self.settings_tab.workers_var.get()
+        )
     
     def toggle_pause(self):
         """Переключение паузы"""
         self.is_paused = not self.is_paused
         
         if self.is_paused:
+            if self.pool:
+                self.pool.pause()
             self.pause_button.config(text="▶️ ПРОДОЛЖИТЬ")
             self.logger.log("⏸️ Пауза", "warning")
         else:
+            if self.pool:
+                self.pool.resume()
             self.pause_button.config(text="⏸️ ПАУЗА")
             self.logger.log("▶️ Продолжение", "info")
     
     def stop_processing(self):
         """Остановка обработки"""
         self.stop_flag = True
+        if self.pool:
+            self.pool.stop()
         self.logger.log("⏹️ Остановка...", "warning")
     
     def process_files(self):
-        """Обработка всех файлов (выполняется в отдельном потоке)"""
-        for file_path in self.files_to_process:
-            if self.stop_flag:
-                break
-            
-            # Пауза
-            while self.is_paused and not self.stop_flag:
-                time.sleep(0.5)
-            
-            if self.stop_flag:
-                break
-            
-            # Обработка одного файла
-            file_start = time.time()
-            
-            success, status = self.processor.process_file(
-                file_path=file_path,
-                output_folder=self.settings_tab.prompts_folder_var.get(),
-                system_prompt=self.settings_tab.system_prompt_text.get(1.0, tk.END).strip(),
-                model=self.settings_tab.model_var.get(),
-                temperature=self.settings_tab.temp_var.get(),
-                prompts_count=self.settings_tab.prompts_count_var.get(),
-                save_raw=self.settings_tab.save_raw_var.get()
-            )
-            
-            if success:
-                self.processed_files += 1
-                file_time = time.time() - file_start
-                self.processing_times.append(file_time)
-                
-                # Обновление прогресса
-                self.update_progress()
-                
-                # Задержка между файлами (если ключей <= 5)
-                if len(self.keys.api_keys) <= 5:
-                    delay = self.settings_tab.delay_var.get()
-                    if delay > 0:
-                        time.sleep(delay)
+        """Обработка всех файлов пулом воркеров (выполняется в отдельном потоке)"""
+        self.pool.run(
+            self.files_to_process,
+            self.job,
+            progress_callback=self.on_file_done,
+            delay=self.file_delay
+        )
+        
+        # Манифест моделей - на диск до сообщения о завершении
+        router = self.job.get('router')
+        if router:
+            router.close()
         
         # Завершение
-        self.finish_processing()
+        self.root.after(0, self.finish_processing)
+    
+    def on_file_done(self, index, file_path, success, status, elapsed):
+        """Результат одного файла (вызывается по порядку файлов из потока пула)"""
+        if success:
+            self.processed_files += 1
+            if status == "journaled":
+                # Готов по журналу прогона - в ETA не учитывается
+                self.journaled_files += 1
+            else:
+                self.processing_times.append(elapsed)
+            
+            # Обновление прогресса
+            self.root.after(0, self.update_progress)
     
     def update_progress(self):
         """Обновление прогресс-бара"""
@@ -497,7 +541,9 @@ class MainWindow:
         
         # ETA расчёт
         if len(self.processing_times) > 0:
-            avg_time = sum(self.processing_times[-10:]) / len(self.processing_times[-10:])
+            # При параллельной обработке считаем по фактической пропускной способности
+            elapsed = time.time() - self.start_time
+            avg_time = elapsed / (self.processed_files - self.journaled_files)
             remaining = self.total_files - self.processed_files
             eta_seconds = int(avg_time * remaining)
             eta_minutes = eta_seconds // 60
@@ -506,10 +552,24 @@ class MainWindow:
         else:
             eta_text = "Расчёт..."
         
+        workers_text = f" | 🧵 {self.pool.workers_count}" if self.pool else ""
+        verified_text = f" | 🔍 {self.verified_files}" if self.verified_files is not None else ""
         self.progress_label.config(
-            text=f"📊 Обработано: {self.processed_files}/{self.total_files} ({percent}%) | {eta_text}"
+            text=f"📊 Обработано: {self.processed_files}/{self.total_files} ({percent}%) | {eta_text}{workers_text}"
+                 f"{verified_text}{self.concurrency_text()}"
         )
     
+    def concurrency_text(self):
+        """Адаптивный предел запросов в полёте: ' | 🎯 в полёте/предел' по моделям"""
+        stats = self.keys.concurrency.get_stats() if self.keys.concurrency.enabled else {}
+        if not stats:
+            return ""
+        if len(stats) == 1:
+            (target, in_flight), = stats.values()
+            return f" | 🎯 {in_flight}/{target}"
+        parts = [f"{model.split('/')[-1]} {in_flight}/{target}" for model, (target, in_flight) in stats.items()]
+        return " | 🎯 " + ", ".join(parts)
+    
     def finish_processing(self):
         """Завершение обработки"""
         self.is_processing = False
@@ -530,7 +590,7 @@ class MainWindow:
         else:
             self.logger.log(f"🎉 Завершено: {self.processed_files}/{self.total_files} файлов за {minutes}м {seconds}с", "success")
             self.progress_label.config(text="✅ Обработка завершена!")
-            winsound.Beep(1000, 500)
+            beep(1000, 500)
     
     def clean_cache(self):
         """🧹 ОТДЕЛЬНАЯ ФУНКЦИЯ: Очистка Python кэша (__pycache__)"""
@@ -578,6 +638,78 @@ class MainWindow:
         # Это текущий функционал кнопки СТАРТ
         self.start_processing()
     
+    def run_pipeline(self):
+        """Этапы 1 → 2 → 3 одним потоковым прогоном (StreamingPipeline)"""
+        if self.is_processing:
+            return
+        
+        source_file = self.settings_tab.source_file_var.get()
+        chunks_folder = self.settings_tab.chunks_folder_var.get() or self.config.get('chunks_folder', 'chunks')
+        prompts_folder = self.settings_tab.prompts_folder_var.get()
+        
+        if not source_file or not os.path.exists(source_file):
+            messagebox.showerror("❌ Ошибка", "Выберите исходный текстовый файл на вкладке 'Настройки'!")
+            return
+        
+        if not prompts_folder:
+            messagebox.showerror("❌ Ошибка", "Выберите папку для промптов!")
+            return
+        
+        if not self.keys.api_keys:
+            messagebox.showerror("❌ Ошибка", "Нет доступных API ключей!")
+            return
+        
+        try:
+            with open(source_file, 'r', encoding='utf-8') as f:
+                text = f.read()
+            chunks, _ = TextChunker.split_text(
+                text, self.settings_tab.chunk_size_var.get(),
+                self.config.get('chunk_tolerance', 0.10), self.config.get('chunk_min_threshold', 0.50)
+            )
+        except Exception as e:
+            messagebox.showerror("❌ Ошибка", f"Не удалось разбить текст:\n{str(e)}")
+            return
+        
+        if not chunks:
+            messagebox.showwarning("Внимание", "Не удалось создать чанки!")
+            return
+        
+        # Без промпта проверки конвейер делает этапы 1 → 2
+        verification_prompt = self.settings_tab.verification_prompt_text.get(1.0, tk.END).strip()
+        if len(verification_prompt) < 20:
+            verification_prompt = None
+            self.logger.log("ℹ️ Промпт проверки не задан - конвейер без этапа 3", "info")
+        
+        self.begin_processing(len(chunks))
+        self.job = self.create_job(prompts_folder, len(chunks), verification_prompt)
+        if verification_prompt:
+            self.verified_files = 0
+        self.pool = job_factory.create_pipeline(
+            self.config, self.processor, self.keys, self.verifier, self.logger,
+            max_workers=self.settings_tab.workers_var.get()
+        )
+        
+        self.logger.log(f"🚀 Запуск конвейера: {self.total_files} чанков", "info")
+        
+        def pipeline_thread():
+            self.pool.run_chunks(
+                chunks, chunks_folder, self.job, verification_prompt,
+                progress_callback=self.on_file_done,
+                verify_callback=self.on_file_verified,
+                delay=self.file_delay
+            )
+            router = self.job.get('router')
+            if router:
+                router.close()
+            self.root.after(0, self.finish_processing)
+        
+        threading.Thread(target=pipeline_thread, daemon=True).start()
+    
+    def on_file_verified(self, done, total, filename):
+        """Файл прошёл проверку в конвейере (вызывается из потока проверки)"""
+        self.verified_files = done
+        self.root.after(0, self.update_progress)
+    
     def run_stage_3(self):
         """Этап 3: Проверить промпты через AI"""
         # Проверка verification_prompt
@@ -601,17 +733,38 @@ class MainWindow:
             )
             return
         
+        # Модель и температура - текущие из настроек
+        model = self.settings_tab.model_var.get()
+        temperature = self.settings_tab.temp_var.get()
+        retry_budget = job_factory.create_retry_budget(self.config, len(list(prompts_folder.glob('*.txt'))))
+        runner = None
+        if job_factory.use_async_runner(self.config, self.api, self.logger):
+            runner = job_factory.create_async_runner(self.config, self.processor, self.verifier, self.logger)
+        
         # Запуск проверки
         self.logger.log("🔍 Запуск проверки промптов...", "info")
         self.verify_stage_button.config(state=tk.DISABLED)
         
         def verify_thread():
             try:
-                stats = self.verifier.verify_prompts_folder(
-                    prompts_folder=prompts_folder,
-                    verification_prompt=verification_prompt,
-                    progress_callback=self._update_verify_progress
-                )
+                if runner:
+                    stats = runner.verify(
+                        sorted(prompts_folder.glob('*.txt')),
+                        verification_prompt,
+                        model=model,
+                        temperature=temperature,
+                        progress_callback=self._update_verify_progress,
+                        retry_budget=retry_budget
+                    )
+                else:
+                    stats = self.verifier.verify_prompts_folder(
+                        prompts_folder=prompts_folder,
+                        verification_prompt=verification_prompt,
+                        progress_callback=self._update_verify_progress,
+                        model=model,
+                        temperature=temperature,
+                        retry_budget=retry_budget
+                    )
                 
                 # Показать результат
                 self.root.after(0, lambda: self._show_verify_complete(stats))
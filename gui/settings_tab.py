@@ -337,6 +337,21 @@ class SettingsTab:
                 fg="gray", font=("Arial", 8)).pack(side=tk.LEFT, padx=5)
         row += 1
         
+        # Параллельные потоки
+        tk.Label(container, text="🧵 Параллельных потоков:", bg="#ffffff", fg="black",
+                font=("Arial", 10, "bold")).grid(row=row, column=0, sticky=tk.W, pady=10)
+        
+        workers_frame = tk.Frame(container, bg="#ffffff")
+        workers_frame.grid(row=row, column=1, sticky=tk.W, pady=10)
+        
+        self.workers_var = tk.IntVar(value=self.config.get("max_workers", 0))
+        ttk.Spinbox(workers_frame, from_=0, to=200, textvariable=self.workers_var,
+                   width=10, command=self.on_setting_change).pack(side=tk.LEFT)
+        
+        tk.Label(workers_frame, text="(0 = по числу активных ключей)", bg="#ffffff",
+                fg="gray", font=("Arial", 8)).pack(side=tk.LEFT, padx=5)
+        row += 1
+        
         # Сохранять сырые ответы
         self.save_raw_var = tk.BooleanVar(value=self.config.get("save_raw_responses", False))
         tk.Checkbutton(
@@ -448,6 +463,7 @@ class SettingsTab:
         self.config.config["system_prompt"] = self.system_prompt_text.get(1.0, tk.END).strip()
         self.config.config["prompts_count"] = self.prompts_count_var.get()
         self.config.config["delay"] = self.delay_var.get()
+        self.config.config["max_workers"] = self.workers_var.get()
         self.config.config["save_raw_responses"] = self.save_raw_var.get()
         self.config.config["verification_prompt"] = self.verification_prompt_text.get(1.0, tk.END).strip()
         self.config.save_config()
@@ -1,6 +1,7 @@
 # gui/stats_tab.py - ПОЛНОСТЬЮ ПЕРЕПИСАТЬ
 
 import tkinter as tk
+import time
 from tkinter import ttk
 from datetime import datetime
 
@@ -8,6 +9,15 @@ from datetime import datetime
 class StatsTab:
     """Вкладка статистики ключей"""
     
+    STATUS_LABELS = {
+        'invalid': "❌ Невалидный",
+        'breaker': "🔌 Отключён",
+        'rpd': "🔴 RPD лимит",
+        'tpd': "🔴 TPD лимит",
+        'rpm': "🟡 RPM лимит",
+        'tpm': "🟡 TPM лимит"
+    }
+    
     def __init__(self, parent, key_manager):
         self.parent = parent
         self.key_manager = key_manager
@@ -57,6 +67,30 @@ class StatsTab:
         ).pack(anchor="w", padx=20, pady=5)
 
 
+        # Фактический расход токенов (по полю usage ответов): прогон и модели
+        usage_frame = tk.Frame(container, bg="#f5fff0", relief=tk.RIDGE, borderwidth=2)
+        usage_frame.pack(fill=tk.X, pady=5)
+        
+        self.run_usage_label = tk.Label(
+            usage_frame,
+            text="🏃 Текущий прогон: -",
+            bg="#f5fff0",
+            fg="#000000",
+            font=("Arial", 9),
+            justify="left"
+        )
+        self.run_usage_label.pack(anchor="w", padx=10, pady=2)
+        
+        self.model_usage_label = tk.Label(
+            usage_frame,
+            text="🧠 По моделям: -",
+            bg="#f5fff0",
+            fg="#333333",
+            font=("Arial", 9),
+            justify="left"
+        )
+        self.model_usage_label.pack(anchor="w", padx=10, pady=2)
+
         # Настройка стиля таблицы
         style = ttk.Style()
         style.configure("Treeview",
@@ -118,25 +152,29 @@ class StatsTab:
         # ✅ Теперь берем правильный лимит для ТЕКУЩЕЙ модели
         rpd_limit = MODEL_LIMITS.get(model, {}).get('rpd', 1000)
         
-        # Заполнение таблицы (остальной код без изменений)
+        # Сводка запросов/токенов/ошибок (при SQLite - накопленные итоги; запросы за сутки - по индексу журнала)
+        totals = self.key_manager.get_usage_totals()
+        daily = self.key_manager.get_request_counts(since=time.time() - 86400)
+        
+        self.update_usage_summary()
+        
+        # Заполнение таблицы
         for key in self.key_manager.api_keys:
             key_id = key[-8:]
             
             if key_id in self.key_manager.keys_limits:
                 data = self.key_manager.keys_limits[key_id]
+                usage = totals.get(key_id, {})
                 
-                # Определение статуса
-                if data.get('permanently_invalid', False):
-                    status = "❌ Невалидный"
-                elif data.get('tokens_used_today', 0) >= 14400:
-                    status = "🔴 TPD лимит"
-                elif data.get('requests_this_minute', 0) >= 30:
-                    status = "🟡 RPM лимит"
-                else:
-                    status = "🟢 Активен"
+                # Определение статуса по bucket'ам лимитера для текущей модели
+                key_status = self.key_manager.get_key_status(key_id, model)
+                status = self.STATUS_LABELS.get(key_status, "🟢 Активен")
                 
-                # Расчёт RPD статуса с цветовым индикатором
-                total_requests = data.get('total_requests', 0)
+                # Расчёт RPD статуса с цветовым индикатором (за сутки, если есть журнал)
+                if daily is not None:
+                    total_requests = daily.get(key_id, 0)
+                else:
+                    total_requests = data.get('total_requests', 0)
                 rpd_percentage = (total_requests / rpd_limit * 100) if rpd_limit > 0 else 0
                 
                 # Цветовой индикатор на основе процента
@@ -150,9 +188,9 @@ class StatsTab:
                 # Вставка в таблицу
                 self.stats_tree.insert('', tk.END, values=(
                     f"...{key_id}",
-                    data.get('total_requests', 0),
-                    data.get('total_tokens_in', 0),
-                    data.get('total_tokens_out', 0),
+                    usage.get('requests', data.get('total_requests', 0)),
+                    usage.get('tokens_in', data.get('total_tokens_in', 0)),
+                    usage.get('tokens_out', data.get('total_tokens_out', 0)),
                     data.get('prompts_generated', 0),
                     data.get('files_processed', 0),
                     data.get('errors', 0),
@@ -169,3 +207,31 @@ class StatsTab:
                     "🟢 Активен",
                     rpd_indicator
                 ))
+    
+    def update_usage_summary(self):
+        """Сводка токенов текущего прогона и по моделям за всё время"""
+        run_usage = self.key_manager.get_run_usage()
+        if run_usage:
+            lines = []
+            for model, usage in sorted(run_usage.items()):
+                line = (
+                    f"{model}: {usage['requests']} запр., "
+                    f"IN {usage['tokens_in']:,} / OUT {usage['tokens_out']:,}, "
+                    f"очередь {usage['avg_queue_time']:.2f}с, обработка {usage['avg_processing_time']:.2f}с"
+                )
+                if usage['estimated']:
+                    line += f" (оценка: {usage['estimated']})"
+                lines.append(line)
+            self.run_usage_label.config(text="🏃 Текущий прогон:\n   " + "\n   ".join(lines))
+        else:
+            self.run_usage_label.config(text="🏃 Текущий прогон: -")
+        
+        model_usage = self.key_manager.get_model_usage()
+        if model_usage:
+            lines = [
+                f"{model}: {usage['requests']} запр., IN {usage['tokens_in']:,} / OUT {usage['tokens_out']:,}"
+                for model, usage in sorted(model_usage.items())
+            ]
+            self.model_usage_label.config(text="🧠 По моделям:\n   " + "\n   ".join(lines))
+        else:
+            self.model_usage_label.config(text="🧠 По моделям: -")
@@ -1,8 +1,61 @@
+import asyncio
+import json
 import requests
 import time
-import winsound
 from datetime import datetime
 
+from logic.hedging import Hedger, LatencyTracker
+from logic.http_transport import get_shared_transport, abort_response, GROQ_API_BASE, RequestCancelled, RequestTiming
+from logic.response_cache import ResponseCache
+from logic.retry_policy import RetryEngine
+from logic.token_usage import TokenEstimator, TokenUsage
+from utils.sound import beep
+
+try:
+    import aiohttp
+except ImportError:  # асинхронный режим опционален
+    aiohttp = None
+
+class ApiResult:
+    """Итог send_request: ответ, статус, аренда и фактический расход токенов"""
+    
+    def __init__(self, text, status, lease=None, usage=None, cached=False):
+        self.text = text
+        self.status = status
+        self.lease = lease          # последняя попытка (None - ответ из кэша или ключей нет)
+        self.usage = usage          # TokenUsage (None - запрос не дошёл до ответа)
+        self.cached = cached
+        self.cache_key = None       # запись кэша с этим ответом (для discard_cached)
+    
+    @property
+    def success(self):
+        return self.status == "success"
+    
+    @property
+    def prompt_tokens(self):
+        return self.usage.prompt_tokens if self.usage else 0
+    
+    @property
+    def completion_tokens(self):
+        return self.usage.completion_tokens if self.usage else 0
+    
+    @property
+    def total_tokens(self):
+        return self.usage.total_tokens if self.usage else 0
+    
+    @property
+    def queue_time(self):
+        """Ожидание в очереди Groq, сек"""
+        return self.usage.queue_time if self.usage else 0.0
+    
+    @property
+    def processing_time(self):
+        """Обработка на сервере Groq, сек"""
+        return self.usage.processing_time if self.usage else 0.0
+    
+    def __repr__(self):
+        return f"ApiResult({self.status}, usage={self.usage}, cached={self.cached})"
+
 class GroqAPIClient:
     """Клиент для работы с Groq API"""
     
@@ -10,7 +63,49 @@ class GroqAPIClient:
         self.key_manager = key_manager
         self.logger = logger
         self.config = config
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+        self.api_base = (config.get('api_base_url', GROQ_API_BASE) if config else GROQ_API_BASE).rstrip('/')
+        self.api_url = f"{self.api_base}/openai/v1/chat/completions"
+        
+        # Общий пул keep-alive соединений (0 = по числу воркеров, минимум 10)
+        pool_size = config.get('http_pool_size', 0) if config else 0
+        self.transport = get_shared_transport(pool_size or 10, logger)
+        
+        # Политики повторов
+        self.max_retries = config.get('retry_max_attempts', 3) if config else 3
+        self.retry = RetryEngine(key_manager, max_wait=config.get('retry_max_wait', 60.0) if config else 60.0)
+        
+        # Допуск запросов: оценка токенов до отправки и ожидание ключа, чей TPM её пропустит
+        self.estimator = TokenEstimator(
+            default_output=config.get('token_estimate_output', 600) if config else 600,
+            seed_source=key_manager.get_model_usage
+        )
+        self.admission_max_wait = config.get('admission_max_wait', 60.0) if config else 60.0
+        
+        # Адаптивный таймаут и хеджирование медленных запросов
+        self.latency = LatencyTracker(
+            min_timeout=config.get('request_timeout_min', 10.0) if config else 10.0,
+            max_timeout=config.get('request_timeout_max', 60.0) if config else 60.0
+        )
+        self.hedger = Hedger(
+            key_manager, self.latency,
+            enabled=config.get('hedge_requests', False) if config else False,
+            quantile=config.get('hedge_quantile', 0.95) if config else 0.95,
+            budget_percent=config.get('hedge_budget_percent', 10.0) if config else 10.0,
+            logger=logger
+        )
+        
+        # Пробные заявки выключателей ключей и моделей
+        key_manager.set_prober(self.probe_lease, logger)
+        
+        # Дисковый кэш ответов (повторный прогон тех же чанков не тратит квоту)
+        self.cache = None
+        if config and config.get('response_cache', True):
+            self.cache = ResponseCache(
+                config.get('response_cache_dir', 'cache/responses'),
+                max_bytes=int(config.get('response_cache_max_mb', 500) * 1024 * 1024),
+                max_age_seconds=config.get('response_cache_max_age_days', 30) * 86400,
+                logger=logger
+            )
     
     def log(self, message, level="info"):
         """Вывод в лог"""
@@ -19,6 +114,12 @@ class GroqAPIClient:
         else:
             print(message)
     
+    def prewarm(self, connections=None):
+        """Заранее открыть соединения с API (вызывать в фоне при запуске)"""
+        if connections is None:
+            connections = self.config.get('http_prewarm_connections', 2) if self.config else 2
+        self.transport.prewarm(self.api_base, connections)
+    
     def validate_model(self, model):
         """✅ НОВОЕ: Проверить доступность модели перед использованием"""
         production_models = [
@@ -34,116 +135,705 @@ class GroqAPIClient:
             return False
         return True
     
-    def send_request(self, user_message, system_prompt, model, temperature, max_retries=3):
-        """Отправка запроса к Groq API с повторами при ошибках"""
+    def estimate_tokens(self, system_prompt, user_message, model):
+        """(входные токены, резерв квоты на запрос с ответом) по калиброванной оценке модели"""
+        return self.estimator.estimate(model, system_prompt + user_message)
+    
+    def _admission_delay(self, model, waited):
+        """Ожидание до ключа, чьи лимиты пропустят запрос (None - ждать бессмысленно или слишком долго)"""
+        ready_in = self.key_manager.scheduler.next_ready_in(model)
+        if ready_in is None or waited + ready_in > self.admission_max_wait:
+            return None
+        if not waited:
+            self.log(f"⏳ Ожидание квоты {model}: {ready_in:.1f} с", "info")
+        # Ключ мог перехватить другой воркер (проверка не чаще 20 раз в секунду),
+        # а возврат резерва по факту usage - освободить квоту раньше (проверка не реже раза в секунду)
+        return min(max(ready_in, 0.05), 1.0)
+    
+    def _acquire(self, model, tokens, cancel=None):
+        """
+        Аренда ключа под запрос: сначала слот адаптивного предела запросов в полёте,
+        затем ключ; если квоты нет ни на одном ключе - ждать ровно до её освобождения.
+        Отмена cancel прерывает оба ожидания (результат - None).
+        """
+        concurrency = self.key_manager.concurrency
+        if not concurrency.acquire(model, self.admission_max_wait, cancel):
+            return None
+        
+        lease = self.key_manager.acquire_lease(model, tokens)
+        waited = 0.0
+        while not lease:
+            delay = self._admission_delay(model, waited)
+            if delay is None or not self._sleep(delay, cancel):
+                concurrency.cancel(model)
+                return None
+            waited += delay
+            lease = self.key_manager.acquire_lease(model, tokens)
+        lease.slot = concurrency.enabled
+        return lease
+    
+    async def _acquire_async(self, model, tokens, cancel=None):
+        """Асинхронный вариант _acquire: ожидания будятся освобождением слота и отменой, без опроса"""
+        concurrency = self.key_manager.concurrency
+        if not await self._acquire_slot_async(model, cancel):
+            return None
+        
+        lease = self.key_manager.acquire_lease(model, tokens)
+        waited = 0.0
+        try:
+            while not lease:
+                delay = self._admission_delay(model, waited)
+                if delay is None or not await self._sleep_async(delay, cancel):
+                    concurrency.cancel(model)
+                    return None
+                waited += delay
+                lease = self.key_manager.acquire_lease(model, tokens)
+        except asyncio.CancelledError:
+            concurrency.cancel(model)
+            raise
+        lease.slot = concurrency.enabled
+        return lease
+    
+    async def _acquire_slot_async(self, model, cancel=None):
+        """Слот предела запросов в полёте для event loop (False - не дождались за admission_max_wait или отмена)"""
+        concurrency = self.key_manager.concurrency
+        if concurrency.try_acquire(model):
+            return True
+        
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        wake = lambda: loop.call_soon_threadsafe(wakeup.set)
+        unregisters = [concurrency.on_release(wake)]
+        if cancel is not None:
+            unregisters.append(cancel.on_cancel(wake))
+        deadline = time.time() + self.admission_max_wait
+        try:
+            while True:
+                # Сброс до проверки: set() из call_soon_threadsafe выполнится только после await
+                wakeup.clear()
+                if concurrency.try_acquire(model):
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0 or (cancel is not None and cancel.cancelled):
+                    return False
+                await self._wait_event_async(wakeup, remaining)
+        finally:
+            for unregister in unregisters:
+                unregister()
+    
+    @staticmethod
+    async def _wait_event_async(event, timeout=None):
+        """Дождаться asyncio.Event не дольше timeout секунд"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _sleep_async(self, seconds, cancel=None):
+        """Асинхронная пауза, прерываемая отменой (False - отменено)"""
+        if cancel is None:
+            await asyncio.sleep(seconds)
+            return True
+        await self._wait_signal_async(cancel.on_cancel, seconds)
+        return not cancel.cancelled
+    
+    async def _wait_signal_async(self, subscribe, timeout=None):
+        """Дождаться в event loop вызова подписки subscribe (on_cancel / on_resume) или таймаута"""
+        loop = asyncio.get_running_loop()
+        signal = asyncio.Event()
+        unregister = subscribe(lambda: loop.call_soon_threadsafe(signal.set))
+        try:
+            await self._wait_event_async(signal, timeout)
+        finally:
+            unregister()
+    
+    @staticmethod
+    def _sleep(seconds, cancel=None):
+        """Пауза, прерываемая отменой (False - отменено)"""
+        if cancel is None:
+            time.sleep(seconds)
+            return True
+        return cancel.sleep(seconds)
+    
+    def _build_request(self, api_key, user_message, system_prompt, model, temperature, stream=False):
+        """Заголовки и тело запроса chat/completions"""
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": temperature
+        }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return headers, payload
+    
+    @staticmethod
+    def _parse_sse_line(line):
+        """Строка SSE потока → (кусок текста, поток закончен, usage или None)"""
+        if not line or not line.startswith("data:"):
+            return "", False, None
+        
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return "", True, None
+        
+        chunk = json.loads(data)
+        # Groq кладёт usage в x_groq последнего чанка, OpenAI-совместимые - в usage
+        usage = (chunk.get("x_groq") or {}).get("usage") or chunk.get("usage")
+        choices = chunk.get("choices") or []
+        if not choices:
+            return "", usage is not None, usage
+        delta = choices[0].get("delta", {}).get("content") or ""
+        finished = choices[0].get("finish_reason") is not None and usage is not None
+        return delta, finished, usage
+    
+    def _read_stream(self, response, stream, cancel=None):
+        """
+        Читать SSE ответ в stream до конца или до stream.feed() == True → (текст, usage или None).
+        
+        Отмена cancel обрывает соединение - чтение завершается RequestCancelled.
+        """
+        response.encoding = "utf-8"
+        usage = None
+        unregister = cancel.on_cancel(lambda: abort_response(response)) if cancel is not None else None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                delta, finished, chunk_usage = self._parse_sse_line(line)
+                usage = chunk_usage or usage
+                if delta and stream.feed(delta):
+                    # Нужное число промптов набрано - обрываем генерацию
+                    self.log(f"✂️ Поток остановлен досрочно: получено {len(stream.prompts)} промптов", "info")
+                    break
+                if finished:
+                    break
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                raise RequestCancelled("чтение ответа отменено") from e
+            raise
+        finally:
+            if unregister:
+                unregister()
+            response.close()
+        
+        stream.finish()
+        return stream.text, usage
+    
+    @staticmethod
+    def _usage(usage, tokens, answer):
+        """TokenUsage из поля usage, а без него - оценка по тексту ответа"""
+        return TokenUsage.from_dict(usage) or TokenUsage.estimate(tokens, answer)
+    
+    @staticmethod
+    def _classify_status(status_code):
+        """Итог аренды по HTTP коду"""
+        if status_code == 200:
+            return "success"
+        if status_code == 401:
+            return "invalid"
+        if status_code == 429:
+            return "rate_limited"
+        if status_code >= 500:
+            return "server_error"
+        if 400 <= status_code < 500:
+            return "client_error"
+        return "error"
+    
+    def _log_failure(self, outcome, key_id, status_code=None, text="", delay=None):
+        """Сообщение о неудачной попытке (delay - пауза до повтора, None - повтора не будет)"""
+        if outcome == "invalid":
+            self.log(f"❌ Ключ ...{key_id} невалидный (401)", "error")
+        elif outcome == "rate_limited":
+            if delay:
+                self.log(f"⚠️ Rate limit (429), ближайший ключ через {delay:.1f} сек...", "warning")
+            elif delay is not None:
+                self.log(f"⚠️ Rate limit (429), переключение ключа", "warning")
+            else:
+                self.log(f"⚠️ Rate limit (429) с ключом ...{key_id}", "warning")
+        elif outcome == "server_error":
+            self.log(f"⚠️ Ошибка сервера ({status_code}){self._retry_suffix(delay)}", "warning")
+        elif outcome == "timeout":
+            self.log(f"⚠️ Timeout с ключом ...{key_id}{self._retry_suffix(delay)}", "warning")
+        elif outcome == "connection_error":
+            self.log(f"⚠️ Ошибка соединения{self._retry_suffix(delay)}", "warning")
+        elif status_code is not None:
+            self.log(f"❌ Ошибка {status_code}: {text[:100]}", "error")
+        else:
+            self.log(f"❌ Исключение: {text}", "error")
+    
+    @staticmethod
+    def _retry_suffix(delay):
+        if delay is None:
+            return ""
+        return f", повтор через {delay:.1f} сек..." if delay else ", повтор"
+    
+    def _log_success(self, key_id, timing):
+        self.log(
+            f"✅ Успех с ключом ...{key_id} "
+            f"(соединение {timing.connect:.2f}с, первый байт {timing.ttfb:.2f}с, всего {timing.total:.2f}с)",
+            "success"
+        )
+    
+    def _plan_retry(self, outcome, attempt, max_retries, model, status_code, headers, retry_budget):
+        """Пауза перед следующей попыткой (None - прекратить попытки)"""
+        if attempt >= max_retries - 1:
+            return None
+        
+        delay = self.retry.next_delay(outcome, attempt, model, status_code, headers, retry_budget)
+        if delay is None and retry_budget is not None and retry_budget.exhausted:
+            self.log("⚠️ Бюджет повторов задания исчерпан", "warning")
+        return delay
+    
+    def _post(self, lease, user_message, system_prompt, model, temperature, stream=None, cancel=None):
+        """Один HTTP запрос на ключе из аренды (тело потока не читается)"""
+        headers, payload = self._build_request(
+            lease.api_key, user_message, system_prompt, model, temperature, stream=stream is not None
+        )
+        # (соединение, ожидание ответа): второе - по замеренной задержке модели
+        timeout = (10, self.latency.timeout(model))
+        response, _ = self.transport.post(
+            self.api_url, headers=headers, json=payload, timeout=timeout, stream=stream is not None, cancel=cancel
+        )
+        return response
+    
+    @staticmethod
+    def _error_outcome(error):
+        """Итог аренды по исключению запроса"""
+        if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+            return "timeout"
+        if isinstance(error, (asyncio.CancelledError, RequestCancelled)):
+            return "cancelled"
+        return "error"
+    
+    def _settle_racer(self, lease, response, error):
+        """Неудача одного из участников хеджа, пока другой ещё в полёте"""
+        if error is not None:
+            self.key_manager.release_lease(lease, self._error_outcome(error))
+            return
+        self.key_manager.release_lease(lease, self._classify_status(response.status_code), response.headers)
+        response.close()
+    
+    def _discard_racer(self, lease, response, error):
+        """Проигравший участник хеджа: ответ не нужен"""
+        if response is not None:
+            response.close()
+        self.key_manager.release_lease(lease, "cancelled")
+    
+    def _model_available(self, model):
+        """Выключатель модели замкнут (иначе запрос сразу отклоняется)"""
+        wait = self.key_manager.model_wait(model)
+        if wait > 0:
+            self.log(f"⛔ Модель {model} временно отключена, повтор через {wait:.0f} сек", "warning")
+            return False
+        return True
+    
+    def probe_lease(self, lease):
+        """Дешёвая пробная заявка выключателя ("Hi", 1 токен ответа) на ключе из аренды"""
+        try:
+            response, timing = self.transport.post(
+                self.api_url,
+                headers={
+                    "Authorization": f"Bearer {lease.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": lease.model,
+                    "messages": [{"role": "user", "content": "Hi"}],
+                    "max_tokens": 1
+                },
+                timeout=10
+            )
+            lease.timing = timing
+            outcome = self._classify_status(response.status_code)
+            self.key_manager.release_lease(lease, outcome, response.headers)
+        except requests.exceptions.Timeout:
+            self.key_manager.release_lease(lease, "timeout")
+        except requests.exceptions.RequestException:
+            self.key_manager.release_lease(lease, "error")
+        return lease.outcome
+    
+    def send_request(self, user_message, system_prompt, model, temperature, max_retries=None, stream=None,
+                     retry_budget=None, cache_tag=None, cancel=None):
+        """
+        Отправка запроса к Groq API с повторами при ошибках.
+        
+        Возвращает ApiResult: ответ, статус, аренда и usage. Аренда - последняя
+        попытка, т.е. ключ, который реально обслужил (или провалил) запрос.
+        Ответ из кэша приходит без аренды и usage (квота не тратилась).
+        
+        stream - потребитель потокового ответа (reset / feed / finish / text,
+        например PromptStreamParser): ответ читается по SSE по мере генерации,
+        а feed() == True обрывает поток.
+        
+        retry_budget - общий RetryBudget задания: повторы сверх него не делаются.
+        cache_tag - доп. часть ключа кэша (то, что влияет на ответ помимо текста запроса).
+        cancel - CancelToken прогона: пауза задерживает следующие попытки, отмена
+        прерывает ожидания и запрос в полёте (статус cancelled).
+        """
+        if self.cache is None:
+            return self._send_uncached(user_message, system_prompt, model, temperature, max_retries, stream,
+                                       retry_budget, cancel)
+        
+        key = self._cache_key(user_message, system_prompt, model, temperature, stream, cache_tag)
+        result = {}
+        
+        def load():
+            result['value'] = self._send_uncached(user_message, system_prompt, model, temperature, max_retries,
+                                                  stream, retry_budget, cancel)
+            return result['value'].text if result['value'].success else None
+        
+        answer, cached = self.cache.get_or_load(key, load, model)
+        response = self._from_cache(answer, stream) if cached else result['value']
+        if response.success:
+            response.cache_key = key
+        return response
+    
+    def _cache_key(self, user_message, system_prompt, model, temperature, stream, cache_tag):
+        # Потоковый ответ может быть оборван досрочно - кэшируется отдельно от полного
+        tag = [cache_tag, stream is not None]
+        return self.cache.make_key(model, system_prompt, user_message, temperature, tag)
+    
+    def _from_cache(self, answer, stream):
+        """Ответ из кэша в формате send_request"""
+        self.log("💾 Ответ из кэша", "success")
+        if stream is not None:
+            stream.reset()
+            stream.feed(answer)
+            stream.finish()
+        return ApiResult(answer, "success", cached=True)
+    
+    def discard_cached(self, result):
+        """Убрать ответ из кэша (ответ не разобрался - повтор должен уйти в API, а не в кэш)"""
+        if self.cache is not None and result is not None and result.cache_key:
+            self.cache.discard(result.cache_key)
+    
+    def _send_uncached(self, user_message, system_prompt, model, temperature, max_retries=None, stream=None,
+                       retry_budget=None, cancel=None):
+        """Запрос к API в обход кэша (см. send_request)"""
         
         # ✅ НОВОЕ: Проверяем модель перед отправкой
         if not self.validate_model(model):
             self.log(f"❌ Модель '{model}' недоступна!", "error")
-            winsound.Beep(800, 500)
-            return None, "invalid_model"
+            beep(800, 500)
+            return ApiResult(None, "invalid_model")
+        
+        lease = None
+        max_retries = max_retries or self.max_retries
+        prompt_tokens, tokens = self.estimate_tokens(system_prompt, user_message, model)
         
         for attempt in range(max_retries):
-            # Получаем следующий доступный ключ
-            api_key = self.key_manager.get_next_key()
+            # Пауза: новая попытка ждёт продолжения
+            if cancel is not None and not cancel.wait_resumed():
+                return ApiResult(None, "cancelled", lease)
             
-            if not api_key:
+            if not self._model_available(model):
+                return ApiResult(None, "model_unavailable", lease)
+            
+            # Берём в аренду ключ, чьи лимиты модели пропустят запрос
+            lease = self._acquire(model, tokens, cancel)
+            
+            if not lease and cancel is not None and cancel.cancelled:
+                return ApiResult(None, "cancelled")
+            if not lease:
                 self.log("❌ Нет доступных API ключей!", "error")
-                winsound.Beep(800, 500)
-                return None, "no_keys"
+                beep(800, 500)
+                return ApiResult(None, "no_keys")
             
-            key_id = api_key[-8:]
+            key_id = lease.key_id
+            status_code = None
+            response_headers = None
+            text = ""
+            if stream is not None:
+                stream.reset()
             
             try:
                 self.log(f"📤 Запрос с ключом ...{key_id} (попытка {attempt + 1}/{max_retries})", "info")
                 
-                response = requests.post(
-                    self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        "temperature": temperature
-                    },
-                    timeout=30
+                # Медленный запрос может продублироваться на другом ключе - дальше работаем с победителем
+                lease, response, error = self.hedger.run(
+                    lease, tokens,
+                    send=lambda racer, racer_cancel: self._post(
+                        racer, user_message, system_prompt, model, temperature, stream, racer_cancel
+                    ),
+                    is_success=lambda response: response.status_code == 200,
+                    settle=self._settle_racer,
+                    discard=self._discard_racer,
+                    cancel=cancel
                 )
+                key_id = lease.key_id
+                if error is not None:
+                    raise error
                 
-                # Обработка ответа
-                if response.status_code == 200:
-                    # Успех
-                    self.key_manager.update_key_limits(api_key, response.headers)
-                    data = response.json()
-                    answer = data['choices'][0]['message']['content']
-                    self.log(f"✅ Успех с ключом ...{key_id}", "success")
-                    return answer, "success"
-                
-                elif response.status_code == 401:
-                    # Невалидный ключ
-                    self.log(f"❌ Ключ ...{key_id} невалидный (401)", "error")
-                    self.key_manager.mark_key_invalid(api_key)
-                    continue
+                timing = response.timing
+                lease.timing = timing
+                status_code = response.status_code
+                response_headers = response.headers
+                outcome = self._classify_status(status_code)
                 
-                elif response.status_code == 429:
-                    # Rate limit - прогрессивная задержка
-                    self.key_manager.update_key_limits(api_key, response.headers)
-                    
-                    delays = [5, 10, 15]
-                    if attempt < len(delays):
-                        delay = delays[attempt]
-                        self.log(f"⚠️ Rate limit (429), ожидание {delay} сек...", "warning")
-                        time.sleep(delay)
-                        continue
+                # Обработка ответа
+                if outcome == "success":
+                    self.latency.record(model, timing.ttfb)
+                    if stream is not None:
+                        # Аренда держится, пока идёт генерация
+                        read_start = time.perf_counter()
+                        answer, usage = self._read_stream(response, stream, cancel)
+                        timing.total += time.perf_counter() - read_start
                     else:
-                        self.log(f"⚠️ Rate limit (429), переключение ключа", "warning")
-                        continue
-                
-                elif response.status_code == 500:
-                    # Ошибка сервера - сразу следующий ключ
-                    self.log(f"⚠️ Ошибка сервера (500), переключение ключа", "warning")
-                    continue
+                        data = response.json()
+                        answer = data['choices'][0]['message']['content']
+                        usage = data.get('usage')
+                    usage = self._usage(usage, prompt_tokens, answer)
+                    self.estimator.observe(model, len(system_prompt) + len(user_message), usage)
+                    self.key_manager.release_lease(lease, "success", response.headers, usage)
+                    self._log_success(key_id, timing)
+                    return ApiResult(answer, "success", lease, usage)
                 
-                else:
-                    # Другая ошибка
-                    self.log(f"❌ Ошибка {response.status_code}: {response.text[:100]}", "error")
-                    time.sleep(5)
-                    continue
+                self.key_manager.release_lease(lease, outcome, response.headers)
+                text = response.text
+            
+            except RequestCancelled:
+                self.key_manager.release_lease(lease, "cancelled")
+                self.log(f"⏹️ Запрос с ключом ...{key_id} отменён", "warning")
+                return ApiResult(None, "cancelled", lease)
             
             except requests.exceptions.Timeout:
-                self.log(f"⚠️ Timeout с ключом ...{key_id}", "warning")
-                time.sleep(5)
-                continue
+                outcome = "timeout"
+                self.key_manager.release_lease(lease, outcome)
             
             except requests.exceptions.ConnectionError:
-                self.log(f"⚠️ Ошибка соединения, повтор через 5 сек...", "warning")
-                time.sleep(5)
-                continue
+                outcome = "connection_error"
+                self.key_manager.release_lease(lease, "error")
             
             except Exception as e:
-                self.log(f"❌ Исключение: {str(e)}", "error")
-                time.sleep(5)
-                continue
+                outcome = "error"
+                status_code = None
+                text = str(e)
+                self.key_manager.release_lease(lease, outcome)
+            
+            delay = self._plan_retry(outcome, attempt, max_retries, model, status_code, response_headers, retry_budget)
+            self._log_failure(outcome, key_id, status_code, text, delay)
+            if delay is None:
+                break
+            if delay and not self._sleep(delay, cancel):
+                return ApiResult(None, "cancelled", lease)
         
         # Все попытки исчерпаны
-        self.log(f"❌ Не удалось выполнить запрос после {max_retries} попыток", "error")
-        return None, "failed"
+        self.log(f"❌ Не удалось выполнить запрос после {attempt + 1} попыток", "error")
+        return ApiResult(None, "failed", lease)
+    
+    # ---------- asyncio ----------
+    
+    @staticmethod
+    def supports_async():
+        """Установлен ли aiohttp"""
+        return aiohttp is not None
+    
+    def create_async_session(self, limit=100):
+        """aiohttp сессия с пулом keep-alive соединений на limit запросов"""
+        if aiohttp is None:
+            raise RuntimeError("Для асинхронного режима установите aiohttp: pip install aiohttp")
+        connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=60)
+        return aiohttp.ClientSession(connector=connector)
+    
+    async def send_request_async(self, session, user_message, system_prompt, model, temperature, max_retries=None,
+                                 stream=None, retry_budget=None, cache_tag=None, cancel=None):
+        """
+        Асинхронный аналог send_request (те же аренды, лимиты и кэш).
+        
+        Паузы и ожидания слота прерываются отменой cancel, отмена задачи освобождает аренду.
+        cancel - CancelToken прогона: на паузе новые попытки не начинаются.
+        """
+        if self.cache is None:
+            return await self._send_uncached_async(session, user_message, system_prompt, model, temperature,
+                                                   max_retries, stream, retry_budget, cancel)
+        
+        key = self._cache_key(user_message, system_prompt, model, temperature, stream, cache_tag)
+        result = {}
+        
+        async def load():
+            result['value'] = await self._send_uncached_async(session, user_message, system_prompt, model,
+                                                              temperature, max_retries, stream, retry_budget,
+                                                              cancel)
+            return result['value'].text if result['value'].success else None
+        
+        answer, cached = await self.cache.get_or_load_async(key, load, model)
+        response = self._from_cache(answer, stream) if cached else result['value']
+        if response.success:
+            response.cache_key = key
+        return response
+    
+    async def _send_uncached_async(self, session, user_message, system_prompt, model, temperature, max_retries=None,
+                                   stream=None, retry_budget=None, cancel=None):
+        """Асинхронный запрос к API в обход кэша"""
+        if not self.validate_model(model):
+            self.log(f"❌ Модель '{model}' недоступна!", "error")
+            return ApiResult(None, "invalid_model")
+        
+        lease = None
+        max_retries = max_retries or self.max_retries
+        prompt_tokens, tokens = self.estimate_tokens(system_prompt, user_message, model)
+        
+        for attempt in range(max_retries):
+            if cancel is not None and not await self._wait_resumed_async(cancel):
+                return ApiResult(None, "cancelled", lease)
+            
+            if not self._model_available(model):
+                return ApiResult(None, "model_unavailable", lease)
+            
+            lease = await self._acquire_async(model, tokens, cancel)
+            
+            if not lease and cancel is not None and cancel.cancelled:
+                return ApiResult(None, "cancelled")
+            if not lease:
+                self.log("❌ Нет доступных API ключей!", "error")
+                return ApiResult(None, "no_keys")
+            
+            key_id = lease.key_id
+            status_code = None
+            response_headers = None
+            text = ""
+            if stream is not None:
+                stream.reset()
+            
+            try:
+                self.log(f"📤 Запрос с ключом ...{key_id} (попытка {attempt + 1}/{max_retries})", "info")
+                
+                if stream is None:
+                    # Два потока в один парсер не читаем - хеджируются только обычные ответы
+                    lease, result, error = await self.hedger.run_async(
+                        lease, tokens,
+                        send=lambda racer: self._exchange_async(
+                            session, racer, user_message, system_prompt, model, temperature
+                        ),
+                        is_success=lambda result: result[0] == "success",
+                        settle=self._settle_racer_async,
+                        discard=self._discard_racer
+                    )
+                    key_id = lease.key_id
+                    if error is not None:
+                        raise error
+                else:
+                    result = await self._exchange_async(
+                        session, lease, user_message, system_prompt, model, temperature, stream
+                    )
+                
+                outcome, status_code, response_headers, answer, text, usage = result
+                if outcome == "success":
+                    usage = self._usage(usage, prompt_tokens, answer)
+                    self.estimator.observe(model, len(system_prompt) + len(user_message), usage)
+                self.key_manager.release_lease(lease, outcome, response_headers, usage)
+                
+                if outcome == "success":
+                    self.latency.record(model, lease.timing.ttfb)
+                    self._log_success(key_id, lease.timing)
+                    return ApiResult(answer, "success", lease, usage)
+            
+            except asyncio.CancelledError:
+                self.key_manager.release_lease(lease, "cancelled")
+                raise
+            
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                self.key_manager.release_lease(lease, outcome)
+            
+            except aiohttp.ClientConnectionError:
+                outcome = "connection_error"
+                self.key_manager.release_lease(lease, "error")
+            
+            except Exception as e:
+                outcome = "error"
+                status_code = None
+                text = str(e)
+                self.key_manager.release_lease(lease, outcome)
+            
+            delay = self._plan_retry(outcome, attempt, max_retries, model, status_code, response_headers, retry_budget)
+            self._log_failure(outcome, key_id, status_code, text, delay)
+            if delay is None:
+                break
+            if delay and not await self._sleep_async(delay, cancel):
+                return ApiResult(None, "cancelled", lease)
+        
+        self.log(f"❌ Не удалось выполнить запрос после {attempt + 1} попыток", "error")
+        return ApiResult(None, "failed", lease)
+    
+    async def _wait_resumed_async(self, cancel):
+        """Дождаться снятия паузы в event loop (False - прогон отменён)"""
+        while cancel.paused:
+            await self._wait_signal_async(cancel.on_resume)
+        return not cancel.cancelled
+    
+    async def _exchange_async(self, session, lease, user_message, system_prompt, model, temperature, stream=None):
+        """
+        Один асинхронный запрос на ключе из аренды (аренда не освобождается).
+        
+        Возвращает (итог, HTTP код, заголовки, ответ, текст ошибки, usage или None).
+        """
+        headers, payload = self._build_request(
+            lease.api_key, user_message, system_prompt, model, temperature, stream=stream is not None
+        )
+        # Ожидание данных - по замеренной задержке модели
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=self.latency.timeout(model))
+        answer = None
+        text = ""
+        usage = None
+        
+        start = time.perf_counter()
+        async with session.post(self.api_url, headers=headers, json=payload, timeout=timeout) as response:
+            ttfb = time.perf_counter() - start
+            outcome = self._classify_status(response.status)
+            
+            if outcome == "success" and stream is not None:
+                answer, usage = await self._read_stream_async(response, stream)
+            elif outcome == "success":
+                data = await response.json(content_type=None)
+                answer = data['choices'][0]['message']['content']
+                usage = data.get('usage')
+            else:
+                text = await response.text()
+            
+            lease.timing = RequestTiming(ttfb=ttfb, total=time.perf_counter() - start)
+            return outcome, response.status, response.headers, answer, text, usage
+    
+    def _settle_racer_async(self, lease, result, error):
+        """Неудача асинхронного участника хеджа, пока другой ещё в полёте"""
+        if error is not None:
+            self.key_manager.release_lease(lease, self._error_outcome(error))
+        else:
+            self.key_manager.release_lease(lease, result[0], result[2])
+    
+    async def _read_stream_async(self, response, stream):
+        """Асинхронное чтение SSE ответа (см. _read_stream)"""
+        usage = None
+        async for raw_line in response.content:
+            delta, finished, chunk_usage = self._parse_sse_line(raw_line.decode("utf-8").strip())
+            usage = chunk_usage or usage
+            if delta and stream.feed(delta):
+                self.log(f"✂️ Поток остановлен досрочно: получено {len(stream.prompts)} промптов", "info")
+                break
+            if finished:
+                break
+        
+        stream.finish()
+        return stream.text, usage
     
     def test_single_key(self, api_key):
         """Тест одного ключа"""
+        model = "llama-3.3-70b-versatile"
         try:
-            response = requests.post(
+            response, _ = self.transport.post(
                 self.api_url,
                 headers={
                     "Authorization": f"Bearer {api_key}",
                     "Content-Type": "application/json"
                 },
                 json={
-                    "model": "llama-3.3-70b-versatile",
+                    "model": model,
                     "messages": [{"role": "user", "content": "Hi"}],
                     "max_tokens": 5
                 },
@@ -151,13 +841,14 @@ class GroqAPIClient:
             )
             
             if response.status_code == 200:
-                self.key_manager.update_key_limits(api_key, response.headers)
+                self.key_manager.update_key_limits(api_key, response.headers, model)
                 return "ok"
             elif response.status_code == 401:
                 self.key_manager.mark_key_invalid(api_key)
                 return "invalid"
             elif response.status_code == 429:
-                self.key_manager.update_key_limits(api_key, response.headers)
+                self.key_manager.update_key_limits(api_key, response.headers, model)
+                self.key_manager.limiter.on_rate_limited(api_key[-8:], model, response.headers)
                 return "limit"
             else:
                 return "error"
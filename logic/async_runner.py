@@ -0,0 +1,263 @@
+"""
+Асинхронный исполнитель этапов 2 и 3.
+
+Все запросы идут из одного потока с event loop: сотни запросов в полёте
+без отдельного потока ОС на каждый. Ключи и лимиты - те же аренды KeyManager,
+паузы между попытками - asyncio.sleep, остановка отменяет запросы в полёте.
+Пауза доходит и до повторов внутри запроса через CancelToken прогона.
+"""
+
+import asyncio
+import math
+import time
+
+from logic.cancellation import CancelToken
+from logic.generation_pool import OrderedProgress
+from logic.retry_queue import DeferredRetryQueue
+
+
+class AsyncPipelineRunner:
+    """Этапы 2 и 3 на asyncio (интерфейс как у GenerationPool)"""
+
+    def __init__(self, file_processor, verifier=None, logger=None, max_in_flight=100):
+        self.processor = file_processor
+        self.api_client = file_processor.api_client
+        self.verifier = verifier
+        self.logger = logger
+        self.max_in_flight = max(1, max_in_flight)
+
+        # Управление из потока GUI (применяется через call_soon_threadsafe)
+        self.loop = None
+        self.tasks = set()
+        self.resume_event = None
+        self.paused = False
+        self.stopped = False
+        self.cancel = CancelToken()
+
+        self.progress = None
+        self.workers_count = 0
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def pause(self):
+        """Пауза: новые файлы и попытки не начинаются, запросы в полёте доводятся"""
+        self.paused = True
+        self.cancel.pause()
+        self._call_in_loop(self._apply_pause)
+
+    def resume(self):
+        """Продолжение после паузы"""
+        self.paused = False
+        self.cancel.resume()
+        self._call_in_loop(self._apply_pause)
+
+    def stop(self):
+        """Остановка: запросы в полёте отменяются, аренды ключей освобождаются"""
+        self.stopped = True
+        self.cancel.cancel()
+        self._call_in_loop(self._cancel_all)
+
+    @property
+    def is_stopped(self):
+        return self.stopped
+
+    def _call_in_loop(self, callback):
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # Цикл уже завершился
+            pass
+
+    def _apply_pause(self):
+        if self.resume_event is None:
+            return
+        if self.paused and not self.stopped:
+            self.resume_event.clear()
+        else:
+            self.resume_event.set()
+
+    def _cancel_all(self):
+        for task in list(self.tasks):
+            task.cancel()
+        if self.resume_event is not None:
+            self.resume_event.set()
+
+    def run(self, files, job, progress_callback=None, delay=0):
+        """
+        Этап 2: обработать файлы.
+
+        job - аргументы FileProcessor.process_file (кроме file_path);
+        pack_size / pack_max_chars - сколько чанков собирать в один запрос;
+        journal - RunJournal: готовые по нему файлы пропускаются (статус journaled);
+        deferred_retries / deferred_retry_cooldown - отложенные повторы неудачных файлов.
+        progress_callback(index, file_path, success, status, elapsed) вызывается
+        строго в порядке файлов; отменённые при остановке файлы получают статус cancelled.
+        """
+        files = list(files)
+        if not files:
+            return []
+
+        job = dict(job)
+        self.progress = OrderedProgress(files, progress_callback)
+        items = list(enumerate(files))
+
+        # Файлы, готовые по журналу прогона, не обрабатываются заново
+        journal = job.pop('journal', None)
+        if journal:
+            items, done = journal.split(items)
+            for index in done:
+                self.progress.store(index, True, "journaled", 0.0)
+
+        packs = self.processor.plan_packs(items, job.pop('pack_size', 1), job.pop('pack_max_chars', 0))
+        queue = DeferredRetryQueue.for_job(packs, job, self.api_client.key_manager, self.logger)
+        job['cancel'] = self.cancel
+
+        async def handle(session, _, pack):
+            file_start = time.time()
+            try:
+                results = await self.processor.process_group_async(
+                    session, [file_path for _, file_path in pack], **job
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                names = ", ".join(file_path.name for _, file_path in pack)
+                self.log(f"❌ Исключение при обработке {names}: {str(e)}", "error")
+                results = [(False, "exception")] * len(pack)
+
+            elapsed = time.time() - file_start
+            for index, success, status in queue.complete(pack, results):
+                self.progress.store(index, success, status, elapsed)
+                if journal:
+                    journal.record(files[index], success, status)
+
+            if any(success for success, _ in results) and delay > 0:
+                await asyncio.sleep(delay)
+
+        def on_cancel(_, pack):
+            for index, _ in pack:
+                self.progress.store(index, False, "cancelled", 0.0)
+
+        self._execute(packs, handle, on_cancel, queue)
+        for index, success, status in queue.drain():
+            self.progress.store(index, success, status, 0.0)
+        queue.close()
+        return self.progress.ordered()
+
+    def verify(self, files, verification_prompt, model=None, temperature=None, progress_callback=None,
+               retry_budget=None):
+        """
+        Этап 3: проверить файлы с промптами.
+
+        progress_callback(done, total, filename) - как у VerificationProcessor.
+        """
+        files = list(files)
+        verifier = self.verifier
+        verifier.begin()
+
+        if not files:
+            self.log("⚠️ Нет файлов для проверки в папке prompts", "warning")
+            return verifier.stats
+
+        model, temperature = verifier.resolve_model(model, temperature)
+        self.log(f"🔍 Начало проверки {len(files)} файлов...", "info")
+
+        async def handle(session, index, file_path):
+            result = await verifier.verify_single_file_async(
+                session, file_path, verification_prompt, model, temperature, retry_budget, self.cancel
+            )
+            if result == 'cancelled':
+                return
+            verifier.record_result(result)
+            if progress_callback:
+                progress_callback(verifier.stats['total'], len(files), file_path.name)
+
+        self._execute(files, handle, lambda index, file_path: None)
+        verifier.finish()
+        return verifier.stats
+
+    def _execute(self, files, handle, on_cancel, queue=None):
+        """
+        Запустить event loop в текущем потоке и дождаться всех элементов (файлов или пакетов).
+
+        queue - DeferredRetryQueue: элементы берутся из неё (с отложенными повторами), а не из files.
+        """
+        self.workers_count = min(self.max_in_flight, len(files))
+        self.log(f"⚡ Асинхронный режим: до {self.workers_count} запросов одновременно", "info")
+
+        try:
+            asyncio.run(self._drive(files, handle, on_cancel, queue))
+        finally:
+            self.loop = None
+            self.resume_event = None
+            self.tasks = set()
+
+    async def _drive(self, files, handle, on_cancel, queue):
+        self.loop = asyncio.get_running_loop()
+        self.resume_event = asyncio.Event()
+        self._apply_pause()
+
+        # Один поток - один итератор, блокировка не нужна
+        pending = iter(enumerate(files))
+
+        # Очередь будит ожидающих по завершении пакета (новые повторы или всё сделано)
+        changed = asyncio.Event()
+        loop = self.loop
+        unregister = queue.on_change(lambda: loop.call_soon_threadsafe(changed.set)) if queue else None
+
+        async def next_item():
+            if queue is None:
+                return next(pending, None)
+            while not self.stopped:
+                # Сброс до poll(): set() из call_soon_threadsafe выполнится только после await
+                changed.clear()
+                pack, wait = queue.poll()
+                if pack is not None:
+                    return None, pack
+                if wait is None:
+                    return None
+                # Ждём ближайший повтор или завершения пакетов в работе
+                try:
+                    await asyncio.wait_for(changed.wait(), None if wait == math.inf else wait)
+                except asyncio.TimeoutError:
+                    pass
+            return None
+
+        async with self.api_client.create_async_session(limit=self.workers_count) as session:
+
+            async def worker():
+                while not self.stopped:
+                    await self.resume_event.wait()
+                    if self.stopped:
+                        break
+
+                    item = await next_item()
+                    if item is None:
+                        break
+
+                    index, file_path = item
+                    try:
+                        await handle(session, index, file_path)
+                    except asyncio.CancelledError:
+                        on_cancel(index, file_path)
+                        break
+
+            self.tasks = {asyncio.create_task(worker()) for _ in range(self.workers_count)}
+
+            # Остановка могла прийти до создания задач
+            if self.stopped:
+                self._cancel_all()
+
+            try:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            finally:
+                if unregister:
+                    unregister()
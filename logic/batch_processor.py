@@ -0,0 +1,355 @@
+"""
+Пакетный режим (Batch API) для больших корпусов, где задержка не важна.
+
+Порядок:
+    1. чанки → JSONL запросов chat/completions (custom_id = имя файла чанка)
+    2. загрузка JSONL (/openai/v1/files) и создание задания (/openai/v1/batches)
+    3. опрос задания до completed / failed / expired / cancelled
+    4. выгрузка результатов → FileProcessor.parse_prompts / save_prompts
+
+Каждый шаг записывается в logs/batches/<задание>.json, поэтому после
+перезапуска с теми же настройками работа продолжается с того же шага:
+уже загруженный файл не загружается снова, созданное задание не создаётся
+повторно, а только опрашивается.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from logic.generation_pool import OrderedProgress
+from utils.atomic_store import atomic_write_json
+
+
+# Итоговые статусы задания Batch API
+FINISHED = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchProcessor:
+    """Этап 2 через Batch API: тот же интерфейс, что у GenerationPool (run / pause / resume / stop)"""
+
+    def __init__(self, file_processor, logger=None, state_folder="logs/batches", poll_interval=30.0,
+                 max_requests=50000, completion_window="24h"):
+        self.processor = file_processor
+        self.api_client = file_processor.api_client
+        self.key_manager = self.api_client.key_manager
+        self.logger = logger
+        self.state_folder = state_folder
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests        # строк в одном JSONL (лимит Batch API)
+        self.completion_window = completion_window
+
+        self.stop_event = threading.Event()
+        self.progress = None
+        self.workers_count = 1
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def pause(self):
+        """Задание выполняется на сервере - пауза не нужна"""
+
+    def resume(self):
+        pass
+
+    def stop(self):
+        """Прекратить опрос (задание продолжит выполняться и подхватится при следующем запуске)"""
+        self.stop_event.set()
+
+    @property
+    def is_stopped(self):
+        return self.stop_event.is_set()
+
+    # ---------- состояние ----------
+
+    @staticmethod
+    def job_key(files, job):
+        """Ключ задания: папка чанков и всё, что влияет на ответ"""
+        folder = str(Path(files[0]).parent.resolve()) if files else ""
+        material = json.dumps([
+            folder, str(job.get('output_folder')), job.get('system_prompt'), job.get('model'),
+            float(job.get('temperature', 0)), job.get('prompts_count')
+        ], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
+    def _state_path(self, key):
+        return os.path.join(self.state_folder, f"{key}.json")
+
+    def _load_state(self, key):
+        path = self._state_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.log(f"⚠️ Повреждено состояние batch задания {path}: {e}", "warning")
+            return None
+
+    def _save_state(self, state):
+        atomic_write_json(self._state_path(state['key']), state, indent=2, ensure_ascii=False)
+
+    def _finish_state(self, state):
+        """Все части выгружены: состояние и JSONL больше не нужны"""
+        for part in state['parts']:
+            if os.path.exists(part['jsonl']):
+                os.remove(part['jsonl'])
+        os.remove(self._state_path(state['key']))
+
+    # ---------- запуск ----------
+
+    def run(self, files, job, progress_callback=None, delay=0):
+        """
+        Обработать файлы через Batch API.
+
+        job - как у GenerationPool (используются output_folder, system_prompt,
+        model, temperature, prompts_count). progress_callback вызывается по
+        порядку файлов по мере выгрузки результатов.
+        """
+        files = list(files)
+        if not files:
+            return []
+
+        self.progress = OrderedProgress(files, progress_callback)
+        index_by_name = {file_path.name: index for index, file_path in enumerate(files)}
+
+        key = self.job_key(files, job)
+        state = self._load_state(key)
+        if state:
+            done = sum(1 for part in state['parts'] if part['applied'])
+            self.log(f"♻️ Продолжение batch задания {key}: выгружено частей {done}/{len(state['parts'])}", "info")
+        else:
+            state = self._new_state(key, files, job)
+            if state is None:
+                return self._finish_run(files)
+
+        api_key = self._find_key(state['key_id'])
+        if api_key is None:
+            self.log(f"❌ Ключ ...{state['key_id']} batch задания не найден в файле ключей", "error")
+            return self._finish_run(files)
+
+        self._run_parts(state, api_key, job['output_folder'], index_by_name)
+        return self._finish_run(files)
+
+    def _finish_run(self, files):
+        """Файлы без результата (остановка, сбой задания) - итог pending"""
+        for index in range(len(files)):
+            self.progress.store(index, False, "batch_pending", 0.0)
+        return self.progress.ordered()
+
+    def _new_state(self, key, files, job):
+        """Разбить чанки на JSONL части и записать начальное состояние"""
+        api_key = self.key_manager.get_next_key()
+        if not api_key:
+            self.log("❌ Нет доступных API ключей!", "error")
+            return None
+
+        os.makedirs(self.state_folder, exist_ok=True)
+        system_prompt = job['system_prompt'].replace("{n}", str(job['prompts_count']))
+        parts = []
+        for start in range(0, len(files), self.max_requests):
+            jsonl = os.path.join(self.state_folder, f"{key}_part{len(parts) + 1}.jsonl")
+            names = self.build_jsonl(files[start:start + self.max_requests], jsonl, system_prompt,
+                                     job['model'], job['temperature'])
+            if names:
+                parts.append({
+                    "jsonl": jsonl, "files": names, "input_file_id": None, "batch_id": None,
+                    "status": "new", "output_file_id": None, "error_file_id": None, "applied": False
+                })
+
+        state = {"key": key, "key_id": api_key[-8:], "model": job['model'], "created_at": time.time(), "parts": parts}
+        self._save_state(state)
+        self.log(f"📦 Batch задание {key}: {sum(len(p['files']) for p in parts)} запросов, частей {len(parts)}", "info")
+        return state
+
+    def build_jsonl(self, files, path, system_prompt, model, temperature):
+        """Записать JSONL запросов для файлов; вернуть имена попавших в него файлов"""
+        names = []
+        with open(path, 'w', encoding='utf-8') as f:
+            for file_path in files:
+                chunk_text = self.processor.read_chunk(file_path)
+                if not chunk_text:
+                    continue
+                _, body = self.api_client._build_request("", chunk_text, system_prompt, model, temperature)
+                f.write(json.dumps({
+                    "custom_id": file_path.name,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body
+                }, ensure_ascii=False) + "\n")
+                names.append(file_path.name)
+        return names
+
+    def _find_key(self, key_id):
+        for api_key in self.key_manager.api_keys:
+            if api_key[-8:] == key_id:
+                return api_key
+        return None
+
+    def _run_parts(self, state, api_key, output_folder, index_by_name):
+        """Довести все части до выгрузки: загрузка → задание → опрос → результаты"""
+        while not self.stop_event.is_set():
+            pending = [part for part in state['parts'] if not part['applied']]
+            if not pending:
+                self._finish_state(state)
+                self.log("🎉 Batch задание выполнено", "success")
+                return
+
+            for part in pending:
+                if self.stop_event.is_set():
+                    return
+                self._advance(state, part, api_key, output_folder, index_by_name)
+
+            if any(not part['applied'] for part in state['parts']):
+                self.stop_event.wait(self.poll_interval)
+
+        self.log("⏹️ Опрос batch задания остановлен - оно продолжится при следующем запуске", "warning")
+
+    def _advance(self, state, part, api_key, output_folder, index_by_name):
+        """Один шаг части задания (ошибка сети - повтор на следующем опросе)"""
+        if part['input_file_id'] is None:
+            uploaded = self._upload(api_key, part['jsonl'])
+            if uploaded is None:
+                return
+            part['input_file_id'] = uploaded['id']
+            self._save_state(state)
+
+        if part['batch_id'] is None:
+            batch = self._call(api_key, 'POST', "/openai/v1/batches", json={
+                "input_file_id": part['input_file_id'],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": self.completion_window
+            })
+            if batch is None:
+                return
+            part['batch_id'] = batch['id']
+            part['status'] = batch.get('status', 'validating')
+            self._save_state(state)
+            self.log(f"📤 Batch {batch['id']} создано ({len(part['files'])} запросов)", "info")
+            return
+
+        batch = self._call(api_key, 'GET', f"/openai/v1/batches/{part['batch_id']}")
+        if batch is None:
+            return
+        if batch.get('status') != part['status']:
+            counts = batch.get('request_counts') or {}
+            self.log(
+                f"⏳ Batch {part['batch_id']}: {batch.get('status')} "
+                f"({counts.get('completed', 0)}/{counts.get('total', 0)})", "info"
+            )
+        part['status'] = batch.get('status')
+        part['output_file_id'] = batch.get('output_file_id')
+        part['error_file_id'] = batch.get('error_file_id')
+        self._save_state(state)
+
+        if part['status'] in FINISHED and self._apply_part(part, api_key, output_folder, index_by_name):
+            part['applied'] = True
+            self._save_state(state)
+
+    def _apply_part(self, part, api_key, output_folder, index_by_name):
+        """Выгрузить результаты части и сохранить промпты (False - повторить на следующем опросе)"""
+        results = {}
+        if part['output_file_id']:
+            content = self._download(api_key, part['output_file_id'])
+            if content is None:
+                return False
+            for number, line in enumerate(content.splitlines(), 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    results[record['custom_id']] = record
+                except (ValueError, KeyError, TypeError) as e:
+                    # Файл этой строки останется без результата и получит batch_error
+                    self.log(f"⚠️ Batch {part['batch_id']}: повреждённая строка результатов {number}: {e!r}", "warning")
+
+        saved = 0
+        for name in part['files']:
+            success, status = self._save_result(results.get(name), name, output_folder, api_key)
+            saved += success
+            index = index_by_name.get(name)
+            if index is not None:
+                self.progress.store(index, success, status, 0.0)
+
+        if part['status'] != "completed":
+            self.log(f"❌ Batch {part['batch_id']} завершилось со статусом {part['status']}", "error")
+        self.log(f"✅ Batch {part['batch_id']}: сохранено {saved}/{len(part['files'])} файлов", "success")
+        return True
+
+    def _save_result(self, record, name, output_folder, api_key):
+        """Одна строка результатов → файл промптов (успех, статус)"""
+        try:
+            response = record['response']
+            if response['status_code'] != 200:
+                raise ValueError(f"status_code {response['status_code']}")
+            content = response['body']['choices'][0]['message']['content']
+            if not isinstance(content, str):
+                raise TypeError(f"content {type(content).__name__}")
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self.log(f"❌ Batch: нет ответа для {name} ({e!r})", "error")
+            self.key_manager.add_error(api_key)
+            return False, "batch_error"
+
+        prompts = self.processor.parse_prompts(content)
+        if not prompts:
+            self.log(f"⚠️ Не удалось распарсить промпты из {name}", "warning")
+            self.key_manager.add_error(api_key)
+            return False, "parse_error"
+
+        if not self.processor.save_prompts(prompts, Path(output_folder) / name):
+            self.key_manager.add_error(api_key)
+            return False, "save_error"
+
+        self.key_manager.add_file_processed(api_key)
+        self.key_manager.add_prompts_generated(api_key, len(prompts))
+        return True, "success"
+
+    # ---------- HTTP ----------
+
+    def _url(self, path):
+        return f"{self.api_client.api_base}{path}"
+
+    def _call(self, api_key, method, path, **kwargs):
+        """JSON запрос к Batch API (None - ошибка, уже записана в лог)"""
+        try:
+            response, _ = self.api_client.transport.request(
+                method, self._url(path), headers={"Authorization": f"Bearer {api_key}"}, timeout=(10, 60), **kwargs
+            )
+        except Exception as e:
+            self.log(f"⚠️ Batch API недоступен: {str(e)}", "warning")
+            return None
+
+        if response.status_code != 200:
+            self.log(f"❌ Batch API {path}: ошибка {response.status_code}: {response.text[:100]}", "error")
+            return None
+        return response.json()
+
+    def _upload(self, api_key, jsonl_path):
+        with open(jsonl_path, 'rb') as f:
+            return self._call(
+                api_key, 'POST', "/openai/v1/files",
+                data={"purpose": "batch"},
+                files={"file": (os.path.basename(jsonl_path), f, "application/jsonl")}
+            )
+
+    def _download(self, api_key, file_id):
+        try:
+            response, _ = self.api_client.transport.get(
+                self._url(f"/openai/v1/files/{file_id}/content"),
+                headers={"Authorization": f"Bearer {api_key}"}, timeout=(10, 300)
+            )
+        except Exception as e:
+            self.log(f"⚠️ Batch API недоступен: {str(e)}", "warning")
+            return None
+        if response.status_code != 200:
+            self.log(f"❌ Выгрузка {file_id}: ошибка {response.status_code}", "error")
+            return None
+        response.encoding = "utf-8"
+        return response.text
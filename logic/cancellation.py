@@ -0,0 +1,111 @@
+"""
+Токен отмены и паузы для запросов конвейера.
+
+Один токен на прогон передаётся от исполнителя (GenerationPool / AsyncPipelineRunner)
+до HTTP транспорта:
+    - cancel() будит все ожидания (паузы между попытками, ожидание квоты и
+      слота) и обрывает сокеты запросов в полёте через подписки on_cancel();
+    - pause() останавливает отправку новых попыток, запросы в полёте
+      доводятся и их ответы сохраняются.
+Ожидания - на threading.Event, без опроса флагов в цикле.
+"""
+
+import itertools
+import threading
+
+
+class CancelToken:
+    """Отмена и пауза прогона (потокобезопасно)"""
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.lock = threading.Lock()
+        self.callbacks = {}
+        self.resume_callbacks = {}
+        self.seq = itertools.count()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self.resume_event.is_set()
+
+    def cancel(self):
+        """Отменить прогон: разбудить ожидания и вызвать подписчиков (один раз)"""
+        with self.lock:
+            if self.cancel_event.is_set():
+                return
+            self.cancel_event.set()
+            self.resume_event.set()
+            callbacks = list(self.callbacks.values()) + list(self.resume_callbacks.values())
+            self.callbacks.clear()
+            self.resume_callbacks.clear()
+        self._fire(callbacks)
+
+    @staticmethod
+    def _fire(callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def pause(self):
+        """Не начинать новых попыток до resume()"""
+        if not self.cancelled:
+            self.resume_event.clear()
+
+    def resume(self):
+        with self.lock:
+            self.resume_event.set()
+            callbacks = list(self.resume_callbacks.values())
+            self.resume_callbacks.clear()
+        self._fire(callbacks)
+
+    def sleep(self, seconds):
+        """Пауза seconds секунд, прерываемая отменой (False - отменено)"""
+        return not self.cancel_event.wait(seconds)
+
+    def wait_resumed(self):
+        """Дождаться снятия паузы (False - прогон отменён)"""
+        self.resume_event.wait()
+        return not self.cancelled
+
+    def child(self):
+        """
+        Дочерний токен: отменяется вместе с этим или отдельно (проигравший участник хеджа).
+
+        Возвращает (токен, отписка от родителя) - отписку вызвать, когда токен больше не нужен.
+        """
+        child = CancelToken()
+        return child, self.on_cancel(child.cancel)
+
+    def on_cancel(self, callback):
+        """
+        Вызвать callback при отмене (сразу, если уже отменено).
+
+        Возвращает функцию отписки - её нужно вызвать, когда защищаемая
+        операция завершилась.
+        """
+        return self._subscribe(self.callbacks, self.cancel_event, callback)
+
+    def on_resume(self, callback):
+        """Вызвать callback при снятии паузы или отмене (сразу, если паузы нет); возвращает отписку"""
+        return self._subscribe(self.resume_callbacks, self.resume_event, callback)
+
+    def _subscribe(self, callbacks, event, callback):
+        with self.lock:
+            if not event.is_set():
+                token = next(self.seq)
+                callbacks[token] = callback
+
+                def unregister():
+                    with self.lock:
+                        callbacks.pop(token, None)
+                return unregister
+        callback()
+        return lambda: None
@@ -0,0 +1,240 @@
+"""
+Автоматические выключатели (circuit breaker) для ключей и моделей.
+
+Состояния:
+    closed    - запросы идут, итоги копятся в скользящем окне
+    open      - доля ошибок или медленных ответов в окне превысила порог:
+                ключ/модель пропускаются сразу, без таймаутов и пауз
+    half_open - время open истекло: идёт одна дешёвая пробная заявка,
+                успех закрывает выключатель, ошибка открывает его на вдвое больший срок;
+                проба без вердикта (429, отмена) или без ответа дольше probe_timeout -
+                снова open на прежний срок
+"""
+
+import threading
+import time
+from collections import deque
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Итоги аренды, считающиеся отказом ключа / модели
+KEY_FAILURES = {"timeout", "server_error", "error"}
+MODEL_FAILURES = {"timeout", "server_error"}
+
+# Итоги, которые ничего не говорят о здоровье (квота, неверный ключ, ошибка запроса, отмена)
+NEUTRAL_OUTCOMES = {"rate_limited", "invalid", "client_error", "cancelled"}
+
+
+class CircuitBreaker:
+    """Выключатель одного ключа или модели"""
+
+    def __init__(self, window_seconds=60.0, min_calls=5, failure_rate=0.5, slow_call_seconds=20.0,
+                 slow_rate=0.8, open_seconds=30.0, max_open_seconds=600.0, probe_timeout=180.0):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+
+        self.state = CLOSED
+        self.calls = deque()     # (время, отказ, медленный)
+        self.failures = 0
+        self.slow = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probe_started_at = None
+
+    def _trim(self, now):
+        while self.calls and self.calls[0][0] < now - self.window_seconds:
+            _, failed, slow = self.calls.popleft()
+            self.failures -= failed
+            self.slow -= slow
+
+    def _open(self, now):
+        self.trips += 1
+        period = min(self.max_open_seconds, self.open_seconds * (2 ** (self.trips - 1)))
+        self.state = OPEN
+        self.open_until = now + period
+        self.probe_started_at = None
+        self.calls.clear()
+        self.failures = 0
+        self.slow = 0
+
+    def _close(self):
+        self.state = CLOSED
+        self.trips = 0
+        self.probe_started_at = None
+
+    def record(self, failed, latency=None, started_at=None, now=None):
+        """Учесть итог запроса; вернуть новое состояние, если оно изменилось"""
+        now = now or time.time()
+
+        if self.state == OPEN:
+            # Запоздавшие ответы, отправленные до размыкания
+            return None
+
+        if self.state == HALF_OPEN:
+            if not self._is_probe(started_at):
+                return None
+            if failed:
+                self._open(now)
+            else:
+                self._close()
+            return self.state
+
+        slow = bool(latency is not None and latency >= self.slow_call_seconds)
+        self.calls.append((now, int(failed), int(slow)))
+        self.failures += int(failed)
+        self.slow += int(slow)
+        self._trim(now)
+
+        count = len(self.calls)
+        if count >= self.min_calls and (
+            self.failures / count >= self.failure_rate or self.slow / count >= self.slow_rate
+        ):
+            self._open(now)
+            return self.state
+        return None
+
+    def _is_probe(self, started_at):
+        """Итог пробной заявки (а не запроса, отправленного до неё)"""
+        return started_at is not None and self.probe_started_at is not None and started_at >= self.probe_started_at
+
+    def record_neutral(self, started_at=None, now=None):
+        """Итог без вердикта о здоровье: пробу с таким итогом считать неотправленной"""
+        if self.state == HALF_OPEN and self._is_probe(started_at):
+            self.abort_probe(now)
+
+    def try_probe(self, now=None):
+        """
+        Можно ли пускать запрос.
+
+        Возвращает (ожидание в секундах, начата ли пробная заявка).
+        """
+        now = now or time.time()
+        if self.state == CLOSED:
+            return 0.0, False
+        if self.state == OPEN:
+            if now < self.open_until:
+                return self.open_until - now, False
+            self.state = HALF_OPEN
+            self.probe_started_at = now
+            return 0.0, True
+        # HALF_OPEN: пробная заявка уже в полёте (потерянная проба не держит выключатель вечно)
+        if now - self.probe_started_at >= self.probe_timeout:
+            self.abort_probe(now)
+            return self.open_until - now, False
+        return None, False
+
+    def abort_probe(self, now=None):
+        """Пробу не удалось отправить - снова ждать тот же срок"""
+        if self.state == HALF_OPEN:
+            self.trips = max(0, self.trips - 1)
+            self._open(now or time.time())
+
+
+class CircuitBreakers:
+    """Выключатели всех ключей и моделей"""
+
+    # Сколько ждать результата пробной заявки, прежде чем снова проверять
+    PROBE_WAIT = 10.0
+
+    def __init__(self, settings=None, logger=None):
+        self.settings = dict(settings or {})
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.models = {}
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def _get(self, table, name):
+        breaker = table.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(**self.settings)
+            table[name] = breaker
+        return breaker
+
+    def record(self, key_id, model, outcome, latency=None, started_at=None):
+        """
+        Учесть итог аренды в выключателях ключа и модели.
+
+        Возвращает (состояние ключа, состояние модели) - новые, если изменились.
+        """
+        if outcome in NEUTRAL_OUTCOMES:
+            with self.lock:
+                if key_id in self.keys:
+                    self.keys[key_id].record_neutral(started_at)
+                if model in self.models:
+                    self.models[model].record_neutral(started_at)
+            return None, None
+
+        with self.lock:
+            key_state = self._get(self.keys, key_id).record(
+                outcome in KEY_FAILURES, latency, started_at
+            )
+            model_state = None
+            if model:
+                model_state = self._get(self.models, model).record(
+                    outcome in MODEL_FAILURES, latency, started_at
+                )
+
+        if key_state == OPEN:
+            self.log(f"🔌 Ключ ...{key_id} отключён: много ошибок или медленных ответов", "warning")
+        elif key_state == CLOSED:
+            self.log(f"🔌 Ключ ...{key_id} снова в работе", "success")
+        if model_state == OPEN:
+            self.log(f"🔌 Модель {model} временно отключена: много ошибок", "warning")
+        elif model_state == CLOSED:
+            self.log(f"🔌 Модель {model} снова в работе", "success")
+
+        return key_state, model_state
+
+    def _gate(self, table, name, queue_probe):
+        with self.lock:
+            breaker = table.get(name)
+            if breaker is None:
+                return 0.0, False
+            wait, probe = breaker.try_probe()
+            if wait is None:
+                return self.PROBE_WAIT, False
+            if probe and queue_probe:
+                # Пробу отправит отдельный поток, обычные запросы ждут её итога
+                return self.PROBE_WAIT, True
+            return wait, probe
+
+    def key_gate(self, key_id, queue_probe=False):
+        """(ожидание, нужна ли пробная заявка) для ключа"""
+        return self._gate(self.keys, key_id, queue_probe)
+
+    def model_gate(self, model, queue_probe=False):
+        """(ожидание, нужна ли пробная заявка) для модели"""
+        return self._gate(self.models, model, queue_probe)
+
+    def abort_probe(self, key_id=None, model=None):
+        with self.lock:
+            if key_id in self.keys:
+                self.keys[key_id].abort_probe()
+            if model in self.models:
+                self.models[model].abort_probe()
+
+    def key_state(self, key_id):
+        with self.lock:
+            breaker = self.keys.get(key_id)
+            return breaker.state if breaker else CLOSED
+
+    def key_open_until(self, key_id):
+        with self.lock:
+            breaker = self.keys.get(key_id)
+            return breaker.open_until if breaker and breaker.state == OPEN else 0.0
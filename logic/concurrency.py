@@ -0,0 +1,193 @@
+"""
+Адаптивный предел запросов в полёте (AIMD), отдельно для каждой модели.
+
+Как окно перегрузки TCP:
+    - успех с нормальной задержкой - предел растёт аддитивно:
+      +increase за каждое «окно» успешных ответов (+increase/предел на ответ);
+    - 429 или всплеск задержки (быстрая средняя выше базовой в latency_factor
+      раз, одиночный медленный ответ всплеском не считается) - предел
+      умножается на decrease (по умолчанию делится пополам);
+    - ошибки сервера и таймауты - предел не растёт.
+Одна перегрузка режется один раз: сигналы от запросов, начатых до
+последнего снижения, не снижают предел повторно.
+"""
+
+import itertools
+import threading
+import time
+
+
+# Итоги, по которым предел снижается (нехватка квоты); растёт он только от успехов
+CONGESTION_OUTCOMES = {"rate_limited"}
+
+
+class AimdWindow:
+    """Предел запросов в полёте одной модели"""
+
+    def __init__(self, initial, min_limit, max_limit):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.baseline = None        # медленная EWMA задержки (норма), сек
+        self.recent = None          # быстрая EWMA задержки (текущее состояние), сек
+        self.samples = 0
+        self.decreased_at = 0.0
+
+    @property
+    def target(self):
+        return max(self.min_limit, int(self.limit))
+
+
+class ConcurrencyController:
+    """Слоты запросов в полёте по моделям с AIMD-подстройкой предела"""
+
+    def __init__(self, enabled=True, initial=4, min_limit=1, max_limit=64, increase=1.0, decrease=0.5,
+                 latency_factor=2.0, baseline_alpha=0.05, recent_alpha=0.3, min_samples=10, logger=None):
+        self.enabled = enabled
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.baseline_alpha = baseline_alpha
+        self.recent_alpha = recent_alpha
+        self.min_samples = min_samples
+        self.logger = logger
+
+        self.condition = threading.Condition()
+        self.windows = {}
+        self.listeners = {}
+        self.seq = itertools.count()
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def _get(self, model):
+        """Окно модели (вызывать под condition)"""
+        window = self.windows.get(model)
+        if window is None:
+            window = AimdWindow(self.initial, self.min_limit, self.max_limit)
+            self.windows[model] = window
+        return window
+
+    def try_acquire(self, model):
+        """Занять слот модели без ожидания (False - предел достигнут)"""
+        if not self.enabled:
+            return True
+        with self.condition:
+            window = self._get(model)
+            if window.in_flight >= window.target:
+                return False
+            window.in_flight += 1
+            return True
+
+    def acquire(self, model, timeout=None, cancel=None):
+        """Занять слот модели, дождавшись освобождения (False - не дождались за timeout или отмена)"""
+        if not self.enabled:
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        unregister = cancel.on_cancel(self._wake) if cancel is not None else None
+        try:
+            with self.condition:
+                window = self._get(model)
+                while window.in_flight >= window.target:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if (remaining is not None and remaining <= 0) or (cancel is not None and cancel.cancelled):
+                        return False
+                    self.condition.wait(remaining)
+                window.in_flight += 1
+                return True
+        finally:
+            if unregister:
+                unregister()
+
+    def _wake(self):
+        """Разбудить ожидающих слот (отмена прогона)"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def _notify(self):
+        """Слот освободился или предел изменился (вызывать под condition)"""
+        self.condition.notify_all()
+        for callback in list(self.listeners.values()):
+            callback()
+
+    def on_release(self, callback):
+        """
+        Вызывать callback при каждом освобождении слота (ожидание слота в event loop).
+
+        Возвращает функцию отписки.
+        """
+        with self.condition:
+            token = next(self.seq)
+            self.listeners[token] = callback
+
+        def unregister():
+            with self.condition:
+                self.listeners.pop(token, None)
+        return unregister
+
+    def cancel(self, model):
+        """Вернуть слот, так и не использованный для запроса"""
+        if not self.enabled:
+            return
+        with self.condition:
+            window = self._get(model)
+            window.in_flight = max(0, window.in_flight - 1)
+            self._notify()
+
+    def release(self, model, outcome, latency, started_at):
+        """Вернуть слот с итогом запроса и подстроить предел модели"""
+        if not self.enabled:
+            return
+        with self.condition:
+            window = self._get(model)
+            window.in_flight = max(0, window.in_flight - 1)
+            before = window.target
+
+            if outcome == "success":
+                self._record_latency(window, latency)
+
+            if outcome in CONGESTION_OUTCOMES or (outcome == "success" and self._is_spike(window)):
+                # Запросы, начатые до прошлого снижения, видели старый предел
+                if started_at > window.decreased_at:
+                    window.limit = max(self.min_limit, window.limit * self.decrease)
+                    window.decreased_at = time.time()
+            elif outcome == "success":
+                window.limit = min(self.max_limit, window.limit + self.increase / max(1.0, window.limit))
+
+            after = window.target
+            self._notify()
+
+        if after < before:
+            reason = "429" if outcome in CONGESTION_OUTCOMES else f"задержка {latency:.1f} с"
+            self.log(f"📉 {model}: предел запросов {before} → {after} ({reason})", "warning")
+
+    def _is_spike(self, window):
+        return window.samples >= self.min_samples and window.recent > window.baseline * self.latency_factor
+
+    def _record_latency(self, window, latency):
+        if window.baseline is None:
+            window.baseline = window.recent = latency
+        else:
+            window.baseline += self.baseline_alpha * (latency - window.baseline)
+            window.recent += self.recent_alpha * (latency - window.recent)
+        window.samples += 1
+
+    def target(self, model):
+        """Текущий предел запросов в полёте для модели (None - контроллер выключен)"""
+        if not self.enabled:
+            return None
+        with self.condition:
+            return self._get(model).target
+
+    def get_stats(self):
+        """{model: (предел, в полёте)} по всем моделям с окнами"""
+        with self.condition:
+            return {model: (window.target, window.in_flight) for model, window in self.windows.items()}
@@ -1,7 +1,69 @@
 import os
+import re
 from pathlib import Path
 from datetime import datetime
 
+
+# Разделитель чанков в пакетном запросе: "### ЧАНК 3"
+PACK_MARKER = "### ЧАНК"
+PACK_MARKER_RE = re.compile(r'^\s*#*\s*ЧАНК\s*(\d+)\s*#*\s*$', re.IGNORECASE | re.MULTILINE)
+
+PACK_INSTRUCTION = (
+    "\n\nВ сообщении несколько фрагментов текста, каждый начинается со строки «{marker} k». "
+    "Выполните задание для КАЖДОГО фрагмента отдельно: {n} промптов на фрагмент. "
+    "Перед промптами фрагмента выведите строку «{marker} k» с номером этого фрагмента."
+)
+
+class PromptStreamParser:
+    """Инкрементальный разбор промптов из потока ответа: промпт готов, как только пришёл конец его строки"""
+    
+    def __init__(self, limit=None, on_prompt=None):
+        self.limit = limit
+        self.on_prompt = on_prompt
+        self.reset()
+    
+    def reset(self):
+        """Начать заново (новая попытка запроса)"""
+        self.buffer = ""
+        self.parts = []
+        self.prompts = []
+    
+    @property
+    def done(self):
+        """Набрано нужное число промптов"""
+        return bool(self.limit) and len(self.prompts) >= self.limit
+    
+    @property
+    def text(self):
+        """Весь полученный текст ответа"""
+        return "".join(self.parts)
+    
+    def feed(self, delta):
+        """Добавить кусок ответа; True - дальше читать не нужно"""
+        self.parts.append(delta)
+        self.buffer += delta
+        
+        while '\n' in self.buffer and not self.done:
+            line, self.buffer = self.buffer.split('\n', 1)
+            self._add_line(line)
+        
+        return self.done
+    
+    def finish(self):
+        """Конец потока: последняя строка без перевода строки"""
+        if self.buffer and not self.done:
+            self._add_line(self.buffer)
+        self.buffer = ""
+        return self.prompts
+    
+    def _add_line(self, line):
+        prompt = FileProcessor.parse_prompt_line(line)
+        if prompt:
+            self.prompts.append(prompt)
+            if self.on_prompt:
+                self.on_prompt(prompt)
+
+
 class FileProcessor:
     """Обработка файлов с чанками и промптами"""
     
@@ -31,23 +93,32 @@ class FileProcessor:
         prompts = []
         
         for line in response_text.split('\n'):
-            line = line.strip()
-            
-            # Фильтр: минимум 20 символов
-            if len(line) > 20:
-                # Удаляем нумерацию в начале (1., 2), №1, etc)
-                if line[0].isdigit():
-                    # Ищем точку или скобку после цифры
-                    for i, char in enumerate(line):
-                        if char in '.):':
-                            line = line[i+1:].strip()
-                            break
-                
-                if line:
-                    prompts.append(line)
+            prompt = self.parse_prompt_line(line)
+            if prompt:
+                prompts.append(prompt)
         
         return prompts
     
+    @staticmethod
+    def parse_prompt_line(line):
+        """Промпт из одной строки ответа (None - строка не промпт)"""
+        line = line.strip()
+        
+        # Фильтр: минимум 20 символов
+        if len(line) > 20:
+            # Удаляем нумерацию в начале (1., 2), №1, etc)
+            if line[0].isdigit():
+                # Ищем точку или скобку после цифры
+                for i, char in enumerate(line):
+                    if char in '.):':
+                        line = line[i+1:].strip()
+                        break
+            
+            if line:
+                return line
+        
+        return None
+    
     def save_prompts(self, prompts, output_path):
         """Сохранение промптов в файл"""
         try:
@@ -73,92 +144,374 @@ class FileProcessor:
         except:
             return False
 
-    def process_file(self, file_path, output_folder, system_prompt, model, temperature, prompts_count, save_raw=False):
-        """Обработка одного файла с чанком"""
+    def process_file(self, file_path, output_folder, system_prompt, model, temperature, prompts_count, save_raw=False,
+                     stream=False, on_prompt=None, retry_budget=None, router=None, cancel=None,
+                     max_retries=None, chunk_text=None):
+        """
+        Обработка одного файла с чанком.
         
-        # Чтение чанка
-        chunk_text = self.read_chunk(file_path)
-        if not chunk_text:
+        stream - читать ответ потоком и остановить генерацию, как только
+        набрано prompts_count промптов; on_prompt(prompt) вызывается на каждый
+        готовый промпт сразу по приходу его строки.
+        retry_budget - общий бюджет повторов задания (RetryBudget).
+        router - ModelRouter: модель берётся из его цепочки (вместо model),
+        а при нехватке квоты файл уходит на следующую модель.
+        cancel - CancelToken прогона (пауза и отмена запроса в полёте).
+        max_retries - попыток внутри запроса (None - из настроек клиента).
+        chunk_text - текст чанка уже в памяти (потоковый конвейер): файл не перечитывается.
+        """
+        
+        request = self._prepare_request(file_path, system_prompt, prompts_count, chunk_text)
+        if request is None:
             return False, "read_error"
         
-        # Подстановка {n} в system prompt
-        system_prompt_formatted = system_prompt.replace("{n}", str(prompts_count))
+        parser = PromptStreamParser(prompts_count, on_prompt) if stream else None
+        
+        # Отправка запроса к API (с переходом по цепочке моделей)
+        result = None
+        for model in self._route(router, request, model, file_path):
+            result = self.api_client.send_request(
+                model=model,
+                temperature=temperature,
+                stream=parser,
+                retry_budget=retry_budget,
+                cache_tag=prompts_count,
+                cancel=cancel,
+                max_retries=max_retries,
+                **request
+            )
+            if not self._should_fallback(router, result, model, file_path):
+                break
+        
+        if result is None:
+            return False, "no_models"
+        return self._finish_file(file_path, output_folder, result, save_raw, parser, router, model)
+    
+    async def process_file_async(self, session, file_path, output_folder, system_prompt, model, temperature,
+                                 prompts_count, save_raw=False, stream=False, on_prompt=None, retry_budget=None,
+                                 router=None, cancel=None, max_retries=None):
+        """Асинхронная обработка одного файла (запрос через aiohttp сессию)"""
+        
+        request = self._prepare_request(file_path, system_prompt, prompts_count)
+        if request is None:
+            return False, "read_error"
+        
+        parser = PromptStreamParser(prompts_count, on_prompt) if stream else None
+        
+        result = None
+        for model in self._route(router, request, model, file_path):
+            result = await self.api_client.send_request_async(
+                session,
+                model=model,
+                temperature=temperature,
+                stream=parser,
+                retry_budget=retry_budget,
+                cache_tag=prompts_count,
+                cancel=cancel,
+                max_retries=max_retries,
+                **request
+            )
+            if not self._should_fallback(router, result, model, file_path):
+                break
+        
+        if result is None:
+            return False, "no_models"
+        return self._finish_file(file_path, output_folder, result, save_raw, parser, router, model)
+    
+    def _prepare_request(self, file_path, system_prompt, prompts_count, chunk_text=None):
+        """Текст чанка и system prompt с подставленным {n} (None - чанк не прочитан)"""
+        
+        # Чтение чанка (если текст не передан из памяти)
+        chunk_text = self.read_chunk(file_path) if chunk_text is None else chunk_text.strip()
+        if not chunk_text:
+            return None
         
-        # Отправка запроса к API
         self.log(f"🔄 Обработка: {file_path.name}", "info")
-        response, status = self.api_client.send_request(
-            user_message=chunk_text,
-            system_prompt=system_prompt_formatted,
-            model=model,
-            temperature=temperature
-        )
+        
+        # Подстановка {n} в system prompt
+        return {
+            "user_message": chunk_text,
+            "system_prompt": system_prompt.replace("{n}", str(prompts_count))
+        }
+    
+    def _route(self, router, request, model, file_path):
+        """Модели для запроса по порядку: цепочка маршрутизатора или одна модель из настроек"""
+        if router is None:
+            return [model]
+        
+        models = router.candidates(request["user_message"])
+        if not models:
+            self.log(f"⚠️ Ни одна модель цепочки не подходит для {file_path.name}", "warning")
+        return models
+    
+    def _should_fallback(self, router, result, model, file_path):
+        """Учесть запрос в квоте модели; True - пробовать следующую модель цепочки"""
+        if router is None:
+            return False
+        
+        if not result.cached:
+            router.note_request(model)
+        if router.should_fallback(result, model):
+            self.log(f"🔀 {model}: нет квоты, {file_path.name} → следующая модель цепочки", "warning")
+            return True
+        return False
+    
+    def _finish_file(self, file_path, output_folder, result, save_raw, parser=None, router=None, model=None):
+        """Разбор ответа API (ApiResult) и сохранение промптов"""
+        response, status, lease = result.text, result.status, result.lease
         
         if status != "success" or not response:
-            # ✅ НОВОЕ: Регистрируем ошибку
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                # Получаем текущий использованный ключ
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_error(api_key)
-            
+            # ✅ НОВОЕ: Регистрируем ошибку на ключ, который обслуживал запрос (отмена - не ошибка ключа)
+            if status != "cancelled":
+                self._credit_error(lease)
             return False, status
         
         # Сохранение сырого ответа (если включено)
         if save_raw:
             self.save_raw_response(response, file_path.stem)
         
-        # Парсинг промптов
-        prompts = self.parse_prompts(response)
+        # Парсинг промптов (при потоковом чтении они уже разобраны по строкам)
+        prompts = parser.prompts if parser else self.parse_prompts(response)
         
         if not prompts:
             self.log(f"⚠️ Не удалось распарсить промпты из {file_path.name}", "warning")
             
             # ✅ НОВОЕ: Регистрируем ошибку парсинга
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_error(api_key)
-            
+            self._credit_error(lease)
+            self._discard_cached(result)
             return False, "parse_error"
         
-        # Сохранение промптов
+        return self._save_file(file_path, output_folder, prompts, lease, router, model)
+    
+    def _save_file(self, file_path, output_folder, prompts, lease, router=None, model=None):
+        """Сохранить промпты файла и записать результат на ключ (и модель) из аренды"""
         output_path = Path(output_folder) / file_path.name
         success = self.save_prompts(prompts, output_path)
         
         if success:
             # ✅ НОВОЕ: Регистрируем успешную обработку
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_file_processed(api_key)
-                    self.api_client.key_manager.add_prompts_generated(api_key, len(prompts))
+            key_manager = self._key_manager()
+            if key_manager and lease:
+                key_manager.add_file_processed(lease.api_key)
+                key_manager.add_prompts_generated(lease.api_key, len(prompts))
+            if router:
+                router.record(output_path.name, model)
             
             self.log(f"✅ Сохранено {len(prompts)} промптов → {output_path.name}", "success")
             return True, "success"
         else:
             # ✅ НОВОЕ: Регистрируем ошибку сохранения
-            if hasattr(self.api_client, 'key_manager') and self.api_client.key_manager:
-                current_key_index = self.api_client.key_manager.current_key_index - 1
-                if current_key_index < 0:
-                    current_key_index = len(self.api_client.key_manager.api_keys) - 1
-                
-                if current_key_index < len(self.api_client.key_manager.api_keys):
-                    api_key = self.api_client.key_manager.api_keys[current_key_index]
-                    self.api_client.key_manager.add_error(api_key)
-            
+            self._credit_error(lease)
             return False, "save_error"
+    
+    # ---------- пакетные запросы ----------
+    
+    @staticmethod
+    def plan_packs(items, pack_size=1, max_chars=0):
+        """
+        Разбить [(index, file_path)] на пакеты подряд идущих файлов.
+        
+        В пакете не больше pack_size файлов и (если max_chars) не больше
+        max_chars байт текста; файл крупнее лимита идёт отдельным запросом.
+        """
+        packs = []
+        current = []
+        current_size = 0
+        
+        for index, file_path in items:
+            try:
+                size = file_path.stat().st_size
+            except OSError:
+                size = 0
+            
+            too_big = max_chars and current and current_size + size > max_chars
+            if current and (len(current) >= pack_size or too_big):
+                packs.append(current)
+                current, current_size = [], 0
+            
+            current.append((index, file_path))
+            current_size += size
+        
+        if current:
+            packs.append(current)
+        return packs
+    
+    def process_group(self, file_paths, **job):
+        """Файлы пакета одним запросом, одиночный файл - как обычно → [(успех, статус)]"""
+        if len(file_paths) == 1:
+            return [self.process_file(file_path=file_paths[0], **job)]
+        return self.process_pack(file_paths, **job)
+    
+    async def process_group_async(self, session, file_paths, **job):
+        """Асинхронный process_group"""
+        if len(file_paths) == 1:
+            return [await self.process_file_async(session, file_path=file_paths[0], **job)]
+        return await self.process_pack_async(session, file_paths, **job)
+    
+    def process_pack(self, file_paths, output_folder, system_prompt, model, temperature, prompts_count,
+                     save_raw=False, stream=False, on_prompt=None, retry_budget=None, router=None, cancel=None,
+                     max_retries=None):
+        """
+        Несколько чанков одним запросом (system prompt отправляется один раз).
+        
+        Чанки разделены строками «### ЧАНК k», ответ режется по тем же
+        маркерам. Чанки, чьи промпты из ответа не разобрать, обрабатываются
+        отдельными запросами. Пакет читается без потока (stream игнорируется).
+        """
+        results, request, packed = self._prepare_pack(file_paths, system_prompt, prompts_count)
+        single = dict(output_folder=output_folder, system_prompt=system_prompt, model=model,
+                      temperature=temperature, prompts_count=prompts_count, save_raw=save_raw, stream=stream,
+                      on_prompt=on_prompt, retry_budget=retry_budget, router=router, cancel=cancel,
+                      max_retries=max_retries)
+        
+        if len(packed) < 2:
+            for index, file_path in packed:
+                results[index] = self.process_file(file_path=file_path, **single)
+            return results
+        
+        result = None
+        for model in self._route(router, request, model, packed[0][1]):
+            result = self.api_client.send_request(
+                model=model,
+                temperature=temperature,
+                retry_budget=retry_budget,
+                cache_tag=("pack", prompts_count),
+                cancel=cancel,
+                max_retries=max_retries,
+                **request
+            )
+            if not self._should_fallback(router, result, model, packed[0][1]):
+                break
+        
+        fallback = self._finish_pack(packed, output_folder, prompts_count, result, save_raw, results, router, model)
+        for index, file_path in fallback:
+            results[index] = self.process_file(file_path=file_path, **single)
+        return results
+    
+    async def process_pack_async(self, session, file_paths, output_folder, system_prompt, model, temperature,
+                                 prompts_count, save_raw=False, stream=False, on_prompt=None, retry_budget=None,
+                                 router=None, cancel=None, max_retries=None):
+        """Асинхронный process_pack"""
+        results, request, packed = self._prepare_pack(file_paths, system_prompt, prompts_count)
+        single = dict(output_folder=output_folder, system_prompt=system_prompt, model=model,
+                      temperature=temperature, prompts_count=prompts_count, save_raw=save_raw, stream=stream,
+                      on_prompt=on_prompt, retry_budget=retry_budget, router=router, cancel=cancel,
+                      max_retries=max_retries)
+        
+        if len(packed) < 2:
+            for index, file_path in packed:
+                results[index] = await self.process_file_async(session, file_path=file_path, **single)
+            return results
+        
+        result = None
+        for model in self._route(router, request, model, packed[0][1]):
+            result = await self.api_client.send_request_async(
+                session,
+                model=model,
+                temperature=temperature,
+                retry_budget=retry_budget,
+                cache_tag=("pack", prompts_count),
+                cancel=cancel,
+                max_retries=max_retries,
+                **request
+            )
+            if not self._should_fallback(router, result, model, packed[0][1]):
+                break
+        
+        fallback = self._finish_pack(packed, output_folder, prompts_count, result, save_raw, results, router, model)
+        for index, file_path in fallback:
+            results[index] = await self.process_file_async(session, file_path=file_path, **single)
+        return results
+    
+    def _prepare_pack(self, file_paths, system_prompt, prompts_count):
+        """
+        Запрос пакета → (results, request, packed).
+        
+        results - список итогов по файлам (у непрочитанных уже read_error),
+        packed - [(позиция в пакете, file_path)] прочитанных чанков.
+        """
+        results = [None] * len(file_paths)
+        packed = []
+        parts = []
+        
+        for index, file_path in enumerate(file_paths):
+            chunk_text = self.read_chunk(file_path)
+            if not chunk_text:
+                results[index] = (False, "read_error")
+                continue
+            packed.append((index, file_path))
+            parts.append(f"{PACK_MARKER} {len(packed)}\n{chunk_text}")
+        
+        if len(packed) > 1:
+            names = ", ".join(file_path.name for _, file_path in packed)
+            self.log(f"📦 Пакет из {len(packed)} чанков: {names}", "info")
+        
+        n = str(prompts_count)
+        request = {
+            "user_message": "\n\n".join(parts),
+            "system_prompt": system_prompt.replace("{n}", n) + PACK_INSTRUCTION.format(marker=PACK_MARKER, n=n)
+        }
+        return results, request, packed
+    
+    @staticmethod
+    def split_pack_response(response_text):
+        """Ответ пакета → {номер чанка: текст его части}"""
+        sections = {}
+        matches = list(PACK_MARKER_RE.finditer(response_text))
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(response_text)
+            number = int(match.group(1))
+            sections[number] = sections.get(number, "") + response_text[match.end():end]
+        return sections
+    
+    def _finish_pack(self, packed, output_folder, prompts_count, result, save_raw, results, router=None, model=None):
+        """
+        Разложить ответ пакета по файлам; вернуть чанки, которым нужен отдельный запрос.
+        
+        Чанку достаётся не больше prompts_count промптов: если модель пропустила
+        маркер следующего чанка, его промпты не попадут в чужой файл.
+        """
+        if result is None or not result.success or not result.text:
+            status = result.status if result is not None else "no_models"
+            if status != "cancelled":
+                self._credit_error(result.lease if result is not None else None)
+            for index, _ in packed:
+                results[index] = (False, status)
+            return []
+        
+        if save_raw:
+            self.save_raw_response(result.text, f"{packed[0][1].stem}_pack{len(packed)}")
+        
+        sections = self.split_pack_response(result.text)
+        fallback = []
+        for number, (index, file_path) in enumerate(packed, start=1):
+            prompts = self.parse_prompts(sections.get(number, ""))[:prompts_count]
+            if prompts:
+                results[index] = self._save_file(file_path, output_folder, prompts, result.lease, router, model)
+            else:
+                fallback.append((index, file_path))
+        
+        if fallback:
+            names = ", ".join(file_path.name for _, file_path in fallback)
+            self.log(f"🧩 Ответ пакета не разобран для {names} - отдельные запросы", "warning")
+            self._discard_cached(result)
+        return fallback
+    
+    def _key_manager(self):
+        """KeyManager клиента API (если есть)"""
+        return getattr(self.api_client, 'key_manager', None)
+    
+    def _discard_cached(self, result):
+        """Неразобранный ответ не должен вернуться из кэша при повторе"""
+        discard = getattr(self.api_client, 'discard_cached', None)
+        if discard:
+            discard(result)
+    
+    def _credit_error(self, lease):
+        """Записать ошибку на ключ из аренды"""
+        key_manager = self._key_manager()
+        if key_manager and lease:
+            key_manager.add_error(lease.api_key)
 
     def get_files_to_process(self, chunks_folder):
         """Получить список .txt файлов для обработки"""
@@ -0,0 +1,170 @@
+"""
+Пул воркеров для параллельной генерации промптов (этап 2).
+"""
+
+import threading
+import time
+
+from logic.cancellation import CancelToken
+from logic.retry_queue import DeferredRetryQueue
+
+
+class OrderedProgress:
+    """Выдача результатов строго в порядке файлов, даже если они завершились не по порядку"""
+
+    def __init__(self, files, callback=None):
+        self.files = files
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.results = {}
+        self.next_to_emit = 0
+
+    def store(self, index, success, status, elapsed):
+        """Сохранить результат файла (повторный результат того же файла игнорируется)"""
+        with self.lock:
+            if index in self.results:
+                return
+            self.results[index] = (self.files[index], success, status, elapsed)
+
+            while self.next_to_emit in self.results:
+                file_path, ok, st, el = self.results[self.next_to_emit]
+                if self.callback:
+                    self.callback(self.next_to_emit, file_path, ok, st, el)
+                self.next_to_emit += 1
+
+    def ordered(self):
+        """Все результаты по порядку файлов"""
+        return [self.results[i] for i in sorted(self.results)]
+
+
+class GenerationPool:
+    """Ограниченный пул потоков, распределяющий файлы по ключам"""
+
+    def __init__(self, file_processor, key_manager, logger=None, max_workers=0):
+        self.processor = file_processor
+        self.key_manager = key_manager
+        self.logger = logger
+        self.max_workers = max_workers
+
+        # Пауза и остановка: токен доходит до запросов в полёте
+        self.cancel = CancelToken()
+
+        self.progress = None
+        self.workers_count = 0
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def resolve_workers(self, files_count, model=None, router=None):
+        """
+        Количество воркеров: из настроек или по числу здоровых ключей (по всем моделям цепочки).
+
+        С адаптивным пределом запросов в полёте воркеров - до его максимума:
+        сколько из них реально шлёт запросы, решает ConcurrencyController.
+        """
+        if self.max_workers and self.max_workers > 0:
+            workers = self.max_workers
+        else:
+            models = router.models if router else [model]
+            workers = sum(self.key_manager.get_stats(name)[0] for name in models)
+            if self.key_manager.concurrency.enabled:
+                workers = max(workers, self.key_manager.concurrency.max_limit)
+
+        return max(1, min(workers, files_count))
+
+    def pause(self):
+        """Пауза: новые файлы и попытки не начинаются, запросы в полёте доводятся"""
+        self.cancel.pause()
+
+    def resume(self):
+        """Продолжение после паузы"""
+        self.cancel.resume()
+
+    def stop(self):
+        """Остановка: запросы в полёте и паузы между попытками прерываются сразу"""
+        self.cancel.cancel()
+
+    @property
+    def is_stopped(self):
+        return self.cancel.cancelled
+
+    def run(self, files, job, progress_callback=None, delay=0):
+        """
+        Обработать файлы параллельно.
+
+        job - аргументы FileProcessor.process_file (кроме file_path);
+        pack_size / pack_max_chars - сколько чанков собирать в один запрос;
+        journal - RunJournal: готовые по нему файлы пропускаются (статус journaled);
+        deferred_retries / deferred_retry_cooldown - отложенные повторы
+        неудачных файлов (DeferredRetryQueue).
+        progress_callback(index, file_path, success, status, elapsed) вызывается
+        строго в порядке файлов, даже если они завершились не по порядку.
+        """
+        files = list(files)
+        if not files:
+            return []
+
+        job = dict(job)
+        self.progress = OrderedProgress(files, progress_callback)
+        items = list(enumerate(files))
+
+        # Файлы, готовые по журналу прогона, не обрабатываются заново
+        journal = job.pop('journal', None)
+        if journal:
+            items, done = journal.split(items)
+            for index in done:
+                self.progress.store(index, True, "journaled", 0.0)
+
+        packs = self.processor.plan_packs(items, job.pop('pack_size', 1), job.pop('pack_max_chars', 0))
+        queue = DeferredRetryQueue.for_job(packs, job, self.key_manager, self.logger)
+        job['cancel'] = self.cancel
+
+        self.workers_count = self.resolve_workers(len(packs), job.get('model'), job.get('router'))
+        
+        # Пул HTTP соединений не меньше числа воркеров
+        transport = getattr(getattr(self.processor, 'api_client', None), 'transport', None)
+        if transport:
+            transport.ensure_pool_size(self.workers_count)
+
+        def worker():
+            while self.cancel.wait_resumed():
+                pack = queue.take(self.cancel)
+                if pack is None:
+                    break
+
+                file_start = time.time()
+                try:
+                    results = self.processor.process_group([file_path for _, file_path in pack], **job)
+                except Exception as e:
+                    names = ", ".join(file_path.name for _, file_path in pack)
+                    self.log(f"❌ Исключение при обработке {names}: {str(e)}", "error")
+                    results = [(False, "exception")] * len(pack)
+
+                elapsed = time.time() - file_start
+                for index, success, status in queue.complete(pack, results):
+                    self.progress.store(index, success, status, elapsed)
+                    if journal:
+                        journal.record(files[index], success, status)
+
+                if any(success for success, _ in results) and delay > 0:
+                    self.cancel.sleep(delay)
+
+        self.log(f"🧵 Запуск {self.workers_count} параллельных потоков", "info")
+
+        threads = [
+            threading.Thread(target=worker, daemon=True, name=f"generation-{i + 1}")
+            for i in range(self.workers_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for index, success, status in queue.drain():
+            self.progress.store(index, success, status, 0.0)
+        queue.close()
+        return self.progress.ordered()
@@ -0,0 +1,252 @@
+"""
+Хеджирование запросов и адаптивный таймаут.
+
+LatencyTracker копит время до первого байта по каждой модели.
+Если запрос висит дольше p95 (настраивается), Hedger отправляет копию
+на другой ключ с запасом квоты; побеждает первый успешный ответ,
+проигравший отменяется. Доля копий ограничена бюджетом (% от запросов).
+"""
+
+import asyncio
+import queue
+import threading
+from collections import deque
+
+from logic.cancellation import CancelToken
+
+
+class LatencyTracker:
+    """Скользящие перцентили задержки по моделям и таймаут по ним"""
+
+    def __init__(self, window=200, min_samples=20, default_timeout=30.0, min_timeout=10.0, max_timeout=60.0,
+                 timeout_factor=3.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, model, seconds):
+        """Учесть время до первого байта успешного запроса"""
+        with self.lock:
+            self.samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model, q):
+        """Перцентиль q (0..1) или None, пока замеров мало"""
+        with self.lock:
+            samples = self.samples.get(model)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def timeout(self, model):
+        """Таймаут ожидания ответа: p99 * коэффициент в пределах [min, max]"""
+        p99 = self.percentile(model, 0.99)
+        if p99 is None:
+            return self.default_timeout
+        return max(self.min_timeout, min(self.max_timeout, p99 * self.timeout_factor))
+
+
+class Hedger:
+    """Копия медленного запроса на другой ключ; побеждает первый успешный ответ"""
+
+    def __init__(self, key_manager, tracker, enabled=False, quantile=0.95, budget_percent=10.0, min_headroom=0.2,
+                 logger=None):
+        self.key_manager = key_manager
+        self.tracker = tracker
+        self.enabled = enabled
+        self.quantile = quantile
+        self.budget_percent = budget_percent
+        self.min_headroom = min_headroom
+        self.logger = logger
+
+        self.lock = threading.Lock()
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def hedge_delay(self, model):
+        """Через сколько секунд отправлять копию (None - не хеджировать)"""
+        if not self.enabled:
+            return None
+        return self.tracker.percentile(model, self.quantile)
+
+    def _take_hedge_lease(self, lease, tokens):
+        """Аренда другого ключа под копию, если позволяет бюджет"""
+        with self.lock:
+            if (self.hedges + 1) * 100 > self.budget_percent * self.primaries:
+                return None
+            self.hedges += 1
+
+        hedge = self.key_manager.acquire_lease(
+            lease.model, tokens, exclude={lease.key_id}, min_headroom=self.min_headroom
+        )
+        if hedge is None:
+            with self.lock:
+                self.hedges -= 1
+        return hedge
+
+    def _count_primary(self):
+        with self.lock:
+            self.primaries += 1
+
+    def _count_win(self, winner, primary):
+        if winner is not primary:
+            with self.lock:
+                self.hedge_wins += 1
+
+    def run(self, lease, tokens, send, is_success, settle, discard, cancel=None):
+        """
+        Выполнить send(lease, cancel) с хеджированием (блокирующий вариант).
+
+        Возвращает (аренда, ответ, исключение) победителя или последней попытки.
+        Неудачи, пришедшие пока другой участник ещё в полёте, отдаются в settle(),
+        ответы, опоздавшие после выбора победителя, - в discard().
+        cancel - токен прогона: у каждого участника свой дочерний токен, и
+        проигравший отменяется сразу (его сокет закрывается, аренда освобождается).
+        """
+        self._count_primary()
+        delay = self.hedge_delay(lease.model)
+        if delay is None:
+            try:
+                return lease, send(lease, cancel), None
+            except Exception as e:
+                return lease, None, e
+
+        results = queue.Queue()
+        state_lock = threading.Lock()
+        state = {'done': False}
+        racers = []     # (аренда, токен участника, отписка от токена прогона)
+
+        def start(racer):
+            token, unregister = (cancel or CancelToken()).child()
+            racers.append((racer, token, unregister))
+            threading.Thread(target=worker, args=(racer, token), daemon=True).start()
+
+        def worker(racer, token):
+            try:
+                item = (racer, send(racer, token), None)
+            except Exception as e:
+                item = (racer, None, e)
+            with state_lock:
+                late = state['done']
+                if not late:
+                    results.put(item)
+            if late:
+                discard(*item)
+
+        start(lease)
+        launched, finished, hedged = 1, 0, False
+        chosen = None
+
+        while chosen is None:
+            try:
+                item = results.get(timeout=None if hedged else delay)
+            except queue.Empty:
+                hedged = True
+                hedge = self._take_hedge_lease(lease, tokens)
+                if hedge is not None:
+                    self.log(f"🔀 Запрос дольше {delay:.1f} сек, копия на ключ ...{hedge.key_id}", "info")
+                    launched += 1
+                    start(hedge)
+                continue
+
+            finished += 1
+            racer, response, error = item
+            if error is None and is_success(response):
+                chosen = item
+            elif finished < launched:
+                # Другой участник ещё может успеть
+                settle(*item)
+            else:
+                chosen = item
+
+        with state_lock:
+            state['done'] = True
+        while not results.empty():
+            discard(*results.get())
+
+        # Проигравший ещё в полёте: обрываем его запрос, discard() придёт из его потока
+        for racer, token, unregister in racers:
+            unregister()
+            if racer is not chosen[0]:
+                token.cancel()
+
+        self._count_win(chosen[0], lease)
+        return chosen
+
+    async def run_async(self, lease, tokens, send, is_success, settle, discard):
+        """Асинхронный run(): проигравшая задача отменяется сразу"""
+        self._count_primary()
+        delay = self.hedge_delay(lease.model)
+        if delay is None:
+            try:
+                return lease, await send(lease), None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return lease, None, e
+
+        tasks = {asyncio.ensure_future(send(lease)): lease}
+        pending = set(tasks)
+        chosen = None
+
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                hedge = self._take_hedge_lease(lease, tokens)
+                if hedge is not None:
+                    self.log(f"🔀 Запрос дольше {delay:.1f} сек, копия на ключ ...{hedge.key_id}", "info")
+                    task = asyncio.ensure_future(send(hedge))
+                    tasks[task] = hedge
+                    pending.add(task)
+
+            while chosen is None:
+                if not done:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                items = [self._task_item(task, tasks[task]) for task in done]
+                # Успешные ответы первыми: одновременный успех важнее одновременной ошибки
+                items.sort(key=lambda it: not (it[2] is None and is_success(it[1])))
+
+                for item in items:
+                    if chosen is not None:
+                        settle(*item)
+                    elif item[2] is None and is_success(item[1]):
+                        chosen = item
+                    elif pending or item is not items[-1]:
+                        settle(*item)
+                    else:
+                        chosen = item
+                done = set()
+        finally:
+            # Проигравшие (и все участники при отмене снаружи) снимаются
+            for task in pending:
+                task.cancel()
+                discard(tasks[task], None, None)
+
+        self._count_win(chosen[0], lease)
+        return chosen
+
+    @staticmethod
+    def _task_item(task, racer):
+        if task.cancelled():
+            return racer, None, asyncio.CancelledError()
+        if task.exception() is not None:
+            return racer, None, task.exception()
+        return racer, task.result(), None
+
+    def get_stats(self):
+        with self.lock:
+            return {"primaries": self.primaries, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
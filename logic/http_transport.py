@@ -0,0 +1,255 @@
+"""
+Общий HTTP транспорт: пул keep-alive соединений и замер времени запросов.
+
+Все обращения к Groq (генерация, тест ключей, список моделей) идут через
+одну requests.Session, поэтому DNS/TCP/TLS оплачиваются один раз на
+соединение, а не на каждый чанк.
+
+Запрос с токеном отмены (cancel) обрывается сразу: при отмене сокет его
+соединения закрывается, и ожидание ответа в потоке воркера прерывается.
+"""
+
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# Адрес API по умолчанию (в config.json - api_base_url, например локальный заменитель)
+GROQ_API_BASE = "https://api.groq.com"
+
+_local = threading.local()
+
+
+class RequestCancelled(requests.exceptions.RequestException):
+    """Запрос прерван токеном отмены"""
+
+
+def _abort_connection(conn):
+    """Закрыть сокет соединения: блокирующее чтение в другом потоке сразу завершится ошибкой"""
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def abort_response(response):
+    """Оборвать чтение тела ответа (stream=True) из другого потока"""
+    raw = getattr(response, 'raw', None)
+    connection = getattr(raw, 'connection', None)
+    if connection is not None:
+        _abort_connection(connection)
+
+
+class _TimedConnectionMixin:
+    """Замер времени установки соединения (DNS + TCP + TLS)"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _local.connect_time = getattr(_local, 'connect_time', 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _CancellablePoolMixin:
+    """Пока запрос ждёт ответа, отмена токена текущего потока закрывает его соединение"""
+
+    def _make_request(self, conn, *args, **kwargs):
+        cancel = getattr(_local, 'cancel', None)
+        if cancel is None:
+            return super()._make_request(conn, *args, **kwargs)
+        unregister = cancel.on_cancel(lambda: _abort_connection(conn))
+        try:
+            return super()._make_request(conn, *args, **kwargs)
+        finally:
+            unregister()
+
+
+class _TimedHTTPConnectionPool(_CancellablePoolMixin, HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(_CancellablePoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter, создающий соединения с замером времени"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class RequestTiming:
+    """Время одного запроса: соединение, первый байт, всего (секунды)"""
+
+    def __init__(self, connect=0.0, ttfb=0.0, total=0.0):
+        self.connect = connect
+        self.ttfb = ttfb
+        self.total = total
+
+    @property
+    def reused(self):
+        """Запрос ушёл по уже открытому соединению"""
+        return self.connect == 0.0
+
+    def __repr__(self):
+        return f"RequestTiming(connect={self.connect:.3f}, ttfb={self.ttfb:.3f}, total={self.total:.3f})"
+
+
+class HttpTransport:
+    """Пул keep-alive соединений с замером connect / TTFB / total"""
+
+    def __init__(self, pool_size=10, logger=None):
+        self.logger = logger
+        self.pool_size = max(1, pool_size)
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self._mount(self.pool_size)
+
+        # Накопленная статистика
+        self.requests_count = 0
+        self.new_connections = 0
+        self.total_connect = 0.0
+        self.total_ttfb = 0.0
+        self.total_time = 0.0
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def _mount(self, pool_size):
+        previous = self.session.adapters.get('https://')
+        adapter = _TimedAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Соединения старого пула иначе висят до сборки мусора (запросы в полёте закроют свои сами)
+        if previous is not None:
+            previous.close()
+
+    def ensure_pool_size(self, pool_size):
+        """Увеличить пул под число воркеров (уменьшать не нужно)"""
+        with self.lock:
+            if pool_size <= self.pool_size:
+                return
+            self.pool_size = pool_size
+            self._mount(pool_size)
+        self.log(f"🔌 Пул HTTP соединений: {pool_size}", "info")
+
+    def request(self, method, url, cancel=None, **kwargs):
+        """Выполнить запрос, вернуть (response, RequestTiming); отмена cancel - RequestCancelled"""
+        if cancel is not None and cancel.cancelled:
+            raise RequestCancelled("запрос отменён")
+
+        _local.connect_time = 0.0
+        _local.cancel = cancel
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            if cancel is not None and cancel.cancelled:
+                raise RequestCancelled("запрос отменён") from e
+            raise
+        finally:
+            _local.cancel = None
+        total = time.perf_counter() - start
+
+        timing = RequestTiming(
+            connect=_local.connect_time,
+            ttfb=response.elapsed.total_seconds(),
+            total=total
+        )
+        response.timing = timing
+        self._record(timing)
+        return response, timing
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def _record(self, timing):
+        with self.lock:
+            self.requests_count += 1
+            if not timing.reused:
+                self.new_connections += 1
+            self.total_connect += timing.connect
+            self.total_ttfb += timing.ttfb
+            self.total_time += timing.total
+
+    def prewarm(self, url, connections=1, timeout=10):
+        """
+        Открыть соединения заранее, чтобы первый чанк не платил за handshake.
+
+        Любой HTTP ответ (даже 401/404) оставляет соединение в пуле.
+        """
+        connections = max(1, min(connections, self.pool_size))
+
+        def warm():
+            try:
+                response, _ = self.request('HEAD', url, timeout=timeout)
+                response.close()
+            except requests.exceptions.RequestException:
+                pass
+
+        threads = [threading.Thread(target=warm, daemon=True) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.log(f"🔌 Прогрето соединений: {connections}", "info")
+
+    def get_stats(self):
+        """Средние времена и доля переиспользованных соединений"""
+        with self.lock:
+            count = self.requests_count
+            if count == 0:
+                return {"requests": 0, "reuse_ratio": 0.0, "avg_connect": 0.0, "avg_ttfb": 0.0, "avg_total": 0.0}
+            return {
+                "requests": count,
+                "reuse_ratio": 1 - self.new_connections / count,
+                "avg_connect": self.total_connect / max(1, self.new_connections),
+                "avg_ttfb": self.total_ttfb / count,
+                "avg_total": self.total_time / count
+            }
+
+    def close(self):
+        self.session.close()
+
+
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport(pool_size=10, logger=None):
+    """Общий транспорт процесса (создаётся при первом обращении)"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HttpTransport(pool_size, logger)
+        elif pool_size > _shared_transport.pool_size:
+            _shared_transport.ensure_pool_size(pool_size)
+        return _shared_transport
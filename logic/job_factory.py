@@ -0,0 +1,114 @@
+"""
+Сборка задания этапа 2 и исполнителей по настройкам.
+
+Общая часть GUI (gui/main_window.py) и запуска без интерфейса (cli.py):
+параметры модели и промптов приходят извне (вкладка настроек или config.json),
+всё остальное - из config.json.
+"""
+
+from logic.async_runner import AsyncPipelineRunner
+from logic.batch_processor import BatchProcessor
+from logic.generation_pool import GenerationPool
+from logic.model_router import ModelRouter
+from logic.retry_policy import RetryBudget
+from logic.run_journal import RunJournal
+from logic.stream_pipeline import StreamingPipeline
+
+
+def settings_from_config(config):
+    """Параметры генерации из config.json (то, что в GUI задаётся на вкладке настроек)"""
+    return {
+        'system_prompt': config.get_system_prompt(),
+        'model': config.get_model(),
+        'temperature': config.get_temperature(),
+        'prompts_count': config.get_prompts_count(),
+        'save_raw': config.get('save_raw_responses', False)
+    }
+
+
+def create_retry_budget(config, files_count):
+    """Общий бюджет повторов на задание"""
+    return RetryBudget.for_files(files_count, config.get('retry_budget_per_file', 0.5))
+
+
+def create_router(config, key_manager, model, prompts_folder, logger=None):
+    """Цепочка моделей этапа 2: основная + запасные из config.json (None - запасных нет)"""
+    chain = [model] + list(config.get('model_chain', []))
+    if len(set(chain)) < 2:
+        return None
+    return ModelRouter(
+        key_manager, chain,
+        quotas=config.get('model_quotas', {}),
+        max_chars=config.get('model_max_chars', {}),
+        fallback_wait=config.get('model_fallback_wait', 60.0),
+        manifest_folder=prompts_folder,
+        logger=logger
+    )
+
+
+def create_job(config, key_manager, prompts_folder, files_count, settings, verification_prompt=None, logger=None):
+    """
+    Параметры задания этапа 2 для GenerationPool / AsyncPipelineRunner / StreamingPipeline.
+
+    settings - system_prompt, model, temperature, prompts_count, save_raw.
+    verification_prompt - для конвейера 1→2→3: входит в отпечаток журнала,
+    т.к. готовый файл там уже проверен.
+    """
+    job = dict(
+        settings,
+        output_folder=prompts_folder,
+        stream=config.get('stream_responses', False),
+        retry_budget=create_retry_budget(config, files_count),
+        router=create_router(config, key_manager, settings['model'], prompts_folder, logger),
+        pack_size=max(1, config.get('pack_chunks', 1)),
+        pack_max_chars=config.get('pack_max_chars', 6000),
+        deferred_retries=config.get('deferred_retries', 2),
+        deferred_retry_cooldown=config.get('deferred_retry_cooldown', 10.0)
+    )
+    if job['deferred_retries'] > 0:
+        # Долгие повторы - в очередь задания, а не паузами внутри запроса
+        job['max_retries'] = config.get('inline_max_retries', 2)
+    if config.get('run_journal', True):
+        fingerprint = RunJournal.fingerprint_job(dict(job, verification_prompt=verification_prompt))
+        job['journal'] = RunJournal(prompts_folder, fingerprint, logger)
+    return job
+
+
+def use_async_runner(config, api_client, logger=None):
+    """Включён ли асинхронный режим (и доступен ли aiohttp)"""
+    if not config.get('async_runner', False):
+        return False
+    if not api_client.supports_async():
+        if logger:
+            logger.log("⚠️ aiohttp не установлен, используются потоки", "warning")
+        return False
+    return True
+
+
+def create_async_runner(config, file_processor, verifier=None, logger=None):
+    return AsyncPipelineRunner(
+        file_processor, verifier, logger,
+        max_in_flight=config.get('async_max_in_flight', 100)
+    )
+
+
+def create_runner(config, file_processor, key_manager, verifier=None, logger=None, max_workers=0):
+    """Исполнитель этапа 2: Batch API, асинхронный или пул потоков"""
+    if config.get('batch_mode', False):
+        return BatchProcessor(
+            file_processor, logger,
+            poll_interval=config.get('batch_poll_interval', 30.0)
+        )
+    if use_async_runner(config, file_processor.api_client, logger):
+        return create_async_runner(config, file_processor, verifier, logger)
+    return GenerationPool(file_processor, key_manager, logger, max_workers=max_workers)
+
+
+def create_pipeline(config, file_processor, key_manager, verifier=None, logger=None, max_workers=0):
+    """Потоковый конвейер этапов 1 → 2 → 3"""
+    return StreamingPipeline(
+        file_processor, key_manager, verifier, logger,
+        max_workers=max_workers,
+        verify_workers=config.get('pipeline_verify_workers', 4),
+        queue_size=config.get('pipeline_queue_size', 16)
+    )
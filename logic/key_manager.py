@@ -2,44 +2,120 @@ import json
 import os
 import threading
 import re
+import time
 from datetime import datetime, timedelta
-from tkinter import messagebox
+
+from logic.circuit_breaker import CircuitBreakers, OPEN, CLOSED
+from logic.concurrency import ConcurrencyController
+from logic.rate_limiter import RateLimiter, parse_duration
+from logic.token_usage import UsageTotals
+from logic.key_scheduler import KeyScheduler
+from logic.usage_db import UsageDatabase
+from utils.atomic_store import WriteBehindStore
+
+
+class KeyLease:
+    """Аренда ключа на один запрос: ключ, модель, время и итог"""
+    
+    def __init__(self, api_key, model):
+        self.api_key = api_key
+        self.key_id = api_key[-8:]
+        self.model = model
+        self.started_at = time.time()
+        self.finished_at = None
+        self.outcome = None
+        self.tokens_reserved = 0
+        self.slot = False  # аренда занимает слот ConcurrencyController
+        self.timing = None
+        self.usage = None
+    
+    @property
+    def released(self):
+        return self.finished_at is not None
+    
+    @property
+    def latency(self):
+        """Длительность аренды в секундах"""
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+    
+    def __repr__(self):
+        return f"KeyLease(...{self.key_id}, {self.model}, outcome={self.outcome})"
 
 class KeyManager:
     """Управление API ключами (загрузка, ротация, лимиты)"""
     
-    def __init__(self, keys_file="API_keys.txt", limits_file="logs/keys_limits.json"):
+    # Оценка токенов пробной заявки выключателя ("Hi", max_tokens=1)
+    PROBE_TOKENS = 10
+    
+    def __init__(self, keys_file="API_keys.txt", limits_file="logs/keys_limits.json", flush_interval=2.0,
+                 backend="json", db_path="logs/usage.db", breaker_settings=None, concurrency_settings=None):
         self.keys_file = keys_file
         self.limits_file = limits_file
         self.api_keys = []
         self.keys_limits = {}
         self.current_key_index = 0
-        self.request_counter = 0
         self.file_lock = threading.Lock()
+        self.state_lock = threading.RLock()
+        self.active_leases = {}
+        self.in_flight = {}  # (key_id, model) -> открытые аренды (их резерв сервер мог ещё не увидеть)
+        self.limiter = RateLimiter()
+        self.scheduler = KeyScheduler(self.limiter, gate=self._breaker_gate)
+        self.last_model = None
+        
+        # Выключатели ключей и моделей; prober(lease) отправляет дешёвую пробную заявку
+        self.breakers = CircuitBreakers(breaker_settings)
+        self.prober = None
+        
+        # Адаптивный (AIMD) предел запросов в полёте по моделям
+        self.concurrency = ConcurrencyController(**(concurrency_settings or {'enabled': False}))
+        
+        # Фактический расход токенов текущего прогона (по моделям)
+        self.run_usage = {}
+        self.run_started_at = None
+        
+        # Перечитываем файл ключей не чаще раза в N секунд
+        self.keys_reload_interval = 10
+        self.last_keys_reload = time.time()
         
         # Создаём папку для логов
         os.makedirs("logs", exist_ok=True)
         
+        # Хранилище: keys_limits.json (отложенная атомарная запись) или SQLite (WAL)
+        self.backend = backend
+        self.db = None
+        self.store = None
+        if backend == "sqlite":
+            self.db = UsageDatabase(db_path)
+        else:
+            self.store = WriteBehindStore(self.limits_file, self._snapshot_limits, flush_interval)
+        
         # Загружаем данные
         self.load_api_keys()
         self.load_keys_limits()
     
     def load_api_keys(self):
         """Загрузка API ключей из файла"""
-        self.api_keys = []
+        api_keys = []
         if os.path.exists(self.keys_file):
             with open(self.keys_file, 'r', encoding='utf-8') as f:
                 for line in f:
                     key = line.strip()
                     if key and not key.startswith('#'):
-                        self.api_keys.append(key)
+                        api_keys.append(key)
+        
+        with self.state_lock:
+            self.api_keys = api_keys
+            if self.api_keys:
+                self.current_key_index %= len(self.api_keys)
+            else:
+                self.current_key_index = 0
+            self.last_keys_reload = time.time()
+            self._sync_scheduler()
         
         if not self.api_keys:
-            messagebox.showerror(
-                "❌ Ошибка",
-                f"Файл {self.keys_file} пуст или не найден!\n\n"
-                "Добавьте API ключи (один на строку)"
-            )
+            # Окно с ошибкой показывает GUI (main.py) - здесь только сообщение в консоль
+            print(f"❌ Файл {self.keys_file} пуст или не найден! Добавьте API ключи (один на строку)")
     
     def reload_api_keys(self):
         """Перезагрузка API ключей"""
@@ -50,107 +126,365 @@ class KeyManager:
     
     def load_keys_limits(self):
         """Загрузка лимитов ключей из файла"""
-        if os.path.exists(self.limits_file):
-            with self.file_lock:
-                with open(self.limits_file, 'r', encoding='utf-8') as f:
-                    self.keys_limits = json.load(f)
-        else:
-            self.keys_limits = {}
+        keys_limits = {}
+        if self.db:
+            keys_limits = self._load_from_db()
+        elif os.path.exists(self.limits_file):
+            try:
+                with self.file_lock:
+                    with open(self.limits_file, 'r', encoding='utf-8') as f:
+                        keys_limits = json.load(f)
+            except json.JSONDecodeError as e:
+                # Файл мог быть обрезан старой (неатомарной) записью
+                print(f"⚠️ Повреждён {self.limits_file}, статистика начата заново: {e}")
+        
+        with self.state_lock:
+            self.keys_limits = keys_limits
+            
+            # Восстанавливаем состояние bucket'ов лимитера
+            for key_id, data in self.keys_limits.items():
+                for model, buckets in data.get('buckets', {}).items():
+                    self.limiter.restore(key_id, model, buckets)
+            
+            self._sync_scheduler()
         
         self.reset_expired_limits()
     
-    def save_keys_limits(self):
-        """Сохранение лимитов ключей"""
-        with self.file_lock:
-            with open(self.limits_file, 'w', encoding='utf-8') as f:
-                json.dump(self.keys_limits, f, indent=2)
+    def _load_from_db(self):
+        """Собрать keys_limits из таблицы key_state"""
+        keys_limits = {}
+        for key_id, models in self.db.load_state().items():
+            data = dict(models.get('', {}))
+            buckets = {model: state for model, state in models.items() if model}
+            if buckets:
+                data['buckets'] = buckets
+            keys_limits[key_id] = data
+        return keys_limits
+    
+    def _sync_scheduler(self):
+        """Передать планировщику текущие ключи и список невалидных (под state_lock)"""
+        invalid = [
+            key_id for key_id, data in self.keys_limits.items()
+            if data.get('permanently_invalid', False)
+        ]
+        self.scheduler.sync_keys(self.api_keys, invalid)
+    
+    def _snapshot_limits(self):
+        """Текст keys_limits.json для записи на диск"""
+        with self.state_lock:
+            return json.dumps(self.keys_limits, indent=2)
+    
+    def save_keys_limits(self, key_id=None):
+        """
+        Сохранение лимитов ключей.
+        
+        JSON - отложенная запись всего файла не чаще раза в flush_interval.
+        SQLite - в очередь записи уходят только строки изменённого ключа.
+        """
+        if not self.db:
+            self.store.mark_dirty()
+            return
+        
+        with self.state_lock:
+            key_ids = [key_id] if key_id else list(self.keys_limits)
+            for kid in key_ids:
+                data = self.keys_limits.get(kid)
+                if data is None:
+                    continue
+                counters = {k: v for k, v in data.items() if k != 'buckets'}
+                self.db.save_state(kid, '', counters)
+                for model, buckets in data.get('buckets', {}).items():
+                    self.db.save_state(kid, model, buckets)
+    
+    def flush_keys_limits(self):
+        """Немедленно записать лимиты на диск"""
+        if self.store:
+            return self.store.flush()
+        return False
+    
+    def close(self):
+        """Финальный сброс состояния при выходе"""
+        if self.store:
+            self.store.close()
+        if self.db:
+            self.db.close()
     
     def reset_expired_limits(self):
         """Сброс устаревших лимитов"""
-        now = datetime.now()
-        changed = False
-        
-        for key_id, data in self.keys_limits.items():
-            # Daily reset
-            if 'daily_reset_at' in data:
-                try:
-                    if data['daily_reset_at'] and isinstance(data['daily_reset_at'], str):
-                        reset_time = datetime.fromisoformat(data['daily_reset_at'])
-                        if now > reset_time:
-                            data['tokens_used_today'] = 0
-                            data['daily_reset_at'] = (now + timedelta(days=1)).isoformat()
-                            changed = True
-                except (ValueError, TypeError):
-                    data['daily_reset_at'] = (now + timedelta(days=1)).isoformat()
-                    changed = True
+        with self.state_lock:
+            now = datetime.now()
+            changed = False
+        
+            for key_id, data in self.keys_limits.items():
+                # Daily reset
+                if 'daily_reset_at' in data:
+                    try:
+                        if data['daily_reset_at'] and isinstance(data['daily_reset_at'], str):
+                            reset_time = datetime.fromisoformat(data['daily_reset_at'])
+                            if now > reset_time:
+                                data['tokens_used_today'] = 0
+                                data['daily_reset_at'] = (now + timedelta(days=1)).isoformat()
+                                changed = True
+                    except (ValueError, TypeError):
+                        data['daily_reset_at'] = (now + timedelta(days=1)).isoformat()
+                        changed = True
             
-            # RPM reset
-            if 'rpm_reset_at' in data:
-                try:
-                    if data['rpm_reset_at'] and isinstance(data['rpm_reset_at'], str):
-                        reset_time = datetime.fromisoformat(data['rpm_reset_at'])
-                        if now > reset_time:
-                            data['requests_this_minute'] = 0
-                            data['rpm_reset_at'] = None
-                            changed = True
-                except (ValueError, TypeError):
-                    data['rpm_reset_at'] = None
-                    changed = True
+                # RPM reset
+                if 'rpm_reset_at' in data:
+                    try:
+                        if data['rpm_reset_at'] and isinstance(data['rpm_reset_at'], str):
+                            reset_time = datetime.fromisoformat(data['rpm_reset_at'])
+                            if now > reset_time:
+                                data['requests_this_minute'] = 0
+                                data['rpm_reset_at'] = None
+                                changed = True
+                    except (ValueError, TypeError):
+                        data['rpm_reset_at'] = None
+                        changed = True
         
         if changed:
             self.save_keys_limits()
     
-    def get_next_key(self):
-        """Round-robin выбор следующего валидного ключа"""
-        if not self.api_keys:
-            return None
-        
-        # Перечитываем ключи раз в 5 запросов
-        self.request_counter += 1
-        if self.request_counter % 5 == 0:
-            self.reload_api_keys()
+    def get_next_key(self, model=None, tokens=0, exclude=(), min_headroom=0.0):
+        """
+        Выбор следующего валидного ключа.
         
-        attempts = 0
-        max_attempts = len(self.api_keys)
-        
-        while attempts < max_attempts:
-            key = self.api_keys[self.current_key_index]
-            key_id = key[-8:]
+        С моделью - лучший по запасу квоты ключ из KeyScheduler (O(log n)),
+        исчерпанные ключи припаркованы до сброса. Без модели - round-robin.
+        """
+        with self.state_lock:
+            # Периодически перечитываем файл ключей
+            if time.time() - self.last_keys_reload >= self.keys_reload_interval:
+                self.reload_api_keys()
             
-            # Переход к следующему
-            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-            attempts += 1
+            if not self.api_keys:
+                return None
             
-            # Проверка валидности
-            if key_id in self.keys_limits:
-                limits = self.keys_limits[key_id]
-                
-                if limits.get('permanently_invalid', False):
-                    continue
+            if model:
+                return self.scheduler.acquire(model, tokens, exclude, min_headroom)
+            
+            for _ in range(len(self.api_keys)):
+                key = self.api_keys[self.current_key_index]
+                key_id = key[-8:]
                 
-                # Проверка RPM
-                if limits.get('requests_this_minute', 0) >= 30:
-                    if limits.get('rpm_reset_at'):
-                        try:
-                            if isinstance(limits['rpm_reset_at'], str):
-                                reset_time = datetime.fromisoformat(limits['rpm_reset_at'])
-                                if datetime.now() < reset_time:
-                                    continue
-                        except:
-                            pass
+                # Переход к следующему
+                self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
                 
-                # Проверка TPD
-                if limits.get('tokens_used_today', 0) >= 14400:
+                # Проверка валидности
+                if self.keys_limits.get(key_id, {}).get('permanently_invalid', False):
                     continue
+                
+                return key
             
-            return key
+            return None
+    
+    def acquire_lease(self, model, tokens=0, exclude=(), min_headroom=0.0):
+        """Выдать аренду следующего доступного ключа (или None)"""
+        with self.state_lock:
+            api_key = self.get_next_key(model, tokens, exclude, min_headroom)
+            if not api_key:
+                return None
+            return self._open_lease(api_key, model, tokens)
+    
+    def lease_key(self, api_key, model, tokens=0):
+        """Аренда конкретного ключа в обход очереди (пробные заявки)"""
+        with self.state_lock:
+            return self._open_lease(api_key, model, tokens)
+    
+    def _open_lease(self, api_key, model, tokens):
+        """Зарезервировать квоту и зарегистрировать аренду (вызывать под state_lock)"""
+        lease = KeyLease(api_key, model)
+        lease.tokens_reserved = tokens
+        self.limiter.reserve(lease.key_id, model, tokens)
+        self.scheduler.requeue(lease.key_id, model)
+        self.active_leases[lease.key_id] = self.active_leases.get(lease.key_id, 0) + 1
+        self.in_flight.setdefault((lease.key_id, model), []).append(lease)
+        self.last_model = model
+        return lease
+    
+    # ---------- выключатели ----------
+    
+    def set_prober(self, prober, logger=None):
+        """
+        Подключить отправку пробных заявок: prober(lease) делает дешёвый запрос
+        и возвращает аренду через release_lease.
+        """
+        self.prober = prober
+        if logger:
+            self.breakers.logger = logger
+            self.concurrency.logger = logger
+    
+    def _breaker_gate(self, key_id, model):
+        """Ожидание для ключа по его выключателю (вызывается планировщиком)"""
+        wait, probe = self.breakers.key_gate(key_id, queue_probe=self.prober is not None)
+        if probe and self.prober:
+            threading.Thread(target=self._probe_key, args=(key_id, model), daemon=True).start()
+        return wait
+    
+    def model_wait(self, model):
+        """Через сколько секунд модель снова можно использовать (0 - сейчас)"""
+        wait, probe = self.breakers.model_gate(model, queue_probe=self.prober is not None)
+        if probe and self.prober:
+            threading.Thread(target=self._probe_model, args=(model,), daemon=True).start()
+        return wait
+    
+    def daily_quota_exhausted(self, model):
+        """Исчерпана ли суточная квота модели (RPD/TPD) на всех рабочих ключах"""
+        with self.state_lock:
+            key_ids = [
+                key[-8:] for key in self.api_keys
+                if not self.keys_limits.get(key[-8:], {}).get('permanently_invalid', False)
+            ]
         
-        return None
+        return all(self.limiter.blocking_bucket(key_id, model, tokens=1) in ("rpd", "tpd") for key_id in key_ids)
+    
+    def _probe_key(self, key_id, model):
+        with self.state_lock:
+            api_key = next((key for key in self.api_keys if key[-8:] == key_id), None)
+        if not api_key:
+            self.breakers.abort_probe(key_id=key_id)
+            return
+        self._run_probe(self.lease_key(api_key, model, self.PROBE_TOKENS))
+    
+    def _probe_model(self, model):
+        lease = self.acquire_lease(model, self.PROBE_TOKENS)
+        if not lease:
+            self.breakers.abort_probe(model=model)
+            return
+        self._run_probe(lease)
+    
+    def _run_probe(self, lease):
+        try:
+            self.prober(lease)
+        except Exception:
+            pass
+        finally:
+            self.release_lease(lease, "error")
+    
+    def release_lease(self, lease, outcome, headers=None, usage=None):
+        """
+        Вернуть аренду с итогом запроса.
         
-    def update_key_limits(self, api_key, headers):
-        """✅ ИСПРАВЛЕННЫЙ: Обновление лимитов из заголовков API"""
-        key_id = api_key[-8:]
+        outcome: success / invalid / rate_limited / server_error / timeout / error / client_error / cancelled
+        Заголовки ответа (если есть) обновляют лимиты именно этого ключа.
+        usage - TokenUsage ответа: фактические токены идут в статистику и лимитер.
+        """
+        with self.state_lock:
+            # Проверка и отметка - атомарно: гонка двух release (отмена проигравшего хеджа,
+            # finally пробной заявки) не должна дважды вернуть слот и учесть итог
+            if lease.released:
+                return lease
+            lease.finished_at = time.time()
+            lease.outcome = outcome
+            
+            count = self.active_leases.get(lease.key_id, 0) - 1
+            if count > 0:
+                self.active_leases[lease.key_id] = count
+            else:
+                self.active_leases.pop(lease.key_id, None)
+            pending = self._pending_after(lease)
+            
+            if outcome == "invalid":
+                self.mark_key_invalid(lease.api_key)
+            elif headers is not None and outcome in ("success", "rate_limited"):
+                self.update_key_limits(lease.api_key, headers, lease.model, pending)
+            
+            if usage is not None:
+                self._record_usage(lease, usage, corrected=headers is not None)
+            
+            if self.db:
+                self.db.record_event(
+                    lease.started_at, lease.key_id, lease.model, outcome, lease.latency,
+                    usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0
+                )
+            
+            if outcome == "success":
+                self.scheduler.report_latency(lease.key_id, lease.latency)
+            elif outcome == "rate_limited":
+                self.limiter.on_rate_limited(lease.key_id, lease.model, headers, lease.tokens_reserved)
+            
+            # Выключатель: сбойный ключ убирается из выбора до пробной заявки
+            key_state, _ = self.breakers.record(
+                lease.key_id, lease.model, outcome, lease.latency, lease.started_at
+            )
+            if key_state == OPEN:
+                self.scheduler.suspend(lease.key_id, self.breakers.key_open_until(lease.key_id))
+            elif key_state == CLOSED:
+                self.scheduler.resume_key(lease.key_id)
+            
+            # Новый запас квоты → новое место ключа в очереди
+            self.scheduler.refresh(lease.key_id, lease.model)
         
+        if lease.slot:
+            latency = lease.timing.ttfb if lease.timing else lease.latency
+            self.concurrency.release(lease.model, outcome, latency, lease.started_at)
+        
+        return lease
+    
+    def _pending_after(self, lease):
+        """
+        Снять аренду с учёта открытых и вернуть (запросов, токенов) аренд той же
+        пары, открытых позже неё (вызывать под state_lock).
+        
+        Заголовки ответа отражают квоту на момент приёма этого запроса - более
+        поздние запросы в них могли не попасть, и их резерв нельзя затирать.
+        """
+        leases = self.in_flight.get((lease.key_id, lease.model), [])
+        if lease in leases:
+            leases.remove(lease)
+        later = [other for other in leases if other.started_at > lease.started_at]
+        return len(later), sum(other.tokens_reserved for other in later)
+    
+    def _record_usage(self, lease, usage, corrected=False):
+        """
+        Учесть фактические токены ответа (вызывать под state_lock).
+        
+        Резерв лимитера доводится до факта; TPM, уже выставленный по
+        заголовкам этого ответа (corrected), не трогается.
+        """
+        lease.usage = usage
+        data = self._ensure_key_entry(lease.key_id)
+        data['total_tokens_in'] = data.get('total_tokens_in', 0) + usage.prompt_tokens
+        data['total_tokens_out'] = data.get('total_tokens_out', 0) + usage.completion_tokens
+        
+        model_data = data.setdefault('models', {}).setdefault(lease.model, {})
+        model_data['requests'] = model_data.get('requests', 0) + 1
+        model_data['tokens_in'] = model_data.get('tokens_in', 0) + usage.prompt_tokens
+        model_data['tokens_out'] = model_data.get('tokens_out', 0) + usage.completion_tokens
+        
+        self.run_usage.setdefault(lease.model, UsageTotals()).add(usage)
+        
+        names = ("tpd",) if corrected else ("tpm", "tpd")
+        self.limiter.charge_tokens(lease.key_id, lease.model, usage.total_tokens - lease.tokens_reserved, names)
+        self.save_keys_limits(lease.key_id)
+    
+    def begin_run(self):
+        """Начать новый прогон: обнулить его счётчики токенов"""
+        with self.state_lock:
+            self.run_usage = {}
+            self.run_started_at = time.time()
+    
+    def get_run_usage(self):
+        """Расход текущего прогона: {model: {requests, tokens_in, tokens_out, ...}}"""
+        with self.state_lock:
+            return {model: totals.as_dict() for model, totals in self.run_usage.items()}
+    
+    def get_model_usage(self, since=None):
+        """Сводка по моделям за всё время: {model: {requests, tokens_in, tokens_out}}"""
+        if self.db:
+            return self.db.model_totals(since)
+        
+        totals = {}
+        with self.state_lock:
+            for data in self.keys_limits.values():
+                for model, model_data in data.get('models', {}).items():
+                    target = totals.setdefault(model, {"requests": 0, "tokens_in": 0, "tokens_out": 0})
+                    for field in target:
+                        target[field] += model_data.get(field, 0)
+        return totals
+    
+    def _ensure_key_entry(self, key_id):
+        """Создать запись статистики ключа, если её нет (вызывать под state_lock)"""
         if key_id not in self.keys_limits:
             self.keys_limits[key_id] = {
                 "total_requests": 0,
@@ -166,135 +500,170 @@ class KeyManager:
                 "invalid_attempts": 0,
                 "permanently_invalid": False
             }
+        return self.keys_limits[key_id]
+    
+    def update_key_limits(self, api_key, headers, model=None, pending=(0, 0)):
+        """✅ ИСПРАВЛЕННЫЙ: Обновление лимитов из заголовков API (pending - резерв более поздних запросов)"""
+        key_id = api_key[-8:]
+        model = model or self.last_model
         
-        # ✅ КЛЮЧЕВОЕ ИСПРАВЛЕНИЕ: Увеличиваем счётчик запросов!
-        self.keys_limits[key_id]['total_requests'] = self.keys_limits[key_id].get('total_requests', 0) + 1
-        
-        # Сброс invalid_attempts при успешном запросе
-        self.keys_limits[key_id]['invalid_attempts'] = 0
-        
-        # Обновление из заголовков
-        if 'x-ratelimit-remaining-tokens' in headers:
-            remaining_tokens = int(headers['x-ratelimit-remaining-tokens'])
-            limit_tokens = int(headers.get('x-ratelimit-limit-tokens', 14400))
-            self.keys_limits[key_id]['tokens_used_today'] = limit_tokens - remaining_tokens
-        
-        if 'x-ratelimit-remaining-requests' in headers:
-            remaining_requests = int(headers['x-ratelimit-remaining-requests'])
-            limit_requests = int(headers.get('x-ratelimit-limit-requests', 30))
-            self.keys_limits[key_id]['requests_this_minute'] = limit_requests - remaining_requests
+        with self.state_lock:
+            data = self._ensure_key_entry(key_id)
+            
+            # ✅ КЛЮЧЕВОЕ ИСПРАВЛЕНИЕ: Увеличиваем счётчик запросов!
+            data['total_requests'] = data.get('total_requests', 0) + 1
+            
+            # Сброс invalid_attempts при успешном запросе
+            data['invalid_attempts'] = 0
+            
+            # Коррекция bucket'ов лимитера по заголовкам x-ratelimit-*
+            if model:
+                self.limiter.update_from_headers(key_id, model, headers, pending)
+                self._store_buckets(data, key_id, model)
         
-        if 'x-ratelimit-reset-requests' in headers:
-            reset_str = headers['x-ratelimit-reset-requests']
-            reset_seconds = self.parse_reset_time(reset_str)
-            self.keys_limits[key_id]['rpm_reset_at'] = (datetime.now() + timedelta(seconds=reset_seconds)).isoformat()
+        self.save_keys_limits(key_id)
+    
+    def _store_buckets(self, data, key_id, model):
+        """Сохранить снимок bucket'ов модели в статистику ключа (под state_lock)"""
+        buckets = self.limiter.export(key_id, model)
+        data.setdefault('buckets', {})[model] = buckets
         
-        self.save_keys_limits()
+        # Поля для совместимости со старым форматом keys_limits.json
+        data['requests_this_minute'] = max(0, round(buckets['rpm']['capacity'] - buckets['rpm']['tokens']))
+        data['tokens_used_today'] = max(0, round(buckets['tpd']['capacity'] - buckets['tpd']['tokens']))
 
     def parse_reset_time(self, reset_str):
         """Парсинг времени сброса из строки типа '1m30s'"""
-        total_seconds = 0
-        
-        hours = re.search(r'(\d+)h', reset_str)
-        minutes = re.search(r'(\d+)m', reset_str)
-        seconds = re.search(r'([\d.]+)s', reset_str)
-        
-        if hours:
-            total_seconds += int(hours.group(1)) * 3600
-        if minutes:
-            total_seconds += int(minutes.group(1)) * 60
-        if seconds:
-            total_seconds += float(seconds.group(1))
-        
-        return int(total_seconds)
+        return int(parse_duration(reset_str) or 0)
     
     def mark_key_invalid(self, api_key):
         """Отметка ключа как невалидного"""
         key_id = api_key[-8:]
         
-        if key_id not in self.keys_limits:
-            self.keys_limits[key_id] = {
-                "total_requests": 0,
-                "total_tokens_in": 0,
-                "total_tokens_out": 0,
-                "prompts_generated": 0,
-                "files_processed": 0,
-                "errors": 0,
-                "invalid_attempts": 1,
-                "permanently_invalid": False
-            }
-        else:
-            self.keys_limits[key_id]['invalid_attempts'] = self.keys_limits[key_id].get('invalid_attempts', 0) + 1
+        with self.state_lock:
+            data = self._ensure_key_entry(key_id)
+            data['invalid_attempts'] = data.get('invalid_attempts', 0) + 1
+            
+            # После 3 попыток - permanent invalid
+            if data['invalid_attempts'] >= 3:
+                data['permanently_invalid'] = True
+                self.scheduler.exclude(key_id)
         
-        # После 3 попыток - permanent invalid
-        if self.keys_limits[key_id]['invalid_attempts'] >= 3:
-            self.keys_limits[key_id]['permanently_invalid'] = True
+        self.save_keys_limits(key_id)
+    
+    def get_key_status(self, key_id, model=None):
+        """Статус ключа: 'invalid', 'breaker', имя исчерпанного bucket'а ('rpm', 'tpd', ...) или None"""
+        model = model or self.last_model
         
-        self.save_keys_limits()
+        with self.state_lock:
+            if self.keys_limits.get(key_id, {}).get('permanently_invalid', False):
+                return 'invalid'
+        
+        return self._limit_status(key_id, model)
     
-    def get_stats(self):
+    def _limit_status(self, key_id, model):
+        """'breaker', имя исчерпанного bucket'а или None (валидность ключа не проверяется)"""
+        if self.breakers.key_state(key_id) != CLOSED:
+            return 'breaker'
+        
+        if model:
+            return self.limiter.blocking_bucket(key_id, model, tokens=1)
+        return None
+    
+    def get_stats(self, model=None):
         """Получить статистику по всем ключам"""
+        model = model or self.last_model
         active = 0
         on_limit = 0
         inactive = 0
         nearest_reset = None
         
-        for key in self.api_keys:
+        with self.state_lock:
+            api_keys = list(self.api_keys)
+        invalid = self._invalid_key_ids()
+        
+        for key in api_keys:
             key_id = key[-8:]
+            if key_id in invalid:
+                inactive += 1
+                continue
             
-            if key_id in self.keys_limits:
-                data = self.keys_limits[key_id]
-                
-                if data.get('permanently_invalid', False):
-                    inactive += 1
-                elif data.get('tokens_used_today', 0) >= 14400:
-                    on_limit += 1
-                    if data.get('daily_reset_at'):
-                        try:
-                            reset_time = datetime.fromisoformat(data['daily_reset_at'])
-                            if nearest_reset is None or reset_time < nearest_reset:
-                                nearest_reset = reset_time
-                        except:
-                            pass
-                elif data.get('requests_this_minute', 0) >= 30:
-                    on_limit += 1
-                    if data.get('rpm_reset_at'):
-                        try:
-                            reset_time = datetime.fromisoformat(data['rpm_reset_at'])
-                            if nearest_reset is None or reset_time < nearest_reset:
-                                nearest_reset = reset_time
-                        except:
-                            pass
-                else:
-                    active += 1
+            status = self._limit_status(key_id, model)
+            if status:
+                on_limit += 1
+                wait = self.limiter.wait_time(key_id, model, tokens=1)
+                reset_time = datetime.now() + timedelta(seconds=wait)
+                if nearest_reset is None or reset_time < nearest_reset:
+                    nearest_reset = reset_time
             else:
                 active += 1
         
         return active, on_limit, inactive, nearest_reset
     
+    def _invalid_key_ids(self):
+        """
+        Невалидные ключи: SQLite - один запрос по индексу key_state
+        (состояние пишется с задержкой до секунды), JSON - из keys_limits.
+        """
+        if self.db:
+            return self.db.invalid_keys()
+        with self.state_lock:
+            return {key_id for key_id, data in self.keys_limits.items() if data.get('permanently_invalid', False)}
+    
+    def get_usage_totals(self, since=None):
+        """
+        Сводка использования по ключам: {key_id: {requests, errors, tokens_in, tokens_out}}.
+        
+        SQLite - итоги usage_totals (за период since - окно журнала по индексу ts),
+        JSON - накопленные счётчики keys_limits.
+        """
+        if self.db:
+            return self.db.key_totals(since)
+        
+        with self.state_lock:
+            return {
+                key_id: {
+                    "requests": data.get('total_requests', 0),
+                    "errors": data.get('errors', 0),
+                    "tokens_in": data.get('total_tokens_in', 0),
+                    "tokens_out": data.get('total_tokens_out', 0)
+                }
+                for key_id, data in self.keys_limits.items()
+            }
+    
+    def get_request_counts(self, since):
+        """Запросов каждого ключа с момента since: {key_id: n} (только SQLite, иначе None)"""
+        if not self.db:
+            return None
+        return self.db.key_request_counts(since)
+    
     # ✅ НОВЫЕ МЕТОДЫ ДЛЯ ОБНОВЛЕНИЯ СЧЁТЧИКОВ СТАТИСТИКИ
     
+    def _increment(self, api_key, field, amount=1):
+        """Увеличить счётчик статистики ключа"""
+        key_id = api_key[-8:]
+        with self.state_lock:
+            data = self._ensure_key_entry(key_id)
+            data[field] = data.get(field, 0) + amount
+        self.save_keys_limits(key_id)
+    
     def add_prompts_generated(self, api_key, count):
         """Добавить количество сгенерированных промптов"""
-        key_id = api_key[-8:]
-        if key_id in self.keys_limits:
-            self.keys_limits[key_id]['prompts_generated'] = \
-                self.keys_limits[key_id].get('prompts_generated', 0) + count
-            self.save_keys_limits()
+        self._increment(api_key, 'prompts_generated', count)
 
     def add_file_processed(self, api_key):
         """Зафиксировать обработку одного файла"""
-        key_id = api_key[-8:]
-        if key_id in self.keys_limits:
-            self.keys_limits[key_id]['files_processed'] = \
-                self.keys_limits[key_id].get('files_processed', 0) + 1
-            self.save_keys_limits()
+        self._increment(api_key, 'files_processed')
 
     def add_error(self, api_key):
         """Зафиксировать ошибку при обработке"""
-        key_id = api_key[-8:]
-        if key_id in self.keys_limits:
-            self.keys_limits[key_id]['errors'] = \
-                self.keys_limits[key_id].get('errors', 0) + 1
-            self.save_keys_limits()
-
+        self._increment(api_key, 'errors')
+    
+    def reset_all_stats(self):
+        """Сбросить статистику всех ключей"""
+        with self.state_lock:
+            self.keys_limits = {}
+            self._sync_scheduler()
+        if self.db:
+            self.db.delete_all_state()
+        self.save_keys_limits()
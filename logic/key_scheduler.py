@@ -0,0 +1,245 @@
+"""
+Планировщик выбора ключа: приоритетная очередь по запасу квоты.
+
+Для каждой модели ключи лежат в куче, упорядоченной по
+(запас квоты ↓, время до полного сброса ↑, средняя задержка ↑).
+Исчерпанные ключи «паркуются» в отдельной куче до момента,
+когда лимитер их пропустит, и не проверяются на каждом вызове.
+Устаревшие записи куч отбрасываются лениво по номеру версии.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class KeyScheduler:
+    """Выбор лучшего ключа за O(log n)"""
+
+    # Квант запаса квоты: ключи с почти равным запасом сравниваются дальше по сбросу и задержке
+    HEADROOM_STEP = 0.05
+
+    # Сглаживание средней задержки ключа
+    LATENCY_ALPHA = 0.3
+
+    def __init__(self, limiter, gate=None):
+        self.limiter = limiter
+        self.gate = gate        # gate(key_id, model) -> ожидание, сек (выключатель ключа)
+        self.lock = threading.Lock()
+        self.keys = {}          # key_id -> api_key
+        self.excluded = set()   # невалидные ключи
+        self.ready = {}         # model -> куча (приоритет, seq, key_id, version)
+        self.parked = {}        # model -> куча (wake_at, seq, key_id, version)
+        self.versions = {}      # (key_id, model) -> актуальная версия записи
+        self.latency = {}       # key_id -> EWMA задержки, сек
+        self.suspended = {}     # key_id -> до какого момента ключ отключён выключателем
+        self.seq = itertools.count()
+
+    def sync_keys(self, api_keys, invalid_ids=()):
+        """Синхронизировать набор ключей (новые ключи попадают во все кучи)"""
+        with self.lock:
+            current = {key[-8:]: key for key in api_keys}
+            excluded = set(invalid_ids)
+
+            # Новые ключи и ключи, снова ставшие валидными
+            added = [
+                key_id for key_id in current
+                if key_id not in excluded and (key_id not in self.keys or key_id in self.excluded)
+            ]
+            self.keys = current
+            self.excluded = excluded
+
+            for model in self.ready:
+                for key_id in added:
+                    self._push_ready(key_id, model)
+
+    def exclude(self, key_id):
+        """Исключить ключ из выбора (например, невалидный)"""
+        with self.lock:
+            self.excluded.add(key_id)
+
+    def _priority(self, key_id, model):
+        headroom = self.limiter.headroom(key_id, model)
+        bucketed = -int(headroom / self.HEADROOM_STEP)
+        return (bucketed, self.limiter.time_to_full(key_id, model), self.latency.get(key_id, 0.0))
+
+    def _bump(self, key_id, model):
+        pair = (key_id, model)
+        version = self.versions.get(pair, 0) + 1
+        self.versions[pair] = version
+        return version
+
+    def _push_ready(self, key_id, model):
+        version = self._bump(key_id, model)
+        heap = self.ready.setdefault(model, [])
+        heapq.heappush(heap, (self._priority(key_id, model), next(self.seq), key_id, version))
+        self._compact(heap, model)
+
+    def _park(self, key_id, model, wake_at):
+        version = self._bump(key_id, model)
+        heap = self.parked.setdefault(model, [])
+        heapq.heappush(heap, (wake_at, next(self.seq), key_id, version))
+        self._compact(heap, model)
+
+    def _compact(self, heap, model):
+        """
+        Выбросить устаревшие записи, когда их стало больше живых.
+
+        Лениво они уходят только с вершины кучи - запись с худшим приоритетом
+        иначе копилась бы с каждой арендой, и куча росла бы с числом запросов.
+        """
+        if len(heap) > 2 * len(self.keys) + 16:
+            heap[:] = [entry for entry in heap if self._is_current(entry[2], model, entry[3])]
+            heapq.heapify(heap)
+
+    def _is_current(self, key_id, model, version):
+        return (
+            key_id in self.keys
+            and key_id not in self.excluded
+            and self.versions.get((key_id, model)) == version
+        )
+
+    def _ensure_model(self, model):
+        """Первая встреча модели: все ключи в кучу за O(n)"""
+        if model in self.ready:
+            return
+        heap = []
+        for key_id in self.keys:
+            version = self._bump(key_id, model)
+            heap.append((self._priority(key_id, model), next(self.seq), key_id, version))
+        heapq.heapify(heap)
+        self.ready[model] = heap
+
+    def _wake(self, model, now):
+        """Вернуть в работу ключи, чьё время парковки истекло"""
+        parked = self.parked.get(model)
+        while parked and parked[0][0] <= now:
+            _, _, key_id, version = heapq.heappop(parked)
+            if self._is_current(key_id, model, version):
+                self._push_ready(key_id, model)
+
+    def acquire(self, model, tokens=0, exclude=(), min_headroom=0.0):
+        """
+        Взять лучший ключ для модели (или None, если все припаркованы).
+
+        exclude - ключи, которые сейчас брать нельзя (остаются в очереди);
+        min_headroom - не выдавать ключ с меньшим запасом квоты.
+        После резервирования квоты ключ нужно вернуть через requeue().
+        """
+        now = time.time()
+        with self.lock:
+            self._ensure_model(model)
+            self._wake(model, now)
+
+            heap = self.ready[model]
+            skipped = []
+            try:
+                return self._pop_best(heap, model, tokens, now, exclude, min_headroom, skipped)
+            finally:
+                for entry in skipped:
+                    heapq.heappush(heap, entry)
+
+    def _pop_best(self, heap, model, tokens, now, exclude, min_headroom, skipped):
+        while heap:
+            entry = heapq.heappop(heap)
+            _, _, key_id, version = entry
+            if not self._is_current(key_id, model, version):
+                continue
+
+            if key_id in exclude:
+                skipped.append(entry)
+                continue
+            if min_headroom and self.limiter.headroom(key_id, model) < min_headroom:
+                # Куча упорядочена по запасу - у остальных он не больше
+                skipped.append(entry)
+                return None
+
+            wait = max(self.limiter.wait_time(key_id, model, tokens), self._suspended_for(key_id, now))
+            if wait <= 0 and self.gate:
+                wait = self.gate(key_id, model)
+            if wait > 0:
+                self._park(key_id, model, now + wait)
+                continue
+
+            # Ключ выдан: до requeue() он ни в одной куче
+            self._bump(key_id, model)
+            return self.keys[key_id]
+
+        return None
+
+    def _suspended_for(self, key_id, now):
+        until = self.suspended.get(key_id)
+        if until is None:
+            return 0.0
+        if until <= now:
+            del self.suspended[key_id]
+            return 0.0
+        return until - now
+
+    def requeue(self, key_id, model):
+        """Вернуть ключ в очередь с пересчитанным приоритетом"""
+        now = time.time()
+        with self.lock:
+            if key_id not in self.keys or key_id in self.excluded:
+                return
+            # Аренда мимо acquire() (пробная заявка) может прийти раньше первой встречи модели
+            self._ensure_model(model)
+            wait = max(self.limiter.wait_time(key_id, model), self._suspended_for(key_id, now))
+            if wait > 0:
+                self._park(key_id, model, now + wait)
+            else:
+                self._push_ready(key_id, model)
+
+    def suspend(self, key_id, until):
+        """Убрать ключ из выбора по всем моделям до момента until"""
+        with self.lock:
+            if key_id not in self.keys or key_id in self.excluded:
+                return
+            self.suspended[key_id] = until
+            for model in self.ready:
+                self._park(key_id, model, until)
+    
+    def resume_key(self, key_id):
+        """Вернуть ключ в выбор по всем моделям (после успешной пробы)"""
+        with self.lock:
+            self.suspended.pop(key_id, None)
+            models = list(self.ready)
+        for model in models:
+            self.requeue(key_id, model)
+    
+    def refresh(self, key_id, model):
+        """Пересчитать положение ключа после изменения лимитов (429, заголовки)"""
+        with self.lock:
+            if model not in self.ready:
+                return
+        self.requeue(key_id, model)
+
+    def report_latency(self, key_id, latency):
+        """Учесть задержку успешного запроса"""
+        with self.lock:
+            previous = self.latency.get(key_id)
+            if previous is None:
+                self.latency[key_id] = latency
+            else:
+                self.latency[key_id] = previous + self.LATENCY_ALPHA * (latency - previous)
+
+    def next_ready_in(self, model):
+        """Через сколько секунд будет готов хотя бы один ключ (0 - сейчас, None - нет ключей)"""
+        now = time.time()
+        with self.lock:
+            self._ensure_model(model)
+            self._wake(model, now)
+
+            ready = self.ready[model]
+            while ready and not self._is_current(ready[0][2], model, ready[0][3]):
+                heapq.heappop(ready)
+            if ready:
+                return 0.0
+
+            parked = self.parked.get(model, [])
+            while parked and not self._is_current(parked[0][2], model, parked[0][3]):
+                heapq.heappop(parked)
+            if not parked:
+                return None
+            return max(0.0, parked[0][0] - now)
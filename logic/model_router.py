@@ -0,0 +1,146 @@
+"""
+Маршрутизация чанков по цепочке моделей с учётом квот.
+
+Первая модель цепочки - основная (из настроек), остальные - запасные.
+Для каждого чанка строится порядок моделей:
+    - правила: модель пропускается, если чанк длиннее её max_chars
+      или исчерпана её квота запросов на прогон;
+    - модели с открытым выключателем пропускаются;
+    - сначала модели, у которых ключ освободится не позже чем через
+      fallback_wait секунд (в порядке цепочки), затем остальные - по времени
+      до готовности ключа.
+Короткое ожидание RPM/TPM не отдаёт чанк запасной модели: работа перетекает
+на следующую модель, только когда у основной исчерпана суточная квота
+(RPD/TPD) на всех ключах или ключи освободятся позже fallback_wait.
+Какая модель сделала какой файл - пишется в манифест.
+"""
+
+import json
+import os
+import threading
+
+from utils.atomic_store import WriteBehindStore
+
+
+# Итоги, после которых файл сразу отправляется на следующую модель цепочки
+FALLBACK_STATUSES = ("model_unavailable", "invalid_model")
+
+# Итоги, после которых файл уходит на следующую модель, только если у модели нет квоты надолго
+QUOTA_STATUSES = ("no_keys",)
+
+# Итоги последней попытки, означающие нехватку квоты модели
+FALLBACK_OUTCOMES = ("rate_limited",)
+
+
+class ModelRouter:
+    """Порядок моделей для чанка и учёт того, какая модель обработала файл"""
+
+    MANIFEST_NAME = "models.json"
+
+    def __init__(self, key_manager, chain, quotas=None, max_chars=None, manifest_folder=None, logger=None,
+                 fallback_wait=60.0):
+        """
+        chain - модели по приоритету (дубли отбрасываются)
+        quotas - {модель: максимум запросов за прогон} (нет/0 - без ограничения)
+        max_chars - {модель: максимальная длина чанка в символах}
+        manifest_folder - папка, куда пишется models.json ({файл: модель})
+        fallback_wait - ожидание ключа модели (сек), дольше которого чанк уходит на следующую модель
+        """
+        self.key_manager = key_manager
+        self.models = list(dict.fromkeys(model for model in chain if model))
+        self.quotas = quotas or {}
+        self.max_chars = max_chars or {}
+        self.fallback_wait = fallback_wait
+        self.logger = logger
+
+        self.lock = threading.Lock()
+        self.requests = {}      # model -> отправлено запросов за прогон
+        self.assignments = {}   # имя файла -> модель
+
+        self.store = None
+        if manifest_folder:
+            path = os.path.join(manifest_folder, self.MANIFEST_NAME)
+            self.assignments = self._load_manifest(path)
+            self.store = WriteBehindStore(path, self._snapshot, logger=logger)
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    @staticmethod
+    def _load_manifest(path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _snapshot(self):
+        with self.lock:
+            return json.dumps(self.assignments, indent=2, ensure_ascii=False)
+
+    def _allowed(self, model, text):
+        """Правила цепочки: длина чанка и квота модели на прогон"""
+        limit = self.max_chars.get(model)
+        if limit and len(text) > limit:
+            return False
+        quota = self.quotas.get(model)
+        if quota and self.requests.get(model, 0) >= quota:
+            return False
+        return self.key_manager.model_wait(model) <= 0
+
+    def candidates(self, text):
+        """Модели для чанка в порядке попыток (пусто - ни одна модель не подходит)"""
+        with self.lock:
+            allowed = [model for model in self.models if self._allowed(model, text)]
+
+        waits = {model: self._quota_wait(model) for model in allowed}
+        ready = [model for model in allowed if waits[model] <= self.fallback_wait]
+        waiting = sorted((model for model in allowed if waits[model] > self.fallback_wait), key=lambda model: waits[model])
+        return ready + waiting
+
+    def _quota_wait(self, model):
+        """Через сколько секунд у модели будет ключ (inf - суточная квота исчерпана или ключей нет)"""
+        wait = self.key_manager.scheduler.next_ready_in(model)
+        if wait is None or (wait > 0 and self.key_manager.daily_quota_exhausted(model)):
+            return float('inf')
+        return wait
+
+    def should_fallback(self, result, model):
+        """Отправить ли файл на следующую модель после такого итога model"""
+        if result.status in FALLBACK_STATUSES:
+            return True
+        short_of_quota = result.status in QUOTA_STATUSES or (
+            result.status == "failed" and result.lease is not None and result.lease.outcome in FALLBACK_OUTCOMES
+        )
+        return short_of_quota and self._quota_wait(model) > self.fallback_wait
+
+    def note_request(self, model):
+        """Учесть запрос к модели в её квоте"""
+        with self.lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+
+    def record(self, file_name, model):
+        """Запомнить, какая модель сделала файл"""
+        with self.lock:
+            self.assignments[file_name] = model
+        if self.store:
+            self.store.mark_dirty()
+
+    def get_stats(self):
+        """Сколько файлов сделала каждая модель: {model: files}"""
+        with self.lock:
+            stats = {}
+            for model in self.assignments.values():
+                stats[model] = stats.get(model, 0) + 1
+            return stats
+
+    def close(self):
+        """Дописать манифест"""
+        if self.store:
+            self.store.close()
@@ -0,0 +1,325 @@
+"""
+Лимитер запросов: четыре token bucket (RPM, TPM, RPD, TPD) на пару (ключ, модель).
+
+Начальные значения берутся из MODEL_LIMITS, затем корректируются
+по заголовкам x-ratelimit-* каждого ответа Groq:
+    x-ratelimit-limit-requests / remaining-requests / reset-requests → RPD
+    x-ratelimit-limit-tokens   / remaining-tokens   / reset-tokens   → TPM
+"""
+
+import re
+import threading
+import time
+
+from logic.model_limits import MODEL_LIMITS
+
+
+# Лимиты для моделей, которых нет в MODEL_LIMITS (самые строгие из бесплатных)
+DEFAULT_LIMITS = {"rpm": 30, "tpm": 6000, "rpd": 1000, "tpd": 100000}
+
+# Период восстановления каждого bucket в секундах
+BUCKET_PERIODS = {"rpm": 60, "tpm": 60, "rpd": 86400, "tpd": 86400}
+
+# Какой bucket описывают заголовки Groq
+HEADER_BUCKETS = {"requests": "rpd", "tokens": "tpm"}
+
+
+def parse_duration(value):
+    """Парсинг длительности Groq ('1m30s', '7.66s', '2h0m1s', '120ms') в секунды"""
+    if value is None:
+        return None
+
+    value = str(value).strip()
+    if not value:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        matched = True
+        amount = float(amount)
+        if unit == 'h':
+            total += amount * 3600
+        elif unit == 'm':
+            total += amount * 60
+        elif unit == 's':
+            total += amount
+        else:
+            total += amount / 1000
+
+    return total if matched else None
+
+
+class TokenBucket:
+    """Token bucket с линейным восстановлением и подсказкой сброса от сервера"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.tokens = float(capacity)
+        self.updated_at = time.time()
+        self.reset_at = None
+        self.blocked_until = None   # retry-after: до этого момента bucket не пополняется
+
+    @property
+    def rate(self):
+        """Скорость восстановления (единиц в секунду)"""
+        return self.capacity / self.period if self.period > 0 else float('inf')
+
+    def _refill(self, now):
+        if self.blocked_until is not None:
+            if now < self.blocked_until:
+                self.updated_at = now
+                return
+            self.blocked_until = None
+        if self.reset_at is not None and now >= self.reset_at:
+            # Сервер обещал полный сброс к этому моменту
+            self.tokens = self.capacity
+            self.reset_at = None
+        elif now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self, now=None):
+        """Сколько единиц доступно сейчас"""
+        self._refill(now or time.time())
+        return self.tokens
+
+    def time_until(self, amount=1, now=None):
+        """Через сколько секунд можно будет потратить amount единиц (0 - сейчас)"""
+        now = now or time.time()
+        self._refill(now)
+
+        # Запрос больше ёмкости пройдёт только на полном bucket
+        amount = min(float(amount), self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+
+        if self.blocked_until is not None:
+            return self.blocked_until - now + max(0.0, amount - self.tokens) / self.rate
+        refill = (amount - self.tokens) / self.rate
+        if self.reset_at is not None:
+            # До обещанного сброса bucket пополняется как обычно - нужные единицы могут прийти раньше
+            return min(refill, max(0.0, self.reset_at - now))
+        return refill
+
+    def time_to_full(self, now=None):
+        """Через сколько секунд bucket полностью восстановится"""
+        now = now or time.time()
+        self._refill(now)
+        if self.tokens >= self.capacity:
+            return 0.0
+        if self.blocked_until is not None:
+            return self.blocked_until - now + (self.capacity - self.tokens) / self.rate
+        refill = (self.capacity - self.tokens) / self.rate
+        if self.reset_at is not None:
+            return min(refill, max(0.0, self.reset_at - now))
+        return refill
+
+    def consume(self, amount=1, now=None):
+        """Списать amount единиц (уход в минус допустим - это долг)"""
+        self._refill(now or time.time())
+        self.tokens -= amount
+
+    def correct(self, remaining, limit=None, reset_seconds=None, now=None):
+        """Скорректировать состояние по данным сервера"""
+        now = now or time.time()
+        if limit is not None and limit > 0:
+            self.capacity = float(limit)
+        self.tokens = min(float(remaining), self.capacity)
+        self.updated_at = now
+        if reset_seconds is not None and self.tokens < self.capacity:
+            self.reset_at = now + reset_seconds
+        else:
+            self.reset_at = None
+
+    def block(self, seconds, now=None):
+        """Опустошить bucket и не пополнять его seconds секунд (retry-after сервера)"""
+        now = now or time.time()
+        self.tokens = min(self.tokens, 0.0)
+        self.updated_at = now
+        self.blocked_until = now + seconds
+
+    def headroom(self, now=None):
+        """Доля оставшейся ёмкости (0..1)"""
+        if self.capacity <= 0:
+            return 0.0
+        return max(0.0, self.available(now) / self.capacity)
+
+    def export(self):
+        return {
+            "capacity": self.capacity,
+            "tokens": self.tokens,
+            "updated_at": self.updated_at,
+            "reset_at": self.reset_at,
+            "blocked_until": self.blocked_until
+        }
+
+    def restore(self, data):
+        self.capacity = float(data.get("capacity", self.capacity))
+        self.tokens = float(data.get("tokens", self.capacity))
+        self.updated_at = float(data.get("updated_at", time.time()))
+        self.reset_at = data.get("reset_at")
+        self.blocked_until = data.get("blocked_until")
+
+
+class RateLimiter:
+    """Набор bucket'ов RPM/TPM/RPD/TPD для каждой пары (ключ, модель)"""
+
+    def __init__(self, model_limits=None):
+        self.model_limits = model_limits if model_limits is not None else MODEL_LIMITS
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _limits_for(self, model):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update({
+            name: value for name, value in self.model_limits.get(model, {}).items()
+            if name in BUCKET_PERIODS
+        })
+        return limits
+
+    def _get(self, key_id, model):
+        """Bucket'ы пары (ключ, модель), создаются по MODEL_LIMITS (вызывать под lock)"""
+        pair = (key_id, model)
+        buckets = self.buckets.get(pair)
+        if buckets is None:
+            limits = self._limits_for(model)
+            buckets = {
+                name: TokenBucket(limits[name], period)
+                for name, period in BUCKET_PERIODS.items()
+            }
+            self.buckets[pair] = buckets
+        return buckets
+
+    def wait_time(self, key_id, model, tokens=0):
+        """Через сколько секунд ключ сможет отправить запрос на tokens токенов (O(1))"""
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            return max(
+                buckets["rpm"].time_until(1, now),
+                buckets["rpd"].time_until(1, now),
+                buckets["tpm"].time_until(tokens, now) if tokens else 0.0,
+                buckets["tpd"].time_until(tokens, now) if tokens else 0.0,
+            )
+
+    def blocking_bucket(self, key_id, model, tokens=0):
+        """Имя bucket'а, который сейчас не пускает запрос (или None)"""
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            for name in ("rpd", "tpd", "rpm", "tpm"):
+                amount = 1 if name in ("rpm", "rpd") else tokens
+                if amount and buckets[name].time_until(amount, now) > 0:
+                    return name
+        return None
+
+    def can_send(self, key_id, model, tokens=0):
+        return self.wait_time(key_id, model, tokens) <= 0
+
+    def reserve(self, key_id, model, tokens=0):
+        """Списать один запрос и ожидаемые токены перед отправкой"""
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            buckets["rpm"].consume(1, now)
+            buckets["rpd"].consume(1, now)
+            if tokens:
+                buckets["tpm"].consume(tokens, now)
+                buckets["tpd"].consume(tokens, now)
+
+    def charge_tokens(self, key_id, model, tokens, names=("tpm", "tpd")):
+        """Доначислить (или вернуть при tokens < 0) токены по факту ответа"""
+        if not tokens:
+            return
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            for name in names:
+                buckets[name].consume(tokens, now)
+
+    def update_from_headers(self, key_id, model, headers, pending=(0, 0)):
+        """
+        Скорректировать bucket'ы по заголовкам x-ratelimit-*.
+
+        pending - (запросов, токенов) отправленных позже и ещё не учтённых сервером:
+        их резерв вычитается из присланного остатка.
+        """
+        now = time.time()
+        pending_requests, pending_tokens = pending
+        with self.lock:
+            buckets = self._get(key_id, model)
+            for suffix, name in HEADER_BUCKETS.items():
+                remaining = headers.get(f'x-ratelimit-remaining-{suffix}')
+                if remaining is None:
+                    continue
+                try:
+                    remaining = float(remaining)
+                    limit = headers.get(f'x-ratelimit-limit-{suffix}')
+                    limit = float(limit) if limit is not None else None
+                except (TypeError, ValueError):
+                    continue
+                reset_seconds = parse_duration(headers.get(f'x-ratelimit-reset-{suffix}'))
+                bucket = buckets[name]
+                unseen = pending_requests if suffix == "requests" else pending_tokens
+                if unseen and reset_seconds is not None:
+                    reset_seconds += unseen / bucket.rate
+                bucket.correct(remaining - unseen, limit, reset_seconds, now)
+
+    def on_rate_limited(self, key_id, model, headers=None, tokens=0):
+        """
+        429: ключ не отправляет запросы до retry-after (или до пополнения RPM).
+
+        Без retry-after причиной мог быть TPM: если по x-ratelimit-remaining-tokens
+        запрос в tokens токенов не помещался, TPM блокируется до x-ratelimit-reset-tokens -
+        иначе ключ тут же выбрали бы снова и получили тот же 429.
+        """
+        headers = headers or {}
+        retry_after = parse_duration(headers.get('retry-after'))
+        tokens_reset = parse_duration(headers.get('x-ratelimit-reset-tokens'))
+        try:
+            tokens_left = float(headers['x-ratelimit-remaining-tokens'])
+        except (KeyError, TypeError, ValueError):
+            tokens_left = None
+
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            rpm = buckets["rpm"]
+            if retry_after is not None:
+                rpm.block(retry_after, now)
+                return
+            rpm.correct(0, None, rpm.period / rpm.capacity, now)
+            if tokens_left is not None and tokens_reset is not None and tokens_left < max(tokens, 1):
+                buckets["tpm"].block(tokens_reset, now)
+
+    def headroom(self, key_id, model):
+        """Минимальная доля оставшейся квоты по всем bucket'ам (0..1)"""
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            return min(bucket.headroom(now) for bucket in buckets.values())
+
+    def time_to_full(self, key_id, model):
+        """Через сколько секунд все bucket'ы пары восстановятся полностью"""
+        now = time.time()
+        with self.lock:
+            buckets = self._get(key_id, model)
+            return max(bucket.time_to_full(now) for bucket in buckets.values())
+
+    def export(self, key_id, model):
+        with self.lock:
+            return {name: bucket.export() for name, bucket in self._get(key_id, model).items()}
+
+    def restore(self, key_id, model, data):
+        with self.lock:
+            buckets = self._get(key_id, model)
+            for name, bucket_data in (data or {}).items():
+                if name in buckets:
+                    buckets[name].restore(bucket_data)
@@ -0,0 +1,219 @@
+"""
+Дисковый кэш ответов Groq с адресацией по содержимому.
+
+Ключ - sha256 от (модель, system prompt, текст, температура, метка запроса),
+поэтому повторный прогон тех же чанков не уходит в API. Одинаковые запросы,
+отправленные одновременно, выполняются один раз (single-flight): остальные
+ждут результат первого.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.atomic_store import atomic_write_json
+
+
+class ResponseCache:
+    """Кэш ответов в папке: по файлу на ключ, вытеснение по возрасту и размеру"""
+
+    # Проверять размер кэша раз в N записей
+    EVICT_EVERY = 200
+
+    def __init__(self, folder="cache/responses", max_bytes=500 * 1024 * 1024, max_age_seconds=30 * 86400,
+                 logger=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.logger = logger
+
+        self.lock = threading.Lock()
+        self.inflight = {}          # ключ -> threading.Event лидера
+        self.async_inflight = {}    # ключ -> asyncio.Future лидера
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.folder, exist_ok=True)
+        threading.Thread(target=self.evict, daemon=True, name="response-cache-evict").start()
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    @staticmethod
+    def make_key(model, system_prompt, user_message, temperature, tag=None):
+        """Ключ кэша по содержимому запроса"""
+        material = json.dumps(
+            [model, system_prompt, user_message, float(temperature), tag],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.json")
+
+    # ---------- чтение / запись ----------
+
+    def get(self, key):
+        """Ответ из кэша или None (просроченная запись удаляется)"""
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if self.max_age_seconds and age > self.max_age_seconds:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                response = json.load(f).get('response')
+        except (OSError, ValueError):
+            return None
+
+        # Отметка использования для вытеснения давно не нужных записей
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return response
+
+    def put(self, key, response, model=None):
+        """Сохранить ответ"""
+        try:
+            atomic_write_json(self._path(key), {
+                'key': key,
+                'model': model,
+                'created_at': time.time(),
+                'response': response
+            }, ensure_ascii=False)
+        except OSError as e:
+            self.log(f"⚠️ Не удалось записать кэш ответа: {str(e)}", "warning")
+            return
+
+        with self.lock:
+            self.puts += 1
+            evict = self.puts % self.EVICT_EVERY == 0
+        if evict:
+            threading.Thread(target=self.evict, daemon=True, name="response-cache-evict").start()
+
+    def discard(self, key):
+        """Удалить запись (ответ оказался негодным - повтор должен уйти в API)"""
+        if self._remove(self._path(key)):
+            self.log("🗑️ Негодный ответ удалён из кэша", "info")
+
+    def evict(self):
+        """Удалить просроченные записи и самые старые сверх лимита размера"""
+        now = time.time()
+        entries = []
+        total = 0
+        removed = 0
+
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self.max_age_seconds and now - stat.st_mtime > self.max_age_seconds:
+                    removed += self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if self.max_bytes and total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                removed += self._remove(path)
+                total -= size
+
+        if removed:
+            self.log(f"🧹 Кэш ответов: удалено записей {removed}", "info")
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    # ---------- single-flight ----------
+
+    def get_or_load(self, key, loader, model=None):
+        """
+        Ответ из кэша или от loader() (None - неудача, не кэшируется).
+
+        Одновременные вызовы с одним ключом ждут первого; если он не удался,
+        следующий пробует сам. Возвращает (ответ, из кэша ли).
+        """
+        while True:
+            response = self.get(key)
+            if response is not None:
+                self._count(hit=True)
+                return response, True
+
+            with self.lock:
+                waiter = self.inflight.get(key)
+                if waiter is None:
+                    event = threading.Event()
+                    self.inflight[key] = event
+
+            if waiter is not None:
+                waiter.wait()
+                continue
+
+            try:
+                self._count(hit=False)
+                response = loader()
+                if response is not None:
+                    self.put(key, response, model)
+                return response, False
+            finally:
+                with self.lock:
+                    self.inflight.pop(key, None)
+                event.set()
+
+    async def get_or_load_async(self, key, loader, model=None):
+        """Асинхронный get_or_load: loader - корутинная функция"""
+        while True:
+            response = self.get(key)
+            if response is not None:
+                self._count(hit=True)
+                return response, True
+
+            waiter = self.async_inflight.get(key)
+            if waiter is not None and not waiter.done():
+                await asyncio.shield(waiter)
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            self.async_inflight[key] = future
+            try:
+                self._count(hit=False)
+                response = await loader()
+                if response is not None:
+                    self.put(key, response, model)
+                return response, False
+            finally:
+                if self.async_inflight.get(key) is future:
+                    del self.async_inflight[key]
+                future.set_result(None)
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "puts": self.puts}
@@ -0,0 +1,122 @@
+"""
+Политики повторов запросов к Groq.
+
+Для каждого класса ошибки своя политика:
+    rate_limited / invalid - ошибка конкретного ключа: повтор сразу на другом
+                             готовом ключе, иначе ровно до освобождения ближайшего
+    server_error / timeout / connection_error / error - экспоненциальная пауза
+                             с полным джиттером, retry-after сервера соблюдается
+    client_error (прочие 4xx) - запрос некорректен, повтор бесполезен
+
+Общее число повторов на задание ограничено RetryBudget.
+"""
+
+import random
+import threading
+
+from logic.rate_limiter import parse_duration
+
+
+class RetryPolicy:
+    """Политика повторов для одного класса ошибок"""
+
+    def __init__(self, retry=True, base=1.0, cap=30.0, switch_key=False, honor_retry_after=True):
+        self.retry = retry
+        self.base = base
+        self.cap = cap
+        self.switch_key = switch_key
+        self.honor_retry_after = honor_retry_after
+
+    def backoff(self, attempt, headers=None, rng=random):
+        """Экспоненциальная пауза с полным джиттером, но не меньше retry-after сервера"""
+        ceiling = min(self.cap, self.base * (2 ** attempt))
+        delay = rng.uniform(0, ceiling)
+
+        if self.honor_retry_after and headers is not None:
+            hint = parse_duration(headers.get('retry-after'))
+            if hint is not None:
+                delay = max(delay, hint)
+
+        return delay
+
+
+DEFAULT_POLICIES = {
+    "rate_limited": RetryPolicy(base=1.0, cap=15.0, switch_key=True),
+    "invalid": RetryPolicy(base=0.0, cap=0.0, switch_key=True),
+    "server_error": RetryPolicy(base=0.5, cap=8.0),
+    "timeout": RetryPolicy(base=1.0, cap=10.0),
+    "connection_error": RetryPolicy(base=1.0, cap=10.0),
+    "client_error": RetryPolicy(retry=False),
+    "error": RetryPolicy(base=1.0, cap=10.0),
+}
+
+
+class RetryBudget:
+    """Общий бюджет повторов на задание (потокобезопасный)"""
+
+    def __init__(self, retries):
+        self.retries = retries
+        self.used = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_files(cls, files_count, per_file=0.5, minimum=10):
+        """Бюджет по числу файлов задания"""
+        return cls(max(minimum, int(files_count * per_file)))
+
+    def take(self):
+        """Списать один повтор (False - бюджет исчерпан)"""
+        with self.lock:
+            if self.used >= self.retries:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def exhausted(self):
+        return self.used >= self.retries
+
+
+class RetryEngine:
+    """Решает, повторять ли запрос и сколько ждать"""
+
+    def __init__(self, key_manager, policies=None, max_wait=60.0, rng=None):
+        self.key_manager = key_manager
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.max_wait = max_wait
+        self.rng = rng or random.Random()
+
+    @staticmethod
+    def retry_class(outcome, status_code=None):
+        """Класс ошибки для выбора политики"""
+        if outcome == "error" and status_code is not None and 400 <= status_code < 500:
+            return "client_error"
+        return outcome
+
+    def policy_for(self, outcome, status_code=None):
+        return self.policies.get(self.retry_class(outcome, status_code), self.policies["error"])
+
+    def next_delay(self, outcome, attempt, model, status_code=None, headers=None, budget=None):
+        """Пауза перед следующей попыткой в секундах (None - не повторять)"""
+        policy = self.policy_for(outcome, status_code)
+        if not policy.retry:
+            return None
+
+        if policy.switch_key:
+            # Ошибка ключа: ждать имеет смысл только до освобождения ближайшего ключа
+            ready_in = self.key_manager.scheduler.next_ready_in(model)
+            if ready_in is None:
+                return None
+            delay = ready_in
+            if delay > 0:
+                # Разносим воркеры, ждущие один и тот же ключ
+                delay += self.rng.uniform(0, policy.base)
+        else:
+            delay = policy.backoff(attempt, headers, self.rng)
+
+        if delay > self.max_wait:
+            return None
+        if budget is not None and not budget.take():
+            return None
+        return delay
@@ -0,0 +1,273 @@
+"""
+Отложенные повторы файлов на уровне задания (этап 2).
+
+Файл, который не удалось обработать за попытки внутри send_request
+(failed / no_keys / model_unavailable / parse_error / exception), не теряется
+и не держит воркер в паузах: он встаёт в очередь повторов с остыванием - не
+раньше, чем через cooldown * номер повтора, и не раньше, чем у модели
+освободится ключ (сброс квоты) и закроется её выключатель. Готовые повторы воркеры берут раньше новых файлов, а когда новые
+кончились - ждут ближайший повтор. После max_attempts отложенных повторов
+файл попадает в список отказов (failed.json в папке промптов) с причиной;
+успешная обработка убирает файл из этого списка.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+from utils.atomic_store import atomic_write_json
+
+
+# Итоги, после которых файл откладывается на повтор
+RETRY_STATUSES = ("failed", "no_keys", "model_unavailable", "parse_error", "exception")
+
+
+class DeadLetters:
+    """Список отказов: {имя файла: причина, число попыток, время}"""
+
+    FILE_NAME = "failed.json"
+
+    def __init__(self, folder, logger=None):
+        self.path = os.path.join(folder, self.FILE_NAME)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.changed = False
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def add(self, file_path, status, attempts):
+        with self.lock:
+            self.entries[file_path.name] = {"status": status, "attempts": attempts, "at": time.time()}
+            self.changed = True
+
+    def discard(self, file_path):
+        with self.lock:
+            if self.entries.pop(file_path.name, None) is not None:
+                self.changed = True
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def save(self):
+        """Записать список (пустой список удаляет файл)"""
+        with self.lock:
+            if not self.changed:
+                return
+            entries = dict(self.entries)
+            self.changed = False
+
+        try:
+            if entries:
+                atomic_write_json(self.path, entries, indent=2, ensure_ascii=False)
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError as e:
+            self.log(f"⚠️ Не удалось записать {self.path}: {e}", "warning")
+
+
+class DeferredRetryQueue:
+    """Очередь пакетов задания: новые пакеты + отложенные повторы отдельных файлов (потокобезопасно)"""
+
+    def __init__(self, packs, key_manager=None, models=(), max_attempts=2, cooldown=10.0, dead_letters=None,
+                 logger=None):
+        """
+        packs - [[(index, file_path)]] из FileProcessor.plan_packs
+        models - модели задания: остывание не короче ожидания их ключей
+        max_attempts - сколько раз файл откладывается, прежде чем попасть в отказы
+        """
+        self.fresh = iter(packs)
+        self.key_manager = key_manager
+        self.models = [model for model in models if model]
+        self.max_attempts = max_attempts
+        self.cooldown = cooldown
+        self.dead_letters = dead_letters
+        self.logger = logger
+
+        self.condition = threading.Condition()
+        self.deferred = []          # куча (готов в, seq, index, file_path, статус)
+        self.seq = itertools.count()
+        self.attempts = {}          # index -> сделано отложенных повторов
+        self.in_flight = 0
+        self.listeners = {}
+        self.listener_seq = itertools.count()
+
+    @classmethod
+    def for_job(cls, packs, job, key_manager=None, logger=None):
+        """Очередь для задания исполнителя: забирает из job deferred_retries / deferred_retry_cooldown"""
+        router = job.get('router')
+        models = router.models if router else [job.get('model')]
+        output_folder = job.get('output_folder')
+        return cls(
+            packs, key_manager, models,
+            max_attempts=job.pop('deferred_retries', 0),
+            cooldown=job.pop('deferred_retry_cooldown', 10.0),
+            dead_letters=DeadLetters(output_folder, logger) if output_folder else None,
+            logger=logger
+        )
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def poll(self):
+        """
+        Следующий пакет без ожидания → (pack, wait).
+
+        pack - что обработать сейчас; иначе wait - сколько ждать ближайшего
+        повтора (inf - ждать завершения пакетов в работе), None - всё сделано.
+        """
+        with self.condition:
+            return self._poll()
+
+    def _poll(self):
+        now = time.time()
+        if self.deferred and self.deferred[0][0] <= now:
+            _, _, index, file_path, _ = heapq.heappop(self.deferred)
+            self.in_flight += 1
+            return [(index, file_path)], 0.0
+
+        pack = next(self.fresh, None)
+        if pack is not None:
+            self.in_flight += 1
+            return pack, 0.0
+
+        if self.deferred:
+            return None, self.deferred[0][0] - now
+        if self.in_flight:
+            return None, math.inf
+        return None, None
+
+    def take(self, cancel=None):
+        """Дождаться следующего пакета (None - всё сделано или прогон отменён)"""
+        unregister = cancel.on_cancel(self._wake) if cancel is not None else None
+        try:
+            with self.condition:
+                while cancel is None or not cancel.cancelled:
+                    pack, wait = self._poll()
+                    if pack is not None or wait is None:
+                        return pack
+                    self.condition.wait(None if wait == math.inf else wait)
+                return None
+        finally:
+            if unregister:
+                unregister()
+
+    def _wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def on_change(self, callback):
+        """
+        Вызывать callback, когда пакет завершён (появились повторы или всё сделано) - ожидание в event loop.
+
+        Возвращает функцию отписки.
+        """
+        with self.condition:
+            token = next(self.listener_seq)
+            self.listeners[token] = callback
+
+        def unregister():
+            with self.condition:
+                self.listeners.pop(token, None)
+        return unregister
+
+    def complete(self, pack, results):
+        """
+        Итоги пакета → [(index, успех, статус)] окончательных итогов.
+
+        Файлы с итогом из RETRY_STATUSES, у которых остались повторы,
+        откладываются и в окончательные итоги не попадают.
+        """
+        final = []
+        deferred = []
+        with self.condition:
+            for (index, file_path), (success, status) in zip(pack, results):
+                attempt = self.attempts.get(index, 0)
+                if not success and status in RETRY_STATUSES and attempt < self.max_attempts:
+                    self.attempts[index] = attempt + 1
+                    deferred.append((index, file_path, status, attempt + 1))
+                else:
+                    final.append((index, file_path, success, status))
+
+        delays = [self._cooldown(attempt) for _, _, _, attempt in deferred]
+
+        # Пакет уходит из работы вместе с появлением его повторов - иначе воркер решит, что всё сделано
+        with self.condition:
+            for (index, file_path, status, _), delay in zip(deferred, delays):
+                heapq.heappush(self.deferred, (time.time() + delay, next(self.seq), index, file_path, status))
+            self.in_flight -= 1
+            self.condition.notify_all()
+            listeners = list(self.listeners.values())
+
+        for callback in listeners:
+            callback()
+
+        for (_, file_path, status, attempt), delay in zip(deferred, delays):
+            self.log(f"🔁 {file_path.name}: {status}, повтор #{attempt} через {delay:.0f} с", "warning")
+
+        for index, file_path, success, status in final:
+            self._record(index, file_path, success, status)
+        return [(index, success, status) for index, _, success, status in final]
+
+    def _cooldown(self, attempt):
+        """Остывание перед повтором: растёт с номером повтора и не короче ожидания модели и ключа"""
+        delay = self.cooldown * attempt
+        if self.key_manager is not None:
+            waits = []
+            for model in self.models:
+                ready_in = self.key_manager.scheduler.next_ready_in(model)
+                if ready_in is not None:
+                    waits.append(max(ready_in, self.key_manager.model_wait(model)))
+            if waits:
+                delay = max(delay, min(waits))
+        return delay
+
+    def _record(self, index, file_path, success, status):
+        if self.dead_letters is None or status == "cancelled":
+            return
+        if success:
+            self.dead_letters.discard(file_path)
+        else:
+            self.dead_letters.add(file_path, status, self.attempts.get(index, 0) + 1)
+
+    def drain(self):
+        """Прогон остановлен: отложенные файлы → [(index, успех, статус)] с их последним итогом"""
+        with self.condition:
+            leftover = [heapq.heappop(self.deferred) for _ in range(len(self.deferred))]
+
+        final = []
+        for _, _, index, file_path, status in leftover:
+            self._record(index, file_path, False, status)
+            final.append((index, False, status))
+        return final
+
+    def close(self):
+        """Записать список отказов"""
+        if self.dead_letters is None:
+            return
+        self.dead_letters.save()
+        if len(self.dead_letters):
+            self.log(f"⚠️ Необработанных файлов: {len(self.dead_letters)} (см. {self.dead_letters.path})", "warning")
@@ -0,0 +1,144 @@
+"""
+Журнал прогона этапа 2 для продолжения после перезапуска.
+
+journal.jsonl в папке промптов - только дописывается, по строке на итог файла:
+    chunk  - имя чанка
+    input  - sha256 текста чанка
+    config - отпечаток настроек, влияющих на ответ (промпт, модели, температура, n)
+    output - sha256 сохранённых промптов (у неуспешных - null)
+    status - итог обработки
+При открытии журнал читается в словарь {чанк: последняя запись}, поэтому
+проверка «файл уже готов» - поиск по словарю и хэш двух маленьких файлов.
+Файл пропускается, только если чанк, настройки и выходной файл не менялись;
+изменённые чанки и файлы, сделанные с другим промптом или моделью, делаются заново.
+Оборванная при сбое последняя строка игнорируется.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.atomic_store import atomic_write_text
+
+
+def file_digest(path):
+    """sha256 содержимого файла (None - файла нет)"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class RunJournal:
+    """Журнал итогов по чанкам одной папки промптов (потокобезопасно)"""
+
+    FILE_NAME = "journal.jsonl"
+
+    def __init__(self, output_folder, fingerprint, logger=None):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, self.FILE_NAME)
+        self.fingerprint = fingerprint
+        self.logger = logger
+
+        self.lock = threading.Lock()
+        self.records, lines = self._load()
+        self.input_hashes = {}      # имя чанка -> хэш, посчитанный в split()
+
+        # Журнал разросся повторами одних и тех же чанков - переписать последними записями
+        if lines > 2 * len(self.records) + 100:
+            self._compact()
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    @staticmethod
+    def fingerprint_job(job):
+        """Отпечаток настроек задания, от которых зависит ответ (с промптом проверки - для конвейера 1→2→3)"""
+        router = job.get('router')
+        models = router.models if router else [job.get('model')]
+        material = [job.get('system_prompt'), models, float(job.get('temperature', 0)), job.get('prompts_count')]
+        if job.get('verification_prompt'):
+            material.append(job['verification_prompt'])
+        material = json.dumps(material, ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
+    def _load(self):
+        """{чанк: последняя запись} и число строк журнала"""
+        records = {}
+        lines = 0
+        if not os.path.exists(self.path):
+            return records, lines
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    records[record.get('chunk')] = record
+        except OSError as e:
+            self.log(f"⚠️ Не удалось прочитать журнал {self.path}: {e}", "warning")
+        return records, lines
+
+    def _compact(self):
+        text = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self.records.values())
+        try:
+            atomic_write_text(self.path, text)
+        except OSError as e:
+            self.log(f"⚠️ Не удалось сжать журнал {self.path}: {e}", "warning")
+
+    def is_done(self, file_path):
+        """Готов ли файл: успех с теми же настройками, тот же чанк и нетронутый выходной файл"""
+        record = self.records.get(file_path.name)
+        if not record or record.get('status') != "success" or record.get('config') != self.fingerprint:
+            return False
+
+        input_hash = file_digest(file_path)
+        self.input_hashes[file_path.name] = input_hash
+        if input_hash is None or record.get('input') != input_hash:
+            return False
+        return file_digest(os.path.join(self.output_folder, file_path.name)) == record.get('output')
+
+    def split(self, files):
+        """[(index, file_path)] → (что обработать, индексы готовых файлов)"""
+        todo = []
+        done = []
+        for index, file_path in files:
+            if self.is_done(file_path):
+                done.append(index)
+            else:
+                todo.append((index, file_path))
+
+        if done:
+            self.log(f"♻️ Журнал: пропущено готовых файлов {len(done)}, к обработке {len(todo)}", "info")
+        return todo, done
+
+    def record(self, file_path, success, status):
+        """Дописать итог файла (отмена не записывается - файл просто не готов)"""
+        if status == "cancelled":
+            return
+
+        input_hash = self.input_hashes.get(file_path.name) or file_digest(file_path)
+        output_hash = file_digest(os.path.join(self.output_folder, file_path.name)) if success else None
+        record = {
+            "chunk": file_path.name, "input": input_hash, "config": self.fingerprint,
+            "output": output_hash, "status": status, "at": time.time()
+        }
+
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.records[file_path.name] = record
+            try:
+                os.makedirs(self.output_folder, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                self.log(f"⚠️ Не удалось записать журнал {self.path}: {e}", "warning")
@@ -0,0 +1,206 @@
+"""
+Потоковый конвейер этапов 1 → 2 → 3.
+
+Чанки из TextChunker сразу идут в генерацию, готовые файлы промптов - сразу
+в проверку; между этапами ограниченные очереди в памяти:
+    чанки ──[queue_size]──▶ генерация (воркеры пула) ──[queue_size]──▶ проверка
+Полная очередь задерживает предыдущий этап (обратное давление): память не
+растёт, а проверка идёт одновременно с генерацией, а не после всего корпуса.
+Файлы пишутся только как контрольные точки - чанк в папку чанков (имена как
+у «Разбить на чанки»), промпты в папку промптов; папки обратно не перечитываются.
+"""
+
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from logic.generation_pool import GenerationPool, OrderedProgress
+from logic.retry_queue import DeadLetters
+from utils.atomic_store import atomic_write_text
+
+
+# Конец работы для воркера этапа
+_DONE = object()
+
+
+class StreamingPipeline(GenerationPool):
+    """Этапы 1-3 одним прогоном (пауза / продолжение / остановка - как у GenerationPool)"""
+
+    def __init__(self, file_processor, key_manager, verifier=None, logger=None, max_workers=0, verify_workers=4,
+                 queue_size=16):
+        super().__init__(file_processor, key_manager, logger, max_workers)
+        self.verifier = verifier
+        self.verify_workers = max(1, verify_workers)
+        self.queue_size = max(1, queue_size)
+
+    @staticmethod
+    def chunk_paths(count, chunks_folder):
+        """Пути контрольных точек чанков - как у кнопки «Разбить на чанки»"""
+        return [Path(chunks_folder) / f"{i:02d}.txt" for i in range(1, count + 1)]
+
+    def _put(self, target, item):
+        """Положить в ограниченную очередь, дождавшись места (False - прогон отменён)"""
+        while not self.cancel.cancelled:
+            try:
+                target.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        """Взять из очереди (_DONE - этап закончен или прогон отменён)"""
+        while not self.cancel.cancelled:
+            try:
+                return source.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def run_chunks(self, chunks, chunks_folder, job, verification_prompt=None, progress_callback=None,
+                   verify_callback=None, delay=0):
+        """
+        Прогнать чанки через генерацию и (если задан verification_prompt) проверку.
+
+        chunks - тексты чанков из TextChunker.split_text;
+        job - как у GenerationPool.run; пакеты и отложенные повторы здесь не
+        используются - неудачный файл получает полное число попыток внутри
+        запроса (retry_max_attempts) и затем попадает в failed.json.
+        progress_callback(index, file_path, success, status, elapsed) - итог
+        генерации, по порядку чанков; verify_callback(done, total, filename) -
+        как у VerificationProcessor. Возвращает итоги генерации по порядку чанков.
+        """
+        chunks = list(chunks)
+        files = self.chunk_paths(len(chunks), chunks_folder)
+        if not files:
+            return []
+
+        job = dict(job)
+        for key in ('pack_size', 'pack_max_chars', 'deferred_retry_cooldown'):
+            job.pop(key, None)
+        if job.pop('deferred_retries', 0) > 0:
+            # Попытки внутри запроса урезаны в расчёте на отложенные повторы, которых здесь нет
+            job.pop('max_retries', None)
+        journal = job.pop('journal', None)
+        job['cancel'] = self.cancel
+
+        output_folder = job['output_folder']
+        dead_letters = DeadLetters(output_folder, self.logger)
+        verify = self.verifier is not None and bool(verification_prompt)
+        verify_lock = threading.Lock()
+
+        self.progress = OrderedProgress(files, progress_callback)
+        self.workers_count = self.resolve_workers(len(files), job.get('model'), job.get('router'))
+        verify_workers = self.verify_workers if verify else 0
+
+        transport = getattr(getattr(self.processor, 'api_client', None), 'transport', None)
+        if transport:
+            transport.ensure_pool_size(self.workers_count + verify_workers)
+
+        chunk_queue = queue.Queue(self.queue_size)
+        verify_queue = queue.Queue(self.queue_size)
+
+        def finish(index, success, status):
+            """Окончательный итог файла: журнал и список отказов"""
+            if journal:
+                journal.record(files[index], success, status)
+            if status == "cancelled":
+                return
+            if success:
+                dead_letters.discard(files[index])
+            else:
+                dead_letters.add(files[index], status, 1)
+
+        def produce():
+            os.makedirs(chunks_folder, exist_ok=True)
+            for index, (file_path, text) in enumerate(zip(files, chunks)):
+                if self.cancel.cancelled:
+                    return
+                atomic_write_text(str(file_path), text)
+
+                # Чанк, уже прошедший конвейер с теми же настройками, не повторяется
+                if journal and journal.is_done(file_path):
+                    self.progress.store(index, True, "journaled", 0.0)
+                    continue
+                if not self._put(chunk_queue, (index, file_path, text)):
+                    return
+
+            for _ in range(self.workers_count):
+                self._put(chunk_queue, _DONE)
+
+        def generate():
+            while self.cancel.wait_resumed():
+                item = self._get(chunk_queue)
+                if item is _DONE:
+                    break
+
+                index, file_path, text = item
+                file_start = time.time()
+                try:
+                    success, status = self.processor.process_file(file_path=file_path, chunk_text=text, **job)
+                except Exception as e:
+                    self.log(f"❌ Исключение при обработке {file_path.name}: {str(e)}", "error")
+                    success, status = False, "exception"
+
+                self.progress.store(index, success, status, time.time() - file_start)
+                if success and verify:
+                    self._put(verify_queue, (index, Path(output_folder) / file_path.name))
+                else:
+                    finish(index, success, status)
+
+                if success and delay > 0:
+                    self.cancel.sleep(delay)
+
+        def check():
+            while self.cancel.wait_resumed():
+                item = self._get(verify_queue)
+                if item is _DONE:
+                    break
+
+                index, prompts_path = item
+                result = self.verifier.verify_single_file(
+                    prompts_path, verification_prompt, job['model'], job['temperature'], job.get('retry_budget'),
+                    self.cancel
+                )
+                if result == 'cancelled':
+                    finish(index, False, "cancelled")
+                    continue
+                with verify_lock:
+                    self.verifier.record_result(result)
+                    done = self.verifier.stats['total']
+
+                finish(index, result != 'errors', "verify_error" if result == 'errors' else "success")
+                if verify_callback:
+                    verify_callback(done, len(files), prompts_path.name)
+
+        mode = f" + {verify_workers} на проверку" if verify else ""
+        self.log(f"🔗 Конвейер: {len(files)} чанков, {self.workers_count} потоков на генерацию{mode}", "info")
+        if verify:
+            self.verifier.begin()
+
+        producer = threading.Thread(target=produce, daemon=True, name="pipeline-chunks")
+        generators = [
+            threading.Thread(target=generate, daemon=True, name=f"pipeline-generate-{i + 1}")
+            for i in range(self.workers_count)
+        ]
+        checkers = [
+            threading.Thread(target=check, daemon=True, name=f"pipeline-verify-{i + 1}")
+            for i in range(verify_workers)
+        ]
+        for thread in [producer] + generators + checkers:
+            thread.start()
+
+        producer.join()
+        for thread in generators:
+            thread.join()
+        for _ in checkers:
+            self._put(verify_queue, _DONE)
+        for thread in checkers:
+            thread.join()
+
+        dead_letters.save()
+        if verify:
+            self.verifier.finish()
+        return self.progress.ordered()
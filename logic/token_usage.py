@@ -0,0 +1,168 @@
+"""
+Учёт токенов по полю usage ответов Groq.
+
+Обычный ответ несёт usage в теле, потоковый - в x_groq.usage (или usage)
+последнего чанка SSE:
+    prompt_tokens / completion_tokens / total_tokens
+    queue_time - ожидание в очереди Groq, total_time - обработка на сервере (сек)
+
+Если поток оборван досрочно, usage не приходит - тогда токены оцениваются
+по длине текста и помечаются как оценка.
+
+TokenEstimator заранее оценивает токены запроса (вход + ожидаемый ответ),
+чтобы ключ выдавался только под запрос, который пропустит его TPM/TPD.
+Оценка калибруется по фактическому usage ответов каждой модели.
+"""
+
+import threading
+from collections import deque
+
+
+# Символов на токен до калибровки (≈3 для кириллицы)
+DEFAULT_CHARS_PER_TOKEN = 3.0
+
+
+def estimate_text_tokens(text):
+    """Грубая оценка токенов текста (≈3 символа на токен для кириллицы)"""
+    return int(len(text or "") / DEFAULT_CHARS_PER_TOKEN) + 1
+
+
+class TokenUsage:
+    """Токены и серверное время одного запроса"""
+
+    def __init__(self, prompt_tokens=0, completion_tokens=0, queue_time=0.0, processing_time=0.0, estimated=False):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.queue_time = queue_time
+        self.processing_time = processing_time
+        self.estimated = estimated
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @classmethod
+    def from_dict(cls, usage):
+        """Разбор поля usage ответа (None - поля нет)"""
+        if not usage:
+            return None
+        return cls(
+            prompt_tokens=int(usage.get('prompt_tokens') or 0),
+            completion_tokens=int(usage.get('completion_tokens') or 0),
+            queue_time=float(usage.get('queue_time') or 0.0),
+            processing_time=float(usage.get('total_time') or 0.0)
+        )
+
+    @classmethod
+    def estimate(cls, prompt_tokens, text):
+        """Оценка для ответа без usage (оборванный поток)"""
+        return cls(prompt_tokens, estimate_text_tokens(text), estimated=True)
+
+    def __repr__(self):
+        mark = ", estimated" if self.estimated else ""
+        return f"TokenUsage(in={self.prompt_tokens}, out={self.completion_tokens}{mark})"
+
+
+class UsageTotals:
+    """Накопленные токены и время по набору запросов (ключ, модель или прогон)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.queue_time = 0.0
+        self.processing_time = 0.0
+        self.estimated = 0
+
+    def add(self, usage):
+        self.requests += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.queue_time += usage.queue_time
+        self.processing_time += usage.processing_time
+        if usage.estimated:
+            self.estimated += 1
+
+    def as_dict(self):
+        requests = max(1, self.requests)
+        return {
+            "requests": self.requests,
+            "tokens_in": self.prompt_tokens,
+            "tokens_out": self.completion_tokens,
+            "tokens_total": self.prompt_tokens + self.completion_tokens,
+            "avg_queue_time": self.queue_time / requests,
+            "avg_processing_time": self.processing_time / requests,
+            "estimated": self.estimated
+        }
+
+
+class TokenEstimator:
+    """Оценка токенов запроса до отправки, калиброванная по usage ответов модели"""
+
+    def __init__(self, default_output=600, window=200, min_samples=5, quantile=0.9, seed_source=None):
+        """
+        default_output - ожидаемый ответ в токенах, пока у модели нет замеров
+        quantile - по какому перцентилю замеров резервировать (запас против 429)
+        seed_source() - накопленная статистика {model: {requests, tokens_out}} для seed();
+        читается при первой оценке (в потоке запроса, а не при создании клиента)
+        """
+        self.default_output = default_output
+        self.window = window
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.ratios = {}        # model -> символов на токен входа
+        self.outputs = {}       # model -> токенов ответа
+        self.lock = threading.Lock()
+        self.seed_source = seed_source
+        self.seed_lock = threading.Lock()
+
+    def _percentile(self, samples, q):
+        """Перцентиль q (0..1) или None, пока замеров мало"""
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def seed(self, model_usage):
+        """Начальная оценка ответа по накопленной статистике {model: {requests, tokens_out}}"""
+        with self.lock:
+            for model, totals in model_usage.items():
+                if model not in self.outputs and totals.get('requests'):
+                    self.outputs[model] = deque(
+                        [totals['tokens_out'] / totals['requests']] * self.min_samples, maxlen=self.window
+                    )
+
+    def _ensure_seeded(self):
+        """Один раз подтянуть накопленную статистику из seed_source"""
+        if self.seed_source is None:
+            return
+        with self.seed_lock:
+            source, self.seed_source = self.seed_source, None
+            if source is not None:
+                self.seed(source())
+
+    def observe(self, model, chars, usage):
+        """Учесть фактический usage ответа на запрос из chars символов (оценки не учитываются)"""
+        if usage is None or usage.estimated or not usage.prompt_tokens:
+            return
+        with self.lock:
+            self.ratios.setdefault(model, deque(maxlen=self.window)).append(chars / usage.prompt_tokens)
+            self.outputs.setdefault(model, deque(maxlen=self.window)).append(usage.completion_tokens)
+
+    def prompt_tokens(self, model, chars):
+        """Оценка входных токенов (меньше символов на токен - больше токенов, берём нижний перцентиль)"""
+        with self.lock:
+            ratio = self._percentile(self.ratios.get(model), 1 - self.quantile)
+        return int(chars / (ratio or DEFAULT_CHARS_PER_TOKEN)) + 1
+
+    def output_tokens(self, model):
+        """Ожидаемые токены ответа (верхний перцентиль замеров)"""
+        self._ensure_seeded()
+        with self.lock:
+            expected = self._percentile(self.outputs.get(model), self.quantile)
+        return int(expected if expected is not None else self.default_output)
+
+    def estimate(self, model, text):
+        """(входные токены, резерв на весь запрос) для текста system + user"""
+        prompt = self.prompt_tokens(model, len(text))
+        return prompt, prompt + self.output_tokens(model)
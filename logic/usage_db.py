@@ -0,0 +1,290 @@
+"""
+SQLite (WAL) хранилище использования ключей.
+
+Три части:
+    key_state      - текущее состояние на пару (ключ, модель); model = '' - общие счётчики ключа
+    request_events - журнал запросов (время, ключ, модель, статус, задержка, токены)
+    usage_totals   - накопленные итоги журнала по ключам и моделям
+
+Запись идёт пачками из отдельного потока; итоги обновляются в той же транзакции,
+что и журнал, поэтому сводка «за всё время» - чтение нескольких строк, а журнал
+читается только окнами по индексу ts.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS key_state (
+    key_id     TEXT NOT NULL,
+    model      TEXT NOT NULL DEFAULT '',
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (key_id, model)
+);
+
+CREATE TABLE IF NOT EXISTS request_events (
+    id         INTEGER PRIMARY KEY,
+    ts         REAL NOT NULL,
+    key_id     TEXT NOT NULL,
+    model      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    latency    REAL,
+    tokens_in  INTEGER NOT NULL DEFAULT 0,
+    tokens_out INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS usage_totals (
+    scope       TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    requests    INTEGER NOT NULL DEFAULT 0,
+    errors      INTEGER NOT NULL DEFAULT 0,
+    tokens_in   INTEGER NOT NULL DEFAULT 0,
+    tokens_out  INTEGER NOT NULL DEFAULT 0,
+    latency_sum REAL NOT NULL DEFAULT 0,
+    latency_n   INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_ts ON request_events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_key_ts ON request_events (key_id, ts);
+CREATE INDEX IF NOT EXISTS idx_events_model_ts ON request_events (model, ts);
+CREATE INDEX IF NOT EXISTS idx_state_invalid ON key_state (model, json_extract(data, '$.permanently_invalid'));
+"""
+
+# Столбец журнала для каждого разреза usage_totals
+TOTALS_SCOPES = {"key": "key_id", "model": "model"}
+
+_STOP = object()
+
+
+class UsageDatabase:
+    """Хранилище состояния ключей и истории запросов в SQLite (WAL)"""
+
+    def __init__(self, path="logs/usage.db", batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Соединение для чтения (WAL не блокирует читателей во время записи)
+        self.read_conn = self._connect()
+        self.read_conn.executescript(SCHEMA)
+        self.read_lock = threading.Lock()
+
+        self.queue = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self._run_writer, daemon=True, name="usage-db-writer")
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- запись ----------
+
+    def save_state(self, key_id, model, data):
+        """Поставить в очередь новое состояние пары (ключ, модель)"""
+        if not self.closed:
+            self.queue.put(("state", (key_id, model or '', json.dumps(data), time.time())))
+
+    def record_event(self, ts, key_id, model, status, latency=None, tokens_in=0, tokens_out=0):
+        """Поставить в очередь событие запроса"""
+        if not self.closed:
+            self.queue.put(("event", (ts, key_id, model, status, latency, tokens_in, tokens_out)))
+
+    def delete_all_state(self):
+        """Очистить текущее состояние (журнал запросов сохраняется)"""
+        if not self.closed:
+            self.queue.put(("clear", None))
+
+    def _run_writer(self):
+        conn = self._connect()
+        try:
+            self._backfill_totals(conn)
+            while True:
+                try:
+                    first = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+
+                batch = [first]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = any(item is _STOP for item in batch)
+                self._write_batch(conn, [item for item in batch if item is not _STOP])
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn, batch):
+        """Записать пачку одной транзакцией; состояние одной пары схлопывается до последнего"""
+        if not batch:
+            return
+
+        events = []
+        states = {}
+        with conn:
+            for kind, payload in batch:
+                if kind == "event":
+                    events.append(payload)
+                elif kind == "state":
+                    states[(payload[0], payload[1])] = payload
+                elif kind == "clear":
+                    if events:
+                        self._insert_events(conn, events)
+                        events = []
+                    states = {}
+                    conn.execute("DELETE FROM key_state")
+
+            if events:
+                self._insert_events(conn, events)
+            if states:
+                conn.executemany(
+                    "INSERT INTO key_state (key_id, model, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key_id, model) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    list(states.values())
+                )
+
+    @staticmethod
+    def _insert_events(conn, events):
+        conn.executemany(
+            "INSERT INTO request_events (ts, key_id, model, status, latency, tokens_in, tokens_out) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            events
+        )
+
+        # Итоги пачки по ключам и моделям → usage_totals
+        totals = {}
+        for _, key_id, model, status, latency, tokens_in, tokens_out in events:
+            for scope, name in (("key", key_id), ("model", model)):
+                row = totals.setdefault((scope, name), [0, 0, 0, 0, 0.0, 0])
+                row[0] += 1
+                row[1] += 0 if status == 'success' else 1
+                row[2] += tokens_in or 0
+                row[3] += tokens_out or 0
+                if latency is not None:
+                    row[4] += latency
+                    row[5] += 1
+        conn.executemany(
+            "INSERT INTO usage_totals (scope, name, requests, errors, tokens_in, tokens_out, latency_sum, latency_n) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (scope, name) DO UPDATE SET "
+            "requests = requests + excluded.requests, errors = errors + excluded.errors, "
+            "tokens_in = tokens_in + excluded.tokens_in, tokens_out = tokens_out + excluded.tokens_out, "
+            "latency_sum = latency_sum + excluded.latency_sum, latency_n = latency_n + excluded.latency_n",
+            [(scope, name, *row) for (scope, name), row in totals.items()]
+        )
+
+    @staticmethod
+    def _backfill_totals(conn):
+        """База из версии без usage_totals: один раз посчитать итоги по журналу (в потоке записи)"""
+        if conn.execute("SELECT 1 FROM usage_totals LIMIT 1").fetchone():
+            return
+        if not conn.execute("SELECT 1 FROM request_events LIMIT 1").fetchone():
+            return
+        with conn:
+            for scope, column in TOTALS_SCOPES.items():
+                conn.execute(
+                    "INSERT INTO usage_totals (scope, name, requests, errors, tokens_in, tokens_out, latency_sum, latency_n) "
+                    f"SELECT ?, {column}, COUNT(*), SUM(CASE WHEN status = 'success' THEN 0 ELSE 1 END), "
+                    "SUM(tokens_in), SUM(tokens_out), TOTAL(latency), COUNT(latency) "
+                    f"FROM request_events GROUP BY {column}",
+                    (scope,)
+                )
+
+    def close(self):
+        """Дописать очередь и закрыть базу"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.writer.join(timeout=10)
+        with self.read_lock:
+            self.read_conn.close()
+
+    # ---------- чтение ----------
+
+    def load_state(self):
+        """Текущее состояние: {key_id: {model: data}}"""
+        state = {}
+        with self.read_lock:
+            for key_id, model, data in self.read_conn.execute("SELECT key_id, model, data FROM key_state"):
+                state.setdefault(key_id, {})[model] = json.loads(data)
+        return state
+
+    def key_totals(self, since=None):
+        """Сводка по ключам: {key_id: {...}} (за всё время - из usage_totals, за период - окно журнала по ts)"""
+        return self._totals("key", since)
+
+    def model_totals(self, since=None):
+        """Сводка по моделям: {model: {...}}"""
+        return self._totals("model", since)
+
+    def _totals(self, scope, since):
+        if since is None:
+            query = (
+                "SELECT name, requests, errors, tokens_in, tokens_out, "
+                "CASE WHEN latency_n > 0 THEN latency_sum / latency_n END "
+                "FROM usage_totals WHERE scope = ?"
+            )
+            params = (scope,)
+        else:
+            column = TOTALS_SCOPES[scope]
+            query = (
+                f"SELECT {column}, COUNT(*), "
+                "SUM(CASE WHEN status = 'success' THEN 0 ELSE 1 END), "
+                "SUM(tokens_in), SUM(tokens_out), AVG(latency) "
+                f"FROM request_events WHERE ts >= ? GROUP BY {column}"
+            )
+            params = (since,)
+
+        totals = {}
+        with self.read_lock:
+            for name, requests, errors, tokens_in, tokens_out, latency in self.read_conn.execute(query, params):
+                totals[name] = {
+                    "requests": requests,
+                    "errors": errors or 0,
+                    "tokens_in": tokens_in or 0,
+                    "tokens_out": tokens_out or 0,
+                    "avg_latency": latency or 0.0
+                }
+        return totals
+
+    def key_request_counts(self, since):
+        """Запросов каждого ключа с момента since: {key_id: n} (один запрос по индексу (key_id, ts), без чтения строк)"""
+        with self.read_lock:
+            return dict(self.read_conn.execute(
+                "SELECT key_id, COUNT(*) FROM request_events "
+                "WHERE ts >= ? GROUP BY key_id", (since,)
+            ))
+
+    def invalid_keys(self):
+        """Ключи с флагом permanently_invalid: {key_id} (по индексу idx_state_invalid)"""
+        with self.read_lock:
+            return {row[0] for row in self.read_conn.execute(
+                "SELECT key_id FROM key_state WHERE model = '' AND json_extract(data, '$.permanently_invalid') = 1"
+            )}
+
+    def recent_events(self, key_id=None, limit=100):
+        """Последние события (для отладки ключа)"""
+        query = "SELECT ts, key_id, model, status, latency, tokens_in, tokens_out FROM request_events"
+        params = []
+        if key_id:
+            query += " WHERE key_id = ?"
+            params.append(key_id)
+        query += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+
+        with self.read_lock:
+            return list(self.read_conn.execute(query, params))
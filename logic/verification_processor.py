@@ -2,6 +2,7 @@
 Модуль для проверки и улучшения сгенерированных промптов через Groq API.
 """
 
+import asyncio
 import time
 from pathlib import Path
 from typing import Dict
@@ -23,12 +24,14 @@ class VerificationProcessor:
         }
         self.start_time = None
         
-    def verify_prompts_folder(self, prompts_folder: Path, verification_prompt: str, progress_callback=None):
+    def verify_prompts_folder(self, prompts_folder: Path, verification_prompt: str, progress_callback=None,
+                              model=None, temperature=None, retry_budget=None, cancel=None):
         """
         Проверить все файлы с промптами в указанной папке.
+        
+        cancel - CancelToken: отмена обрывает текущий запрос и останавливает проверку.
         """
-        self.stats = {'total': 0, 'improved': 0, 'unchanged': 0, 'errors': 0}
-        self.start_time = time.time()
+        self.begin()
         
         # Получить все .txt файлы
         prompt_files = sorted(Path(prompts_folder).glob('*.txt'))
@@ -49,62 +52,134 @@ class VerificationProcessor:
             self.logger.log(f"📄 Проверяется файл {index}/{total_files}: {file_path.name}", "info")
             
             # Проверить один файл
-            result = self.verify_single_file(file_path, verification_prompt)
-            self.stats['total'] += 1
-            self.stats[result] += 1
+            result = self.verify_single_file(file_path, verification_prompt, model, temperature, retry_budget, cancel)
+            if result == 'cancelled':
+                break
+            self.record_result(result)
             
-        # Вычислить время выполнения
+        self.finish()
+        return self.stats
+    
+    def begin(self):
+        """Сбросить статистику перед новой проверкой"""
+        self.stats = {'total': 0, 'improved': 0, 'unchanged': 0, 'errors': 0}
+        self.start_time = time.time()
+    
+    def record_result(self, result):
+        """Учесть итог одного файла в статистике"""
+        self.stats['total'] += 1
+        self.stats[result] += 1
+    
+    def finish(self):
+        """Вывести итоговую статистику"""
         elapsed_time = time.time() - self.start_time
         self.logger.log(self._format_final_stats(elapsed_time), "success")
-        
-        return self.stats
     
-    def verify_single_file(self, file_path: Path, verification_prompt: str):
+    def resolve_model(self, model=None, temperature=None):
+        """Модель и температура: переданные явно или из config.json"""
+        config = getattr(self.api_client, 'config', None)
+        if model is None:
+            model = config.get('model') if config else None
+        if temperature is None:
+            temperature = config.get('temperature', 1.0) if config else 1.0
+        return model, temperature
+    
+    def verify_single_file(self, file_path: Path, verification_prompt: str, model=None, temperature=None,
+                           retry_budget=None, cancel=None):
         """
         Проверить и улучшить промпты в одном файле.
+        
+        Возвращает 'improved' / 'unchanged' / 'errors' или 'cancelled' (прогон
+        остановлен - файл не тронут и в статистику не идёт).
         """
         try:
             # 1. Прочитать все промпты из файла
-            original_content = file_path.read_text(encoding='utf-8').strip()
-            
+            original_content = self._read_prompts(file_path)
             if not original_content:
-                self.logger.log(f"⚠️ Файл {file_path.name} пуст, пропускается", "warning")
                 return 'unchanged'
             
             # 2. Отправить в Groq API
             self.logger.log(f"🔄 Отправка запроса в API для {file_path.name}...", "info")
             
-            response, status = self.api_client.send_request(
+            model, temperature = self.resolve_model(model, temperature)
+            result = self.api_client.send_request(
                 user_message=original_content,
                 system_prompt=verification_prompt,
-                model=self.api_client.key_manager.config.get('model'),
-                temperature=self.api_client.key_manager.config.get('temperature', 1.0)
+                model=model,
+                temperature=temperature,
+                retry_budget=retry_budget,
+                cancel=cancel
             )
             
-            if status != "success" or not response:
-                self.logger.log(f"❌ Ошибка API при проверке {file_path.name}", "error")
-                return 'errors'
+            return self._apply_response(file_path, original_content, result.text, result.status)
+                
+        except Exception as e:
+            self.logger.log(f"❌ Ошибка при проверке {file_path.name}: {e}", "error")
+            return 'errors'
+    
+    async def verify_single_file_async(self, session, file_path: Path, verification_prompt: str,
+                                       model=None, temperature=None, retry_budget=None, cancel=None):
+        """
+        Асинхронная проверка одного файла (запрос через aiohttp сессию).
+        """
+        try:
+            original_content = self._read_prompts(file_path)
+            if not original_content:
+                return 'unchanged'
             
-            # 3. Получить улучшенный контент
-            improved_content = response.strip()
+            self.logger.log(f"🔄 Отправка запроса в API для {file_path.name}...", "info")
             
-            # 4. Проверить, есть ли изменения
-            original_normalized = ' '.join(original_content.split())
-            improved_normalized = ' '.join(improved_content.split())
+            model, temperature = self.resolve_model(model, temperature)
+            result = await self.api_client.send_request_async(
+                session,
+                user_message=original_content,
+                system_prompt=verification_prompt,
+                model=model,
+                temperature=temperature,
+                retry_budget=retry_budget,
+                cancel=cancel
+            )
             
-            if original_normalized != improved_normalized:
-                # 5. Перезаписать файл с улучшенными промптами
-                file_path.write_text(improved_content, encoding='utf-8')
-                self.logger.log(f"✅ Улучшен: {file_path.name}", "success")
-                return 'improved'
-            else:
-                self.logger.log(f"ℹ️ Без изменений: {file_path.name}", "info")
-                return 'unchanged'
-                
+            return self._apply_response(file_path, original_content, result.text, result.status)
+        
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             self.logger.log(f"❌ Ошибка при проверке {file_path.name}: {e}", "error")
             return 'errors'
     
+    def _read_prompts(self, file_path: Path):
+        """Содержимое файла с промптами (пустая строка - пропустить)"""
+        original_content = file_path.read_text(encoding='utf-8').strip()
+        
+        if not original_content:
+            self.logger.log(f"⚠️ Файл {file_path.name} пуст, пропускается", "warning")
+        return original_content
+    
+    def _apply_response(self, file_path: Path, original_content: str, response, status):
+        """Сравнить ответ с исходником и перезаписать файл при изменениях"""
+        if status == "cancelled":
+            return 'cancelled'
+        if status != "success" or not response:
+            self.logger.log(f"❌ Ошибка API при проверке {file_path.name}", "error")
+            return 'errors'
+        
+        # 3. Получить улучшенный контент
+        improved_content = response.strip()
+        
+        # 4. Проверить, есть ли изменения
+        original_normalized = ' '.join(original_content.split())
+        improved_normalized = ' '.join(improved_content.split())
+        
+        if original_normalized != improved_normalized:
+            # 5. Перезаписать файл с улучшенными промптами
+            file_path.write_text(improved_content, encoding='utf-8')
+            self.logger.log(f"✅ Улучшен: {file_path.name}", "success")
+            return 'improved'
+        else:
+            self.logger.log(f"ℹ️ Без изменений: {file_path.name}", "info")
+            return 'unchanged'
+    
     def _format_final_stats(self, elapsed_time: float):
         """
         Форматировать итоговую статистику.
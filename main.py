@@ -2,10 +2,12 @@
 Groq Prompt Generator v3.0
 Главный файл запуска приложения
 
+Модули GUI (tkinter) импортируются только внутри main(): create_services()
+используется и запуском без интерфейса (cli.py).
 """
-import tkinter as tk
 import os
 import sys
+import threading
 from pathlib import Path
 
 # ✅ ОТКЛЮЧИТЬ СОЗДАНИЕ .pyc ФАЙЛОВ ПРИ РАЗРАБОТКЕ
@@ -19,14 +21,48 @@ from config.settings import ConfigManager
 from logic.key_manager import KeyManager
 from logic.api_client import GroqAPIClient
 from logic.file_processor import FileProcessor
-from gui.main_window import MainWindow
-from utils.hotkeys import HotkeyManager
-from utils.lock_file import LockFileManager
 from utils.logger import Logger
 
 
+def create_services(config, logger, keys_file="API_keys.txt", limits_file="logs/keys_limits.json"):
+    """Менеджер ключей, API клиент и обработчик файлов по настройкам → (keys, api_client, file_processor)"""
+    keys = KeyManager(
+        keys_file=keys_file,
+        limits_file=limits_file,
+        flush_interval=config.get('limits_flush_interval', 2.0),
+        backend=config.get('usage_backend', 'json'),
+        db_path=config.get('usage_db_path', 'logs/usage.db'),
+        breaker_settings={
+            'window_seconds': config.get('breaker_window_seconds', 60.0),
+            'min_calls': config.get('breaker_min_calls', 5),
+            'failure_rate': config.get('breaker_failure_rate', 0.5),
+            'slow_call_seconds': config.get('breaker_slow_call_seconds', 20.0),
+            'open_seconds': config.get('breaker_open_seconds', 30.0)
+        },
+        concurrency_settings={
+            'enabled': config.get('adaptive_concurrency', True),
+            'initial': config.get('concurrency_initial', 4),
+            'max_limit': config.get('concurrency_max', 32),
+            'latency_factor': config.get('concurrency_latency_factor', 2.0)
+        }
+    )
+    
+    api_client = GroqAPIClient(keys, logger, config)
+    
+    # Прогрев HTTP соединений в фоне (первый чанк не платит за TLS)
+    if config.get('http_prewarm', True):
+        threading.Thread(target=api_client.prewarm, daemon=True).start()
+    
+    return keys, api_client, FileProcessor(api_client, logger)
+
+
 def main():
     """Точка входа в приложение"""
+    import tkinter as tk
+    from tkinter import messagebox
+    from gui.main_window import MainWindow
+    from utils.hotkeys import HotkeyManager
+    from utils.lock_file import LockFileManager
     
     # ✅ НОВОЕ: Очистка кэша при запуске в режиме разработки
     DEV_MODE = True  # Установите False для продакшена
@@ -45,32 +81,31 @@ def main():
     # 2. Загрузка конфигурации
     config = ConfigManager()
     
-    # 3. Инициализация менеджера ключей
-    keys = KeyManager()
-    
-    # 4. Создание логгера
+    # 3. Логгер, менеджер ключей, API клиент и обработчик файлов
     logger = Logger()
+    keys, api_client, file_processor = create_services(config, logger)
+    if not keys.api_keys:
+        messagebox.showerror(
+            "❌ Ошибка",
+            f"Файл {keys.keys_file} пуст или не найден!\n\n"
+            "Добавьте API ключи (один на строку)"
+        )
     
-    # 5. Создание API клиента
-    api_client = GroqAPIClient(keys, logger)
-    
-    # 6. Создание обработчика файлов
-    file_processor = FileProcessor(api_client, logger)
-    
-    # 7. Создание главного окна
+    # 4. Создание главного окна
     app = MainWindow(root, config, keys, api_client, file_processor, logger)
     
-    # 8. Настройка горячих клавиш
+    # 5. Настройка горячих клавиш
     HotkeyManager(root)
     
-    # 9. Обработка закрытия окна
+    # 6. Обработка закрытия окна
     def on_closing():
+        keys.close()
         lock_manager.cleanup()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
     
-    # 10. Запуск главного цикла
+    # 7. Запуск главного цикла
     root.mainloop()
 
 
@@ -0,0 +1,37 @@
+"""Общие настройки тестов: корень проекта в sys.path, KeyManager во временной папке"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.key_manager import KeyManager  # noqa: E402
+
+
+KEYS = ("gsk_test_aaaaaaaa", "gsk_test_bbbbbbbb")
+
+
+@pytest.fixture
+def make_keys(tmp_path, monkeypatch):
+    """Фабрика KeyManager: make_keys(keys=KEYS, **settings); все менеджеры закрываются после теста"""
+    monkeypatch.chdir(tmp_path)
+    managers = []
+
+    def make(keys=KEYS, **settings):
+        (tmp_path / "keys.txt").write_text("".join(f"{key}\n" for key in keys), encoding="utf-8")
+        settings.setdefault('flush_interval', 60.0)
+        manager = KeyManager(str(tmp_path / "keys.txt"), str(tmp_path / "limits.json"), **settings)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+
+@pytest.fixture
+def keys(request, make_keys):
+    """KeyManager с двумя ключами; настройки - через parametrize(..., indirect=True)"""
+    return make_keys(**getattr(request, "param", {}))
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from logic.api_client import GroqAPIClient
+from logic.cancellation import CancelToken
+
+
+@pytest.fixture
+def client(make_keys):
+    keys = make_keys(keys=["gsk_test_aaaaaaaa"],
+                     concurrency_settings={'enabled': True, 'initial': 1, 'min_limit': 1})
+    return GroqAPIClient(keys, config={'admission_max_wait': 30.0})
+
+
+def test_cancel_stops_slot_wait(client):
+    concurrency = client.key_manager.concurrency
+    assert concurrency.try_acquire("m")
+    cancel = CancelToken()
+    threading.Timer(0.1, cancel.cancel).start()
+
+    start = time.time()
+    assert asyncio.run(client._acquire_async("m", 100, cancel)) is None
+    assert time.time() - start < 1.0
+
+
+def test_released_slot_wakes_waiter(client):
+    concurrency = client.key_manager.concurrency
+    assert concurrency.try_acquire("m")
+
+    async def scenario():
+        waiter = asyncio.create_task(client._acquire_slot_async("m"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        concurrency.cancel("m")
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario())
+
+
+def test_cancel_interrupts_retry_pause(client):
+    cancel = CancelToken()
+    threading.Timer(0.1, cancel.cancel).start()
+
+    start = time.time()
+    assert asyncio.run(client._sleep_async(30.0, cancel)) is False
+    assert time.time() - start < 1.0
+
+
+def test_resume_wakes_paused_request(client):
+    cancel = CancelToken()
+    cancel.pause()
+
+    async def scenario():
+        waiter = asyncio.create_task(client._wait_resumed_async(cancel))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        cancel.resume()
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario()) is True
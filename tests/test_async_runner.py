@@ -0,0 +1,53 @@
+import contextlib
+import time
+from types import SimpleNamespace
+
+from logic.async_runner import AsyncPipelineRunner
+from logic.file_processor import FileProcessor
+from logic.retry_queue import DeferredRetryQueue
+
+
+QUIET = SimpleNamespace(log=lambda message, level="info": None)
+
+
+class FakeAsyncProcessor:
+    """FileProcessor без API: первый запрос по файлу из fail_once проваливается"""
+
+    plan_packs = staticmethod(FileProcessor.plan_packs)
+
+    def __init__(self, fail_once=()):
+        self.fail_once = set(fail_once)
+        self.api_client = SimpleNamespace(
+            key_manager=None, create_async_session=lambda limit: contextlib.AsyncExitStack()
+        )
+
+    async def process_group_async(self, session, file_paths, **job):
+        results = []
+        for file_path in file_paths:
+            if file_path.name in self.fail_once:
+                self.fail_once.discard(file_path.name)
+                results.append((False, "failed"))
+            else:
+                results.append((True, "success"))
+        return results
+
+
+def test_deferred_retry_wakes_without_polling(tmp_path, monkeypatch):
+    files = []
+    for name in ("01.txt", "02.txt"):
+        (tmp_path / name).write_text("текст", encoding="utf-8")
+        files.append(tmp_path / name)
+
+    polls = []
+    poll = DeferredRetryQueue.poll
+    monkeypatch.setattr(DeferredRetryQueue, "poll", lambda self: polls.append(1) or poll(self))
+
+    runner = AsyncPipelineRunner(FakeAsyncProcessor(fail_once={"01.txt"}), logger=QUIET)
+    start = time.time()
+    results = runner.run(files, {'deferred_retries': 1, 'deferred_retry_cooldown': 1.0, 'output_folder': None})
+    elapsed = time.time() - start
+
+    assert [(success, status) for _, success, status, _ in results] == [(True, "success"), (True, "success")]
+    assert 1.0 <= elapsed < 1.5
+    # Ожидание повтора - по событию и таймауту, а не опрос каждые 100 мс
+    assert len(polls) < 10
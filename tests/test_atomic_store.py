@@ -0,0 +1,38 @@
+import json
+
+from utils.atomic_store import WriteBehindStore, atomic_write_text
+
+
+HEADERS = {
+    "x-ratelimit-limit-requests": "1000",
+    "x-ratelimit-remaining-requests": "990",
+}
+
+
+def test_limits_are_written_behind(keys, tmp_path):
+    keys.release_lease(keys.acquire_lease("m", 100), "success", HEADERS)
+    assert not (tmp_path / "limits.json").exists()
+
+    assert keys.flush_keys_limits()
+    saved = json.loads((tmp_path / "limits.json").read_text(encoding="utf-8"))
+    assert sum(data['total_requests'] for data in saved.values()) == 1
+
+    # Повторный сброс без изменений ничего не пишет
+    assert not keys.flush_keys_limits()
+
+
+def test_write_behind_close_flushes(tmp_path):
+    state = {"value": 1}
+    store = WriteBehindStore(str(tmp_path / "state.json"), lambda: json.dumps(state), flush_interval=60.0)
+    store.mark_dirty()
+    store.close()
+    assert json.loads((tmp_path / "state.json").read_text(encoding="utf-8")) == state
+    assert store.writes == 1
+
+
+def test_atomic_write_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "data.json"
+    atomic_write_text(str(path), "old")
+    atomic_write_text(str(path), "new")
+    assert path.read_text(encoding="utf-8") == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.json"]
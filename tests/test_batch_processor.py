@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+from logic.batch_processor import BatchProcessor
+from logic.file_processor import FileProcessor
+from logic.generation_pool import OrderedProgress
+
+
+PROMPTS = "\n".join(f"{i}. A detailed historical illustration prompt number {i}" for i in range(1, 3))
+
+
+class KeyStats:
+    """Счётчики KeyManager, которые трогает выгрузка результатов"""
+
+    def __init__(self):
+        self.errors = 0
+        self.files = 0
+
+    def add_error(self, api_key):
+        self.errors += 1
+
+    def add_file_processed(self, api_key):
+        self.files += 1
+
+    def add_prompts_generated(self, api_key, count):
+        pass
+
+
+def ok_record(name):
+    return json.dumps({"custom_id": name, "response": {
+        "status_code": 200, "body": {"choices": [{"message": {"content": PROMPTS}}]}
+    }})
+
+
+def apply(tmp_path, content, names):
+    keys = KeyStats()
+    processor = FileProcessor(SimpleNamespace(key_manager=keys))
+    batch = BatchProcessor(processor, state_folder=str(tmp_path / "batches"))
+    batch._download = lambda api_key, file_id: content
+
+    files = [tmp_path / name for name in names]
+    results = []
+    batch.progress = OrderedProgress(files, lambda index, file_path, success, status, elapsed: results.append(status))
+    part = {"batch_id": "batch_1", "status": "completed", "output_file_id": "file_1", "files": names}
+    applied = batch._apply_part(part, "gsk_test_aaaaaaaa", tmp_path, {name: i for i, name in enumerate(names)})
+    return applied, results, keys
+
+
+def test_good_records_are_saved(tmp_path):
+    applied, results, keys = apply(tmp_path, ok_record("01.txt") + "\n" + ok_record("02.txt"), ["01.txt", "02.txt"])
+
+    assert applied
+    assert results == ["success", "success"]
+    assert keys.files == 2
+    assert len((tmp_path / "01.txt").read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_malformed_records_fail_only_their_files(tmp_path):
+    content = "\n".join([
+        ok_record("01.txt"),
+        "{not json",
+        json.dumps({"custom_id": "03.txt", "response": {"status_code": 200, "body": {"choices": []}}}),
+        json.dumps({"custom_id": "04.txt", "response": {"status_code": 500, "body": {"error": "boom"}}}),
+        json.dumps({"custom_id": "05.txt", "response": None}),
+        json.dumps(["no", "custom_id"]),
+        ok_record("06.txt"),
+    ])
+    names = ["01.txt", "02.txt", "03.txt", "04.txt", "05.txt", "06.txt"]
+    applied, results, keys = apply(tmp_path, content, names)
+
+    assert applied
+    assert results == ["success", "batch_error", "batch_error", "batch_error", "batch_error", "success"]
+    assert keys.errors == 4
+    assert keys.files == 2
@@ -0,0 +1,107 @@
+import time
+from types import SimpleNamespace
+
+from logic.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers
+
+
+def tripped(now=1000.0, **settings):
+    """Выключатель, разомкнутый пятью отказами подряд в момент now"""
+    breaker = CircuitBreaker(min_calls=5, failure_rate=0.5, open_seconds=30.0, **settings)
+    for i in range(5):
+        breaker.record(True, now=now - 5 + i)
+    return breaker
+
+
+def test_opens_on_failure_rate():
+    breaker = CircuitBreaker(min_calls=5, failure_rate=0.5)
+    for i in range(4):
+        assert breaker.record(True, now=100.0 + i) is None
+    assert breaker.record(True, now=104.0) == OPEN
+    assert breaker.try_probe(now=110.0) == (24.0, False)
+
+
+def test_old_failures_leave_window():
+    breaker = CircuitBreaker(window_seconds=60.0, min_calls=5, failure_rate=0.5)
+    for i in range(4):
+        breaker.record(True, now=100.0 + i)
+    # Через минуту старые отказы выпали из окна - одного нового мало
+    assert breaker.record(True, now=200.0) is None
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_trip_breaker():
+    breaker = CircuitBreaker(min_calls=5, slow_call_seconds=20.0, slow_rate=0.8)
+    states = [breaker.record(False, latency=25.0, now=100.0 + i) for i in range(5)]
+    assert states[-1] == OPEN
+
+
+def test_half_open_probe_closes_or_doubles_open_period():
+    breaker = tripped()
+    assert breaker.try_probe(now=1040.0) == (0.0, True)
+    assert breaker.state == HALF_OPEN
+    # Пока проба в полёте, остальные ждут
+    assert breaker.try_probe(now=1041.0) == (None, False)
+    # Ответ на запрос, отправленный до пробы, ничего не решает
+    assert breaker.record(False, started_at=1000.0, now=1042.0) is None
+
+    assert breaker.record(True, started_at=1040.0, now=1043.0) == OPEN
+    assert breaker.open_until == 1043.0 + 60.0
+
+    assert breaker.try_probe(now=1200.0) == (0.0, True)
+    assert breaker.record(False, started_at=1200.0, now=1201.0) == CLOSED
+    assert breaker.trips == 0
+
+
+def test_aborted_probe_keeps_period():
+    breaker = tripped()
+    breaker.try_probe(now=1040.0)
+    breaker.abort_probe(now=1040.0)
+    assert breaker.state == OPEN
+    assert breaker.open_until == 1070.0
+
+
+def test_neutral_probe_outcome_keeps_period():
+    breaker = tripped()
+    breaker.try_probe(now=1040.0)
+    # Проба упёрлась в 429: о здоровье ничего не известно - ждать прежний срок и пробовать снова
+    breaker.record_neutral(started_at=1040.0, now=1041.0)
+    assert breaker.state == OPEN
+    assert breaker.try_probe(now=1050.0) == (21.0, False)
+    assert breaker.try_probe(now=1071.0) == (0.0, True)
+
+
+def test_lost_probe_is_reset_after_deadline():
+    breaker = tripped(probe_timeout=60.0)
+    breaker.try_probe(now=1040.0)
+    assert breaker.try_probe(now=1099.0) == (None, False)
+    assert breaker.try_probe(now=1100.0) == (30.0, False)
+    assert breaker.state == OPEN
+
+
+def test_neutral_probe_releases_gate():
+    breakers = CircuitBreakers({'min_calls': 2, 'open_seconds': 0.0},
+                               logger=SimpleNamespace(log=lambda message, level="info": None))
+    breakers.record("k1", "m", "timeout", started_at=time.time())
+    breakers.record("k1", "m", "timeout", started_at=time.time())
+    assert breakers.model_gate("m")[1] is True
+    breakers.record("k1", "m", "cancelled", started_at=time.time())
+    # Выключатель не завис в half_open: следующая проба разрешена сразу
+    assert breakers.model_gate("m") == (0.0, True)
+    breakers.record("k1", "m", "success", latency=1.0, started_at=time.time())
+    assert breakers.model_gate("m") == (0.0, False)
+
+
+def test_neutral_outcomes_are_ignored():
+    breakers = CircuitBreakers({'min_calls': 2}, logger=SimpleNamespace(log=lambda message, level="info": None))
+    for _ in range(5):
+        assert breakers.record("k1", "m", "rate_limited") == (None, None)
+    assert breakers.key_state("k1") == CLOSED
+
+
+def test_key_and_model_failures_differ():
+    breakers = CircuitBreakers({'min_calls': 2}, logger=SimpleNamespace(log=lambda message, level="info": None))
+    breakers.record("k1", "m", "error")
+    # "error" - отказ ключа, но не модели
+    assert breakers.record("k1", "m", "error") == (OPEN, None)
+    assert breakers.key_gate("k1")[0] > 0
+    assert breakers.model_gate("m") == (0.0, False)
@@ -0,0 +1,99 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from logic.cancellation import CancelToken
+from logic.concurrency import ConcurrencyController
+
+
+QUIET = SimpleNamespace(log=lambda message, level="info": None)
+
+
+def make_controller(**settings):
+    settings = dict({'initial': 4, 'min_limit': 1, 'max_limit': 8, 'logger': QUIET}, **settings)
+    return ConcurrencyController(**settings)
+
+
+def fill(controller, model="m"):
+    """Занять все слоты модели; вернуть их число"""
+    taken = 0
+    while controller.try_acquire(model):
+        taken += 1
+    return taken
+
+
+def test_additive_increase_per_window():
+    controller = make_controller()
+    assert fill(controller) == 4
+    started = time.time()
+    # +1/предел за ответ: окно из четырёх ответов даёт чуть меньше +1
+    for _ in range(4):
+        controller.release("m", "success", 1.0, started)
+    assert controller.target("m") == 4
+    controller.release("m", "success", 1.0, started)
+    assert controller.target("m") == 5
+
+
+def test_rate_limit_halves_once_per_congestion():
+    controller = make_controller(initial=8)
+    fill(controller)
+    started = time.time()
+    controller.release("m", "rate_limited", 1.0, started)
+    assert controller.target("m") == 4
+    # Запросы, отправленные до снижения, не снижают предел повторно
+    controller.release("m", "rate_limited", 1.0, started)
+    assert controller.target("m") == 4
+    controller.release("m", "rate_limited", 1.0, time.time() + 1)
+    assert controller.target("m") == 2
+
+
+def test_latency_spike_decreases_limit():
+    controller = make_controller(initial=8, min_samples=3)
+    fill(controller)
+    for _ in range(3):
+        controller.release("m", "success", 1.0, 0.0)
+        controller.try_acquire("m")
+    before = controller.target("m")
+    for _ in range(3):
+        controller.release("m", "success", 10.0, time.time())
+        controller.try_acquire("m")
+    assert controller.target("m") < before
+
+
+def test_server_errors_do_not_grow_limit():
+    controller = make_controller()
+    fill(controller)
+    for _ in range(4):
+        controller.release("m", "server_error", 1.0, time.time())
+    assert controller.target("m") == 4
+
+
+def test_acquire_waits_for_release_and_honors_cancel():
+    controller = make_controller(initial=1, max_limit=1)
+    fill(controller)
+    threading.Timer(0.1, lambda: controller.cancel("m")).start()
+    assert controller.acquire("m", timeout=5)
+
+    cancel = CancelToken()
+    threading.Timer(0.1, cancel.cancel).start()
+    start = time.time()
+    assert not controller.acquire("m", timeout=30, cancel=cancel)
+    assert time.time() - start < 1.0
+
+
+def test_release_listener_is_notified():
+    controller = make_controller(initial=1)
+    fill(controller)
+    calls = []
+    unregister = controller.on_release(lambda: calls.append(1))
+    controller.cancel("m")
+    unregister()
+    controller.try_acquire("m")
+    controller.cancel("m")
+    assert calls == [1]
+
+
+def test_disabled_controller_never_blocks():
+    controller = make_controller(enabled=False)
+    assert all(controller.try_acquire("m") for _ in range(100))
+    assert controller.target("m") is None
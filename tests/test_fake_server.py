@@ -0,0 +1,57 @@
+import pytest
+
+from logic.api_client import GroqAPIClient
+from logic.file_processor import PromptStreamParser
+from utils.fake_groq_server import FakeGroqServer, FaultProfile
+
+
+MODEL = "llama-3.1-8b-instant"
+
+
+@pytest.fixture
+def run(make_keys):
+    """Клиент и заменитель Groq API на свободном порту: run(profile) → (client, server)"""
+    servers = []
+
+    def start(profile):
+        server = FakeGroqServer(port=0, profile=profile).start()
+        servers.append(server)
+        client = GroqAPIClient(make_keys(), config={
+            'api_base_url': server.base_url, 'response_cache': False, 'retry_max_wait': 5.0
+        })
+        return client, server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_success_reports_usage(run):
+    client, _ = run(FaultProfile(latency_median=0, seed=1))
+    result = client.send_request("Текст чанка", "Создай 3 промпта", MODEL, 1.0)
+    assert result.success and result.text
+    assert result.usage is not None and result.completion_tokens > 0
+    assert result.lease.key_id in ("aaaaaaaa", "bbbbbbbb")
+
+
+def test_stream_is_parsed_incrementally(run):
+    client, _ = run(FaultProfile(latency_median=0, seed=1))
+    seen = []
+    parser = PromptStreamParser(on_prompt=seen.append)
+    result = client.send_request("Текст чанка", "Создай 3 промпта", MODEL, 1.0, stream=parser)
+    assert result.success
+    assert seen and seen == parser.finish()
+
+
+def test_invalid_key_is_retried_on_another_key(run):
+    client, _ = run(FaultProfile(latency_median=0, invalid_keys={"gsk_test_aaaaaaaa"}, seed=1))
+    results = [client.send_request("Текст чанка", "Создай 3 промпта", MODEL, 1.0) for _ in range(3)]
+    assert all(result.success for result in results)
+    assert {result.lease.key_id for result in results} == {"bbbbbbbb"}
+
+
+def test_server_errors_exhaust_attempts(run):
+    client, server = run(FaultProfile(rate_500=1.0, latency_median=0, seed=1))
+    result = client.send_request("Текст чанка", "Создай 3 промпта", MODEL, 1.0, max_retries=2)
+    assert result.status == "failed"
+    assert sum(server.stats.values()) == 2
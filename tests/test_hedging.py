@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from logic.cancellation import CancelToken
+from logic.hedging import Hedger, LatencyTracker
+
+
+class Keys:
+    """KeyManager для Hedger: выдаёт аренду копии на другом ключе"""
+
+    def acquire_lease(self, model, tokens, exclude=(), min_headroom=0.0):
+        return SimpleNamespace(key_id="hedge", model=model)
+
+
+def make_hedger():
+    tracker = LatencyTracker(min_samples=1)
+    tracker.record("m", 0.05)
+    return Hedger(Keys(), tracker, enabled=True, quantile=0.5, budget_percent=100.0, logger=SimpleNamespace(
+        log=lambda message, level="info": None
+    ))
+
+
+def test_timeout_follows_measured_latency():
+    tracker = LatencyTracker(min_samples=2, min_timeout=1.0, max_timeout=10.0)
+    assert tracker.timeout("m") == tracker.default_timeout
+    tracker.record("m", 2.0)
+    tracker.record("m", 2.0)
+    assert tracker.timeout("m") == 6.0
+
+
+def test_sync_loser_is_cancelled():
+    primary = SimpleNamespace(key_id="primary", model="m")
+    discarded = threading.Event()
+    seen = {}
+
+    def send(racer, cancel):
+        if racer is primary:
+            # Медленный запрос: ждёт, пока его не отменят (как обрыв сокета транспортом)
+            seen['cancelled'] = cancel.cancel_event.wait(5)
+            raise RuntimeError("aborted")
+        return "fast"
+
+    def discard(racer, response, error):
+        seen['discarded'] = racer
+        discarded.set()
+
+    start = time.time()
+    lease, response, error = make_hedger().run(
+        primary, 0, send, is_success=lambda response: True, settle=lambda *item: None, discard=discard
+    )
+
+    assert (lease.key_id, response, error) == ("hedge", "fast", None)
+    assert discarded.wait(2)
+    assert seen == {'cancelled': True, 'discarded': primary}
+    assert time.time() - start < 2
+
+
+def test_sync_run_follows_run_cancel():
+    primary = SimpleNamespace(key_id="primary", model="m")
+    run_cancel = CancelToken()
+
+    def send(racer, cancel):
+        if cancel.cancel_event.wait(5):
+            raise RuntimeError("aborted")
+        return "late"
+
+    threading.Timer(0.2, run_cancel.cancel).start()
+    start = time.time()
+    _, response, error = make_hedger().run(
+        primary, 0, send, is_success=lambda response: True, settle=lambda *item: None,
+        discard=lambda *item: None, cancel=run_cancel
+    )
+
+    assert response is None and isinstance(error, RuntimeError)
+    assert time.time() - start < 2
+    assert not run_cancel.callbacks
+
+
+def test_async_loser_is_cancelled():
+    primary = SimpleNamespace(key_id="primary", model="m")
+    discarded = []
+
+    async def send(racer):
+        if racer is primary:
+            await asyncio.sleep(5)
+        return "fast"
+
+    async def main():
+        return await make_hedger().run_async(
+            primary, 0, send, is_success=lambda response: True, settle=lambda *item: None,
+            discard=lambda racer, response, error: discarded.append(racer)
+        )
+
+    lease, response, error = asyncio.run(main())
+    assert (lease.key_id, response, error) == ("hedge", "fast", None)
+    assert discarded == [primary]
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from logic.http_transport import HttpTransport
+from utils.fake_groq_server import FakeGroqServer
+
+
+QUIET = SimpleNamespace(log=lambda message, level="info": None)
+
+
+def test_pool_resize_closes_replaced_adapter():
+    server = FakeGroqServer(port=0).start()
+    try:
+        transport = HttpTransport(pool_size=2, logger=QUIET)
+        url = f"{server.base_url}/openai/v1/models"
+        headers = {"Authorization": "Bearer gsk_test_aaaaaaaa"}
+        response, _ = transport.get(url, headers=headers, timeout=5)
+        assert response.status_code == 200
+
+        old = transport.session.adapters['http://']
+        assert len(old.poolmanager.pools) == 1
+
+        # Уменьшать пул не нужно - адаптер остаётся прежним
+        transport.ensure_pool_size(1)
+        assert transport.session.adapters['http://'] is old
+
+        transport.ensure_pool_size(8)
+        new = transport.session.adapters['http://']
+        assert new is not old and new is transport.session.adapters['https://']
+        assert len(old.poolmanager.pools) == 0
+
+        response, timing = transport.get(url, headers=headers, timeout=5)
+        assert response.status_code == 200 and not timing.reused
+    finally:
+        server.stop()
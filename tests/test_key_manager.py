@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+HEADERS = {
+    "x-ratelimit-limit-requests": "1000",
+    "x-ratelimit-remaining-requests": "990",
+    "x-ratelimit-limit-tokens": "6000",
+    "x-ratelimit-remaining-tokens": "5000",
+}
+
+
+def test_concurrent_leases_use_different_keys(keys):
+    first = keys.acquire_lease("m", 100)
+    second = keys.acquire_lease("m", 100)
+    assert {first.key_id, second.key_id} == {"aaaaaaaa", "bbbbbbbb"}
+    assert keys.active_leases == {"aaaaaaaa": 1, "bbbbbbbb": 1}
+
+
+def test_release_credits_the_leased_key(keys):
+    first = keys.acquire_lease("m", 100)
+    second = keys.acquire_lease("m", 100)
+    # Ответ первой аренды пришёл после выдачи второй - учитывается на своём ключе
+    keys.release_lease(first, "success", HEADERS)
+    assert keys.keys_limits[first.key_id]['total_requests'] == 1
+    assert second.key_id not in keys.keys_limits
+
+    keys.release_lease(first, "success", HEADERS)
+    assert keys.keys_limits[first.key_id]['total_requests'] == 1
+    assert keys.active_leases == {second.key_id: 1}
+
+
+def test_invalid_key_is_excluded_after_three_strikes(keys):
+    for _ in range(3):
+        lease = keys.lease_key("gsk_test_aaaaaaaa", "m")
+        keys.release_lease(lease, "invalid")
+    assert keys.get_key_status("aaaaaaaa", "m") == "invalid"
+    assert {keys.acquire_lease("m").key_id for _ in range(3)} == {"bbbbbbbb"}
+
+
+def test_racing_releases_settle_lease_once(keys):
+    kept = keys.lease_key("gsk_test_aaaaaaaa", "m")
+    lease = keys.lease_key("gsk_test_aaaaaaaa", "m")
+    threads = [threading.Thread(target=keys.release_lease, args=(lease, "cancelled")) for _ in range(2)]
+    # Оба release стартуют, пока состояние занято другим потоком
+    with keys.state_lock:
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+    for thread in threads:
+        thread.join()
+    assert keys.active_leases == {"aaaaaaaa": 1}
+    keys.release_lease(kept, "cancelled")
+    assert keys.active_leases == {}
+
+
+def test_credits_reach_key_without_stats_entry(keys):
+    keys.add_prompts_generated("gsk_test_aaaaaaaa", 5)
+    keys.add_file_processed("gsk_test_aaaaaaaa")
+    assert keys.keys_limits["aaaaaaaa"]['prompts_generated'] == 5
+    assert keys.keys_limits["aaaaaaaa"]['files_processed'] == 1
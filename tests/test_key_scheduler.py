@@ -0,0 +1,103 @@
+import time
+
+from logic.key_scheduler import KeyScheduler
+
+
+KEYS = ["gsk_test_aaaaaaaa", "gsk_test_bbbbbbbb", "gsk_test_cccccccc"]
+
+
+class Limiter:
+    """Лимитер с заданными запасом квоты и ожиданием по ключам"""
+
+    def __init__(self):
+        self.headrooms = {}
+        self.waits = {}
+
+    def headroom(self, key_id, model):
+        return self.headrooms.get(key_id, 1.0)
+
+    def time_to_full(self, key_id, model):
+        return 0.0
+
+    def wait_time(self, key_id, model, tokens=0):
+        return self.waits.get(key_id, 0.0)
+
+
+def make_scheduler(**headrooms):
+    limiter = Limiter()
+    limiter.headrooms.update(headrooms)
+    scheduler = KeyScheduler(limiter)
+    scheduler.sync_keys(KEYS)
+    return scheduler, limiter
+
+
+def test_best_headroom_first():
+    scheduler, _ = make_scheduler(aaaaaaaa=0.2, bbbbbbbb=0.9, cccccccc=0.5)
+    order = [scheduler.acquire("m")[-8:] for _ in KEYS]
+    assert order == ["bbbbbbbb", "cccccccc", "aaaaaaaa"]
+    assert scheduler.acquire("m") is None
+
+
+def test_requeue_uses_fresh_priority():
+    scheduler, limiter = make_scheduler(aaaaaaaa=0.9, bbbbbbbb=0.5, cccccccc=0.1)
+    key_id = scheduler.acquire("m")[-8:]
+    limiter.headrooms[key_id] = 0.0
+    scheduler.requeue(key_id, "m")
+    assert scheduler.acquire("m")[-8:] == "bbbbbbbb"
+
+
+def test_exhausted_key_is_parked_until_ready():
+    scheduler, limiter = make_scheduler()
+    limiter.waits = {key[-8:]: 30.0 for key in KEYS}
+    assert scheduler.acquire("m") is None
+    assert 29.0 < scheduler.next_ready_in("m") <= 30.0
+
+
+def test_exclude_and_min_headroom():
+    scheduler, _ = make_scheduler(aaaaaaaa=0.9, bbbbbbbb=0.5, cccccccc=0.1)
+    assert scheduler.acquire("m", exclude={"aaaaaaaa"})[-8:] == "bbbbbbbb"
+    # Исключённый ключ остаётся в очереди
+    assert scheduler.acquire("m")[-8:] == "aaaaaaaa"
+    assert scheduler.acquire("m", min_headroom=0.3) is None
+
+
+def test_suspended_key_skipped_until_resumed():
+    scheduler, _ = make_scheduler(aaaaaaaa=0.9, bbbbbbbb=0.5, cccccccc=0.1)
+    scheduler.next_ready_in("m")
+    scheduler.suspend("aaaaaaaa", time.time() + 60)
+    assert scheduler.acquire("m")[-8:] != "aaaaaaaa"
+    scheduler.resume_key("aaaaaaaa")
+    assert scheduler.acquire("m")[-8:] == "aaaaaaaa"
+
+
+def test_invalid_keys_and_new_keys():
+    scheduler, _ = make_scheduler()
+    scheduler.exclude("aaaaaaaa")
+    taken = {scheduler.acquire("m") for _ in KEYS}
+    assert "gsk_test_aaaaaaaa" not in taken
+
+    scheduler.sync_keys(KEYS + ["gsk_test_dddddddd"], invalid_ids={"aaaaaaaa"})
+    assert scheduler.acquire("m") == "gsk_test_dddddddd"
+    assert scheduler.next_ready_in("other") == 0.0
+
+
+def test_requeue_before_first_acquire_keeps_other_keys():
+    scheduler, _ = make_scheduler()
+    scheduler.requeue("aaaaaaaa", "m")
+    taken = {scheduler.acquire("m") for _ in KEYS}
+    assert taken == set(KEYS)
+
+
+def test_heaps_stay_bounded_over_long_run():
+    scheduler, limiter = make_scheduler(aaaaaaaa=0.9, bbbbbbbb=0.5, cccccccc=0.1)
+    for i in range(5000):
+        key_id = scheduler.acquire("m")[-8:]
+        # Запас квоты меняется от запроса к запросу, часть ключей уходит на парковку
+        limiter.waits[key_id] = 30.0 if i % 7 == 0 else 0.0
+        scheduler.requeue(key_id, "m")
+        scheduler.refresh(key_id, "m")
+        limiter.waits[key_id] = 0.0
+        scheduler.refresh(key_id, "m")
+    bound = 2 * len(KEYS) + 16 + 1
+    assert len(scheduler.ready["m"]) <= bound
+    assert len(scheduler.parked["m"]) <= bound
@@ -0,0 +1,57 @@
+import threading
+
+from utils.logger import Logger
+
+
+class FakeText:
+    """Виджет Text: запоминает вставки с потоком и отложенные after()"""
+
+    def __init__(self):
+        self.lines = []
+        self.scheduled = []
+
+    def insert(self, index, text, tag):
+        self.lines.append((text.split("] ", 1)[1].strip(), tag, threading.get_ident()))
+
+    def see(self, index):
+        pass
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def run_timers(self):
+        callbacks, self.scheduled = self.scheduled, []
+        for callback in callbacks:
+            callback()
+
+
+def test_worker_messages_are_written_on_widget_thread():
+    widget = FakeText()
+    logger = Logger()
+    logger.set_widget(widget)
+
+    worker = threading.Thread(target=lambda: logger.log("из воркера", "warning"))
+    worker.start()
+    worker.join()
+    assert widget.lines == []
+
+    widget.run_timers()
+    assert widget.lines == [("из воркера", "warning", threading.get_ident())]
+    assert widget.scheduled
+
+
+def test_order_is_kept_when_ui_thread_logs():
+    widget = FakeText()
+    logger = Logger(widget)
+
+    worker = threading.Thread(target=lambda: logger.log("первое"))
+    worker.start()
+    worker.join()
+    logger.log("второе")
+
+    assert [line[0] for line in widget.lines] == ["первое", "второе"]
+
+
+def test_console_without_widget(capsys):
+    Logger().log("в консоль")
+    assert "в консоль" in capsys.readouterr().out
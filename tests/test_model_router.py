@@ -0,0 +1,74 @@
+from logic.api_client import ApiResult
+from logic.model_router import ModelRouter
+
+
+BIG = "llama-3.3-70b-versatile"
+SMALL = "llama-3.1-8b-instant"
+
+
+def exhaust(keys, model, suffix, reset):
+    """Остаток 0 по заголовкам Groq на всех ключах"""
+    limits = {"tokens": "12000", "requests": "1000"}
+    for key in keys.api_keys:
+        keys.limiter.update_from_headers(key[-8:], model, {
+            f"x-ratelimit-limit-{suffix}": limits[suffix],
+            f"x-ratelimit-remaining-{suffix}": "0",
+            f"x-ratelimit-reset-{suffix}": reset,
+        })
+        keys.scheduler.refresh(key[-8:], model)
+
+
+def rate_limit(keys, model, retry_after):
+    """429 с retry-after на всех ключах (короткое ожидание RPM)"""
+    for key in keys.api_keys:
+        keys.limiter.on_rate_limited(key[-8:], model, {"retry-after": retry_after})
+        keys.scheduler.refresh(key[-8:], model)
+
+
+def test_short_tpm_wait_keeps_preferred_model(keys):
+    router = ModelRouter(keys, [BIG, SMALL], fallback_wait=60.0)
+    router.candidates("текст")
+    exhaust(keys, BIG, "tokens", "50s")
+
+    assert router.candidates("текст") == [BIG, SMALL]
+    assert not router.should_fallback(ApiResult(None, "no_keys"), BIG)
+
+
+def test_short_rpm_wait_keeps_preferred_model(keys):
+    router = ModelRouter(keys, [BIG, SMALL], fallback_wait=60.0)
+    router.candidates("текст")
+    rate_limit(keys, BIG, "20")
+
+    assert 0 < keys.scheduler.next_ready_in(BIG) <= 60
+    assert router.candidates("текст") == [BIG, SMALL]
+    assert not router.should_fallback(ApiResult(None, "no_keys"), BIG)
+
+
+def test_daily_quota_exhausted_falls_back(keys):
+    router = ModelRouter(keys, [BIG, SMALL], fallback_wait=60.0)
+    router.candidates("текст")
+    exhaust(keys, BIG, "requests", "30s")
+
+    assert keys.daily_quota_exhausted(BIG)
+    assert router.candidates("текст") == [SMALL, BIG]
+    assert router.should_fallback(ApiResult(None, "no_keys"), BIG)
+
+
+def test_long_wait_falls_back(keys):
+    router = ModelRouter(keys, [BIG, SMALL], fallback_wait=10.0)
+    router.candidates("текст")
+    rate_limit(keys, BIG, "20")
+
+    assert router.candidates("текст") == [SMALL, BIG]
+    assert router.should_fallback(ApiResult(None, "no_keys"), BIG)
+
+
+def test_unavailable_model_always_falls_back(keys):
+    router = ModelRouter(keys, [BIG, SMALL])
+    assert router.should_fallback(ApiResult(None, "model_unavailable"), BIG)
+    assert not router.should_fallback(ApiResult(None, "failed"), BIG)
+
+
+def test_rules_skip_long_chunks(keys):
+    router = ModelRouter(keys, [BIG, SMALL], max_chars={SMALL: 10})
+    assert router.candidates("x" * 50) == [BIG]
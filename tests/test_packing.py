@@ -0,0 +1,71 @@
+import pytest
+
+from logic.api_client import ApiResult, GroqAPIClient
+from logic.file_processor import FileProcessor
+
+
+def prompts(tag, count=3):
+    return "\n".join(f"{i}. A detailed historical illustration prompt {tag}{i}" for i in range(1, count + 1))
+
+
+def write_chunks(folder, sizes):
+    paths = []
+    for number, size in enumerate(sizes, start=1):
+        path = folder / f"{number:02d}.txt"
+        path.write_text("x" * size, encoding="utf-8")
+        paths.append(path)
+    return list(enumerate(paths))
+
+
+def test_plan_packs_by_count_and_size(tmp_path):
+    items = write_chunks(tmp_path, [100, 100, 100, 500, 100])
+    by_count = FileProcessor.plan_packs(items, pack_size=2)
+    assert [[index for index, _ in pack] for pack in by_count] == [[0, 1], [2, 3], [4]]
+
+    # Крупный чанк не влезает к соседям и идёт отдельно
+    by_size = FileProcessor.plan_packs(items, pack_size=10, max_chars=350)
+    assert [[index for index, _ in pack] for pack in by_size] == [[0, 1, 2], [3], [4]]
+
+
+def test_split_pack_response_tolerates_marker_variants():
+    text = f"### ЧАНК 1\n{prompts('a')}\n\n## чанк 2 ##\n{prompts('b')}\nЧАНК 3\n"
+    sections = FileProcessor.split_pack_response(text)
+    assert sorted(sections) == [1, 2, 3]
+    assert FileProcessor(None).parse_prompts(sections[2]) == [
+        f"A detailed historical illustration prompt b{i}" for i in range(1, 4)
+    ]
+    assert sections[3].strip() == ""
+
+
+def test_split_pack_response_without_markers():
+    assert FileProcessor.split_pack_response(prompts('a')) == {}
+
+
+@pytest.fixture
+def processor(make_keys):
+    return FileProcessor(GroqAPIClient(make_keys(keys=["gsk_test_aaaaaaaa"]), config={}))
+
+
+def test_unparsed_chunk_falls_back_to_single_request(tmp_path, processor, monkeypatch):
+    requests = []
+
+    def send_request(user_message, system_prompt, **kwargs):
+        requests.append(user_message)
+        if len(requests) == 1:
+            # Модель пропустила маркер второго чанка
+            return ApiResult(f"### ЧАНК 1\n{prompts('a')}\n", "success")
+        return ApiResult(prompts('b'), "success")
+
+    monkeypatch.setattr(processor.api_client, "send_request", send_request)
+    chunks = tmp_path / "chunks"
+    chunks.mkdir()
+    files = [path for _, path in write_chunks(chunks, [50, 60])]
+    output = tmp_path / "prompts"
+    output.mkdir()
+
+    results = processor.process_pack(files, output, "system {n}", "m", 1.0, 3)
+
+    assert results == [(True, "success"), (True, "success")]
+    assert len(requests) == 2
+    assert "### ЧАНК 2" in requests[0] and "ЧАНК" not in requests[1]
+    assert (output / "02.txt").read_text(encoding="utf-8").splitlines()[0].endswith("b1")
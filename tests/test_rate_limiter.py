@@ -0,0 +1,91 @@
+import pytest
+
+from logic.rate_limiter import RateLimiter, TokenBucket, parse_duration
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1m30s", 90.0),
+    ("7.66s", 7.66),
+    ("2h0m1s", 7201.0),
+    ("120ms", 0.12),
+    ("15", 15.0),
+    (3, 3.0),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", [None, "", "  ", "soon"])
+def test_parse_duration_invalid(value):
+    assert parse_duration(value) is None
+
+
+def test_bucket_refills_linearly():
+    bucket = TokenBucket(60, 60)
+    bucket.consume(60, now=1000.0)
+    assert bucket.time_until(1, now=1000.0) == pytest.approx(1.0)
+    assert bucket.available(now=1030.0) == pytest.approx(30.0)
+    assert bucket.time_to_full(now=1030.0) == pytest.approx(30.0)
+
+
+def test_request_above_capacity_waits_for_full_bucket():
+    bucket = TokenBucket(100, 60)
+    bucket.consume(50, now=1000.0)
+    assert bucket.time_until(500, now=1000.0) == pytest.approx(30.0)
+
+
+def test_reset_hint_does_not_delay_partial_refill():
+    # TPM 6000, осталось 0, сервер обещает полный сброс через 50 с:
+    # 600 токенов накапливаются за 6 с, ждать весь сброс не нужно
+    bucket = TokenBucket(6000, 60)
+    bucket.correct(0, 6000, reset_seconds=50.0, now=1000.0)
+    assert bucket.time_until(600, now=1000.0) == pytest.approx(6.0)
+    assert bucket.time_to_full(now=1000.0) == pytest.approx(50.0)
+
+
+def test_reset_hint_restores_full_capacity():
+    bucket = TokenBucket(6000, 60)
+    bucket.correct(0, 6000, reset_seconds=5.0, now=1000.0)
+    assert bucket.time_until(6000, now=1000.0) == pytest.approx(5.0)
+    assert bucket.available(now=1005.0) == pytest.approx(6000.0)
+
+
+def test_block_holds_refill_until_retry_after():
+    bucket = TokenBucket(30, 60)
+    bucket.block(10.0, now=1000.0)
+    assert bucket.available(now=1005.0) == 0.0
+    assert bucket.time_until(1, now=1005.0) == pytest.approx(5.0 + 2.0)
+
+
+def test_limiter_reads_groq_headers():
+    limiter = RateLimiter({"m": {"rpm": 30, "tpm": 6000, "rpd": 1000, "tpd": 100000}})
+    limiter.update_from_headers("key", "m", {
+        "x-ratelimit-limit-requests": "1000",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1m26.4s",
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-tokens": "6000",
+    })
+    assert limiter.blocking_bucket("key", "m", tokens=100) == "rpd"
+    assert limiter.wait_time("key", "m", tokens=100) == pytest.approx(86.4, abs=0.5)
+
+
+def test_token_rate_limit_blocks_tpm_until_reset():
+    limiter = RateLimiter({"m": {"rpm": 30, "tpm": 6000, "rpd": 1000, "tpd": 100000}})
+    # 429 по TPM без retry-after: остатка токенов не хватает на запрос
+    limiter.on_rate_limited("key", "m", {
+        "x-ratelimit-remaining-tokens": "300",
+        "x-ratelimit-reset-tokens": "12s",
+    }, tokens=2000)
+    # TPM заблокирован на 12 с, затем 100 токенов копятся ещё 1 с; RPM пополнится уже через 2 с
+    assert limiter.wait_time("key", "m", tokens=100) == pytest.approx(13.0, abs=0.5)
+
+
+def test_request_rate_limit_leaves_tpm_alone():
+    limiter = RateLimiter({"m": {"rpm": 30, "tpm": 6000, "rpd": 1000, "tpd": 100000}})
+    limiter.on_rate_limited("key", "m", {
+        "x-ratelimit-remaining-tokens": "5800",
+        "x-ratelimit-reset-tokens": "2s",
+    }, tokens=2000)
+    assert limiter.blocking_bucket("key", "m", tokens=100) == "rpm"
+    assert limiter.wait_time("key", "m", tokens=100) == pytest.approx(2.0, abs=0.5)
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from logic.api_client import ApiResult, GroqAPIClient
+from logic.file_processor import FileProcessor
+from logic.response_cache import ResponseCache
+
+
+GOOD_ANSWER = "\n".join(f"{i}. A detailed historical illustration prompt number {i}" for i in range(1, 4))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache"))
+
+
+def test_get_or_load_caches_successful_answers(cache):
+    key = cache.make_key("m", "system", "text", 1.0)
+    assert cache.get_or_load(key, lambda: "answer") == ("answer", False)
+    assert cache.get_or_load(key, lambda: pytest.fail("должен быть ответ из кэша")) == ("answer", True)
+
+
+def test_failed_load_is_not_cached(cache):
+    key = cache.make_key("m", "system", "text", 1.0)
+    assert cache.get_or_load(key, lambda: None) == (None, False)
+    assert cache.get(key) is None
+
+
+def test_discard_removes_entry(cache):
+    key = cache.make_key("m", "system", "text", 1.0)
+    cache.put(key, "answer")
+    cache.discard(key)
+    assert cache.get(key) is None
+
+
+def test_single_flight(cache):
+    key = cache.make_key("m", "system", "text", 1.0)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(key, loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(cached for _, cached in results) == [False, True, True, True, True]
+
+
+@pytest.fixture
+def processor(tmp_path, make_keys):
+    keys = make_keys(keys=["gsk_test_aaaaaaaa"])
+    client = GroqAPIClient(keys, config={'response_cache': True, 'response_cache_dir': str(tmp_path / "cache")})
+    return FileProcessor(client)
+
+
+def run_twice(tmp_path, processor, monkeypatch, answer):
+    """Два прогона одного чанка; возвращает итоги и число запросов мимо кэша"""
+    sent = []
+
+    def send_uncached(*args, **kwargs):
+        sent.append(1)
+        return ApiResult(answer, "success")
+
+    monkeypatch.setattr(processor.api_client, "_send_uncached", send_uncached)
+    chunk = tmp_path / "01.txt"
+    chunk.write_text("Текст чанка", encoding="utf-8")
+    (tmp_path / "prompts").mkdir(exist_ok=True)
+    results = [
+        processor.process_file(chunk, tmp_path / "prompts", "system {n}", "m", 1.0, 3)
+        for _ in range(2)
+    ]
+    return results, len(sent)
+
+
+def test_parse_error_answer_is_evicted(tmp_path, processor, monkeypatch):
+    results, sent = run_twice(tmp_path, processor, monkeypatch, "not a prompt")
+    assert results == [(False, "parse_error"), (False, "parse_error")]
+    assert sent == 2
+
+
+def test_good_answer_is_replayed(tmp_path, processor, monkeypatch):
+    results, sent = run_twice(tmp_path, processor, monkeypatch, GOOD_ANSWER)
+    assert results == [(True, "success"), (True, "success")]
+    assert sent == 1
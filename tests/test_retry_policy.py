@@ -0,0 +1,51 @@
+import random
+from types import SimpleNamespace
+
+from logic.retry_policy import RetryBudget, RetryEngine, RetryPolicy
+
+
+def make_engine(ready_in=0.0, max_wait=60.0):
+    """RetryEngine с планировщиком, у которого ближайший ключ освободится через ready_in"""
+    scheduler = SimpleNamespace(next_ready_in=lambda model: ready_in)
+    return RetryEngine(SimpleNamespace(scheduler=scheduler), max_wait=max_wait, rng=random.Random(1))
+
+
+def test_backoff_is_capped_full_jitter():
+    policy = RetryPolicy(base=1.0, cap=4.0)
+    rng = random.Random(1)
+    delays = [policy.backoff(attempt, rng=rng) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    assert len(set(delays)) == len(delays)
+
+
+def test_backoff_honors_retry_after():
+    policy = RetryPolicy(base=0.1, cap=0.2)
+    assert policy.backoff(0, {'retry-after': '7'}, random.Random(1)) == 7.0
+    assert RetryPolicy(base=0.1, cap=0.2, honor_retry_after=False).backoff(0, {'retry-after': '7'}) <= 0.2
+
+
+def test_client_errors_are_not_retried():
+    engine = make_engine()
+    assert engine.next_delay("error", 0, "m", status_code=400) is None
+    assert engine.next_delay("error", 0, "m", status_code=500) is not None
+
+
+def test_rate_limited_waits_for_next_key():
+    assert make_engine(ready_in=0.0).next_delay("rate_limited", 0, "m") == 0.0
+    assert 3.0 <= make_engine(ready_in=3.0).next_delay("rate_limited", 0, "m") <= 4.0
+    # Все ключи выбыли или ждать дольше max_wait - не повторять
+    assert make_engine(ready_in=None).next_delay("rate_limited", 0, "m") is None
+    assert make_engine(ready_in=90.0, max_wait=60.0).next_delay("rate_limited", 0, "m") is None
+
+
+def test_budget_limits_retries():
+    budget = RetryBudget(2)
+    engine = make_engine()
+    delays = [engine.next_delay("server_error", 0, "m", budget=budget) for _ in range(3)]
+    assert delays[2] is None and None not in delays[:2]
+    assert budget.exhausted
+
+
+def test_budget_for_files():
+    assert RetryBudget.for_files(4).retries == 10
+    assert RetryBudget.for_files(100).retries == 50
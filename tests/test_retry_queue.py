@@ -0,0 +1,91 @@
+import json
+import math
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from logic.cancellation import CancelToken
+from logic.retry_queue import DeadLetters, DeferredRetryQueue
+
+
+QUIET = SimpleNamespace(log=lambda message, level="info": None)
+
+
+def make_queue(tmp_path, count=2, max_attempts=1, cooldown=0.0, key_manager=None, models=()):
+    packs = [[(index, Path(f"{index + 1:02d}.txt"))] for index in range(count)]
+    dead = DeadLetters(str(tmp_path), QUIET)
+    return DeferredRetryQueue(packs, key_manager, models, max_attempts=max_attempts, cooldown=cooldown,
+                              dead_letters=dead, logger=QUIET)
+
+
+def test_failed_file_is_retried_before_fresh_files(tmp_path):
+    queue = make_queue(tmp_path, count=2)
+    first, _ = queue.poll()
+    assert queue.complete(first, [(False, "failed")]) == []
+
+    retry, _ = queue.poll()
+    assert retry == first
+    assert queue.complete(retry, [(True, "success")]) == [(0, True, "success")]
+    assert queue.poll()[0] == [(1, Path("02.txt"))]
+
+
+def test_exhausted_retries_go_to_dead_letters(tmp_path):
+    queue = make_queue(tmp_path, count=1, max_attempts=1)
+    pack, _ = queue.poll()
+    queue.complete(pack, [(False, "parse_error")])
+    pack, _ = queue.poll()
+    assert queue.complete(pack, [(False, "parse_error")]) == [(0, False, "parse_error")]
+    assert queue.poll() == (None, None)
+
+    queue.close()
+    entries = json.loads((tmp_path / DeadLetters.FILE_NAME).read_text(encoding="utf-8"))
+    assert entries["01.txt"]["status"] == "parse_error" and entries["01.txt"]["attempts"] == 2
+
+
+def test_non_retryable_status_is_final(tmp_path):
+    queue = make_queue(tmp_path, count=1, max_attempts=3)
+    pack, _ = queue.poll()
+    assert queue.complete(pack, [(False, "save_error")]) == [(0, False, "save_error")]
+
+
+def test_poll_reports_wait_for_cooldown_and_in_flight(tmp_path):
+    queue = make_queue(tmp_path, count=1, cooldown=30.0)
+    pack, _ = queue.poll()
+    assert queue.poll() == (None, math.inf)
+    queue.complete(pack, [(False, "failed")])
+    _, wait = queue.poll()
+    assert 29.0 < wait <= 30.0
+
+
+def test_cooldown_waits_for_model_keys(tmp_path):
+    key_manager = SimpleNamespace(scheduler=SimpleNamespace(next_ready_in=lambda model: 45.0),
+                                  model_wait=lambda model: 0.0)
+    queue = make_queue(tmp_path, count=1, cooldown=10.0, key_manager=key_manager, models=["m"])
+    assert queue._cooldown(1) == 45.0
+
+
+def test_take_wakes_on_cancel(tmp_path):
+    queue = make_queue(tmp_path, count=1, cooldown=30.0)
+    pack = queue.take()
+    queue.complete(pack, [(False, "failed")])
+
+    cancel = CancelToken()
+    threading.Timer(0.1, cancel.cancel).start()
+    start = time.time()
+    assert queue.take(cancel) is None
+    assert time.time() - start < 1.0
+    assert queue.drain() == [(0, False, "failed")]
+
+
+def test_success_clears_dead_letter(tmp_path):
+    dead = DeadLetters(str(tmp_path), QUIET)
+    dead.add(Path("01.txt"), "failed", 3)
+    dead.save()
+    assert (tmp_path / DeadLetters.FILE_NAME).exists()
+
+    queue = make_queue(tmp_path, count=1)
+    pack, _ = queue.poll()
+    queue.complete(pack, [(True, "success")])
+    queue.close()
+    assert not (tmp_path / DeadLetters.FILE_NAME).exists()
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+from logic.run_journal import RunJournal
+
+
+QUIET = SimpleNamespace(log=lambda message, level="info": None)
+
+
+def setup_run(tmp_path, count=3):
+    """Чанки и папка промптов; все файлы обработаны успешно"""
+    chunks = tmp_path / "chunks"
+    output = tmp_path / "prompts"
+    chunks.mkdir()
+    output.mkdir()
+    files = []
+    for number in range(1, count + 1):
+        chunk = chunks / f"{number:02d}.txt"
+        chunk.write_text(f"Текст чанка {number}", encoding="utf-8")
+        files.append((number - 1, chunk))
+
+    journal = RunJournal(str(output), "cfg", logger=QUIET)
+    for _, chunk in files:
+        (output / chunk.name).write_text("prompt\n", encoding="utf-8")
+        journal.record(chunk, True, "success")
+    return files, output
+
+
+def test_finished_files_are_skipped_after_restart(tmp_path):
+    files, output = setup_run(tmp_path)
+    todo, done = RunJournal(str(output), "cfg", logger=QUIET).split(files)
+    assert (todo, done) == ([], [0, 1, 2])
+
+
+def test_changed_chunk_output_or_config_is_redone(tmp_path):
+    files, output = setup_run(tmp_path)
+    files[0][1].write_text("Новый текст", encoding="utf-8")
+    (output / files[1][1].name).write_text("edited\n", encoding="utf-8")
+
+    todo, done = RunJournal(str(output), "cfg", logger=QUIET).split(files)
+    assert [index for index, _ in todo] == [0, 1] and done == [2]
+
+    todo, done = RunJournal(str(output), "other", logger=QUIET).split(files)
+    assert len(todo) == 3 and done == []
+
+
+def test_failure_and_cancel(tmp_path):
+    files, output = setup_run(tmp_path)
+    journal = RunJournal(str(output), "cfg", logger=QUIET)
+    journal.record(files[0][1], False, "parse_error")
+    journal.record(files[1][1], False, "cancelled")
+
+    # Последняя запись решает; отмена не записывается
+    todo, done = RunJournal(str(output), "cfg", logger=QUIET).split(files)
+    assert [index for index, _ in todo] == [0] and done == [1, 2]
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    files, output = setup_run(tmp_path)
+    with open(output / RunJournal.FILE_NAME, 'a', encoding='utf-8') as f:
+        f.write('{"chunk": "01.txt", "sta')
+    todo, done = RunJournal(str(output), "cfg", logger=QUIET).split(files)
+    assert done == [0, 1, 2]
+
+
+def test_compaction_keeps_last_records(tmp_path):
+    files, output = setup_run(tmp_path, count=1)
+    journal = RunJournal(str(output), "cfg", logger=QUIET)
+    for _ in range(150):
+        journal.record(files[0][1], True, "success")
+
+    RunJournal(str(output), "cfg", logger=QUIET)
+    lines = (output / RunJournal.FILE_NAME).read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+
+
+def test_fingerprint_depends_on_answer_settings():
+    job = {'system_prompt': "system", 'model': "m", 'temperature': 1, 'prompts_count': 5, 'delay': 1}
+    fingerprint = RunJournal.fingerprint_job(job)
+    assert RunJournal.fingerprint_job(dict(job, delay=5, temperature=1.0)) == fingerprint
+    assert RunJournal.fingerprint_job(dict(job, model="other")) != fingerprint
+    assert RunJournal.fingerprint_job(dict(job, verification_prompt="check")) != fingerprint
@@ -0,0 +1,52 @@
+import json
+
+from logic.api_client import GroqAPIClient
+from logic.file_processor import FileProcessor, PromptStreamParser
+
+
+PROMPTS = [f"A detailed historical illustration prompt number {i}" for i in range(1, 4)]
+
+
+def test_prompt_ready_at_end_of_its_line():
+    seen = []
+    parser = PromptStreamParser(on_prompt=seen.append)
+    parser.feed("1. " + PROMPTS[0][:10])
+    assert seen == []
+    parser.feed(PROMPTS[0][10:] + "\n2. " + PROMPTS[1])
+    assert seen == [PROMPTS[0]]
+    assert parser.finish() == PROMPTS[:2]
+
+
+def test_limit_stops_reading():
+    parser = PromptStreamParser(limit=2)
+    text = "".join(f"{i}. {prompt}\n" for i, prompt in enumerate(PROMPTS, 1))
+    assert parser.feed(text) is True
+    assert parser.prompts == PROMPTS[:2]
+
+
+def test_stream_and_batch_parsing_agree():
+    text = "Вот промпты:\n\n" + "\n".join(f"{i}) {prompt}" for i, prompt in enumerate(PROMPTS, 1))
+    parser = PromptStreamParser()
+    # Кусками по 7 символов, как приходят дельты SSE
+    for start in range(0, len(text), 7):
+        parser.feed(text[start:start + 7])
+    assert parser.finish() == FileProcessor(None).parse_prompts(text)
+    assert parser.text == text
+
+
+def test_reset_drops_previous_attempt():
+    parser = PromptStreamParser()
+    parser.feed(PROMPTS[0] + "\n")
+    parser.reset()
+    assert (parser.prompts, parser.text) == ([], "")
+
+
+def test_sse_lines():
+    chunk = {"choices": [{"delta": {"content": "Hello"}, "finish_reason": None}]}
+    assert GroqAPIClient._parse_sse_line("data: " + json.dumps(chunk)) == ("Hello", False, None)
+    assert GroqAPIClient._parse_sse_line(": keep-alive") == ("", False, None)
+    assert GroqAPIClient._parse_sse_line("data: [DONE]") == ("", True, None)
+
+    usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    last = {"choices": [{"delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+    assert GroqAPIClient._parse_sse_line("data: " + json.dumps(last)) == ("", True, usage)
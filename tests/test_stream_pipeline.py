@@ -0,0 +1,69 @@
+import json
+import threading
+
+from logic.stream_pipeline import StreamingPipeline
+
+
+class FakeProcessor:
+    """FileProcessor без API: записывает промпты и запоминает параметры вызова"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def process_file(self, file_path, chunk_text, output_folder, **job):
+        with self.lock:
+            self.calls.append(dict(job, file=file_path.name))
+        if file_path.name in self.fail:
+            return False, "failed"
+        (output_folder / file_path.name).write_text(chunk_text.upper(), encoding="utf-8")
+        return True, "success"
+
+
+def run(tmp_path, processor, job):
+    pipeline = StreamingPipeline(processor, key_manager=None, max_workers=2, queue_size=1)
+    job = dict(job, output_folder=tmp_path / "prompts", model="m", temperature=1.0)
+    job["output_folder"].mkdir()
+    results = []
+    pipeline.run_chunks(
+        ["первый", "второй", "третий"], tmp_path / "chunks", job,
+        progress_callback=lambda index, file_path, success, status, elapsed: results.append((index, success))
+    )
+    return results
+
+
+def test_generates_every_chunk_in_order(tmp_path):
+    processor = FakeProcessor()
+    results = run(tmp_path, processor, {})
+
+    assert results == [(0, True), (1, True), (2, True)]
+    assert (tmp_path / "chunks" / "02.txt").read_text(encoding="utf-8") == "второй"
+    assert (tmp_path / "prompts" / "03.txt").read_text(encoding="utf-8") == "ТРЕТИЙ"
+
+
+def test_deferred_mode_retry_cap_is_dropped(tmp_path):
+    # create_job урезает max_retries под отложенные повторы - у конвейера их нет
+    processor = FakeProcessor()
+    run(tmp_path, processor, {"deferred_retries": 2, "deferred_retry_cooldown": 10.0, "max_retries": 2})
+
+    assert processor.calls
+    for call in processor.calls:
+        assert "max_retries" not in call
+        assert "deferred_retries" not in call
+
+
+def test_explicit_retry_cap_is_kept(tmp_path):
+    processor = FakeProcessor()
+    run(tmp_path, processor, {"max_retries": 5})
+
+    assert all(call["max_retries"] == 5 for call in processor.calls)
+
+
+def test_failures_go_to_dead_letters(tmp_path):
+    processor = FakeProcessor(fail={"02.txt"})
+    results = run(tmp_path, processor, {})
+
+    assert results == [(0, True), (1, False), (2, True)]
+    failed = json.loads((tmp_path / "prompts" / "failed.json").read_text(encoding="utf-8"))
+    assert list(failed) == ["02.txt"]
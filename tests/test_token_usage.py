@@ -0,0 +1,29 @@
+from logic.token_usage import TokenEstimator, TokenUsage
+
+
+def test_default_estimate_without_samples():
+    estimator = TokenEstimator(default_output=600)
+    prompt, total = estimator.estimate("m", "x" * 400)
+    assert total == prompt + 600
+
+
+def test_estimate_calibrates_from_usage():
+    estimator = TokenEstimator(default_output=600, min_samples=3)
+    for _ in range(3):
+        estimator.observe("m", 800, TokenUsage(prompt_tokens=200, completion_tokens=300))
+    assert estimator.prompt_tokens("m", 800) == 201
+    assert estimator.output_tokens("m") == 300
+
+
+def test_seed_source_is_read_lazily_once():
+    calls = []
+
+    def source():
+        calls.append(1)
+        return {"m": {"requests": 10, "tokens_out": 2500}}
+
+    estimator = TokenEstimator(default_output=600, seed_source=source)
+    assert calls == []
+    assert estimator.output_tokens("m") == 250
+    assert estimator.output_tokens("m") == 250
+    assert calls == [1]
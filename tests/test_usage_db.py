@@ -0,0 +1,104 @@
+import sqlite3
+import time
+
+import pytest
+
+from logic.usage_db import SCHEMA, UsageDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = UsageDatabase(str(tmp_path / "usage.db"), flush_interval=0.05)
+    yield database
+    database.close()
+
+
+def reopen(database):
+    database.close()
+    return UsageDatabase(database.path, flush_interval=0.05)
+
+
+def test_totals_are_maintained_by_writer(db):
+    now = time.time()
+    db.record_event(now, "key1", "m", "success", 1.0, 100, 50)
+    db.record_event(now, "key1", "m", "failed", None, 0, 0)
+    db.record_event(now, "key2", "m", "success", 3.0, 10, 5)
+    db = reopen(db)
+    try:
+        keys = db.key_totals()
+        assert keys["key1"] == {"requests": 2, "errors": 1, "tokens_in": 100, "tokens_out": 50, "avg_latency": 1.0}
+        assert db.model_totals()["m"]["requests"] == 3
+        assert db.model_totals()["m"]["avg_latency"] == pytest.approx(2.0)
+    finally:
+        db.close()
+
+
+def test_all_time_totals_do_not_read_the_journal(db):
+    plan = db.read_conn.execute(
+        "EXPLAIN QUERY PLAN SELECT name FROM usage_totals WHERE scope = 'key'"
+    ).fetchall()
+    assert not any("request_events" in row[-1] for row in plan)
+
+
+def test_windowed_totals_and_counts(db):
+    now = time.time()
+    db.record_event(now - 3 * 86400, "key1", "m", "success", 1.0, 10, 10)
+    db.record_event(now - 60, "key1", "m", "success", 1.0, 10, 10)
+    db = reopen(db)
+    try:
+        since = now - 86400
+        assert db.key_totals(since)["key1"]["requests"] == 1
+        assert db.key_request_counts(since) == {"key1": 1}
+        assert db.key_totals()["key1"]["requests"] == 2
+    finally:
+        db.close()
+
+
+def test_totals_backfilled_for_existing_journal(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute("DROP TABLE usage_totals")
+    conn.executemany(
+        "INSERT INTO request_events (ts, key_id, model, status, latency, tokens_in, tokens_out) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(time.time(), "key1", "m", "success", 2.0, 7, 3)] * 5
+    )
+    conn.commit()
+    conn.close()
+
+    db = UsageDatabase(path, flush_interval=0.05)
+    db = reopen(db)
+    try:
+        assert db.key_totals()["key1"] == {"requests": 5, "errors": 0, "tokens_in": 35, "tokens_out": 15, "avg_latency": 2.0}
+    finally:
+        db.close()
+
+
+def test_invalid_keys_use_state_index(db):
+    db.save_state("key1", "", {"permanently_invalid": True})
+    db.save_state("key2", "", {"permanently_invalid": False})
+    db.save_state("key1", "m", {"rpm": {}})
+    db = reopen(db)
+    try:
+        assert db.invalid_keys() == {"key1"}
+        plan = db.read_conn.execute(
+            "EXPLAIN QUERY PLAN SELECT key_id FROM key_state "
+            "WHERE model = '' AND json_extract(data, '$.permanently_invalid') = 1"
+        ).fetchall()
+        assert any("idx_state_invalid" in row[-1] for row in plan)
+    finally:
+        db.close()
+
+
+def test_key_manager_stats_come_from_db(tmp_path, make_keys):
+    keys = make_keys(backend="sqlite", db_path=str(tmp_path / "usage.db"))
+    for _ in range(3):
+        keys.mark_key_invalid("gsk_test_aaaaaaaa")
+    # Состояние доходит до SQLite через очередь записи
+    deadline = time.time() + 5
+    while keys.get_stats("m")[2] == 0 and time.time() < deadline:
+        time.sleep(0.05)
+
+    # Без состояния в памяти счёт тот же - он пришёл из базы
+    keys.keys_limits = {}
+    assert keys.get_stats("m")[:3] == (1, 0, 1)
@@ -0,0 +1,124 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def atomic_write_text(path, text, encoding='utf-8', retries=5):
+    """
+    Атомарная запись файла: временный файл в той же папке + os.replace.
+
+    Читатель видит либо старое, либо новое содержимое целиком -
+    обрыв записи не оставит обрезанный файл.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # На Windows replace может временно упасть, если файл открыт читателем
+        for attempt in range(retries):
+            try:
+                os.replace(tmp_path, path)
+                return
+            except PermissionError:
+                if attempt == retries - 1:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Атомарная запись JSON"""
+    atomic_write_text(path, json.dumps(data, **dump_kwargs))
+
+
+class WriteBehindStore:
+    """💾 ОТЛОЖЕННАЯ ЗАПИСЬ: состояние помечается грязным и сбрасывается на диск не чаще раза в N секунд"""
+
+    def __init__(self, path, snapshot, flush_interval=2.0, logger=None):
+        """
+        path - файл назначения
+        snapshot - функция, возвращающая текст для записи (вызывается при сбросе)
+        flush_interval - минимальный интервал между записями, сек (0 - писать сразу)
+        """
+        self.path = path
+        self.snapshot = snapshot
+        self.flush_interval = flush_interval
+        self.logger = logger
+
+        self.dirty = False
+        self.dirty_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.writes = 0
+
+        self.thread = None
+        if self.flush_interval > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True, name="write-behind")
+            self.thread.start()
+
+        atexit.register(self.close)
+
+    def log(self, message, level="info"):
+        """Вывод в лог"""
+        if self.logger:
+            self.logger.log(message, level)
+        else:
+            print(message)
+
+    def mark_dirty(self):
+        """Отметить, что состояние изменилось"""
+        with self.dirty_lock:
+            self.dirty = True
+
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """Записать состояние на диск, если оно изменилось"""
+        with self.write_lock:
+            with self.dirty_lock:
+                if not self.dirty:
+                    return False
+                self.dirty = False
+
+            try:
+                atomic_write_text(self.path, self.snapshot())
+                self.writes += 1
+                return True
+            except Exception as e:
+                # Не потеряем изменения - попробуем в следующий раз
+                with self.dirty_lock:
+                    self.dirty = True
+                self.log(f"❌ Ошибка сохранения {self.path}: {str(e)}", "error")
+                return False
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Финальный сброс (при выходе из программы)"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        self.flush()
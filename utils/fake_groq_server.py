@@ -0,0 +1,587 @@
+"""
+Локальный заменитель Groq API для нагрузочных прогонов без траты квоты.
+
+    python -m utils.fake_groq_server --port 8000 --rate-429 0.05 --latency 0.8
+
+и в config.json: "api_base_url": "http://127.0.0.1:8000".
+
+Эндпоинты:
+    POST /openai/v1/chat/completions - обычный ответ и SSE поток (stream: true)
+    GET  /openai/v1/models           - список моделей
+    POST /openai/v1/files, POST /openai/v1/batches, GET /openai/v1/batches/{id},
+    GET  /openai/v1/files/{id}/content - Batch API (задание выполняется за batch_delay сек)
+
+RPM/TPM/RPD/TPD каждой пары (ключ, модель) считаются token bucket'ами
+с непрерывным пополнением по MODEL_LIMITS; ответы несут заголовки x-ratelimit-* и usage как у Groq.
+Задержка - логнормальная, доли 429/401/500/таймаутов задаются в FaultProfile.
+"""
+
+import argparse
+import email
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logic.model_limits import MODEL_LIMITS
+from logic.rate_limiter import DEFAULT_LIMITS
+from logic.token_usage import estimate_text_tokens
+
+
+# Лимиты: (имя, период, что считается)
+WINDOWS = (("rpm", 60, "requests"), ("tpm", 60, "tokens"), ("rpd", 86400, "requests"), ("tpd", 86400, "tokens"))
+
+
+class FaultProfile:
+    """Задержки и доли искусственных сбоев"""
+
+    def __init__(self, rate_429=0.0, rate_401=0.0, rate_500=0.0, rate_timeout=0.0, latency_median=0.5,
+                 latency_sigma=0.5, tokens_per_second=500, timeout_seconds=120, invalid_keys=(), seed=None):
+        self.rate_429 = rate_429
+        self.rate_401 = rate_401
+        self.rate_500 = rate_500
+        self.rate_timeout = rate_timeout
+        self.latency_median = latency_median    # медиана ожидания до первого байта, сек
+        self.latency_sigma = latency_sigma      # разброс логнормального распределения
+        self.tokens_per_second = tokens_per_second
+        self.timeout_seconds = timeout_seconds  # сколько "висит" запрос-таймаут
+        self.invalid_keys = set(invalid_keys)   # ключи, всегда получающие 401
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def pick_fault(self):
+        """Случайный сбой запроса: '429' / '401' / '500' / 'timeout' / None"""
+        with self.lock:
+            roll = self.rng.random()
+        for fault, rate in (("429", self.rate_429), ("401", self.rate_401), ("500", self.rate_500),
+                            ("timeout", self.rate_timeout)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def latency(self):
+        """Ожидание до первого байта, сек"""
+        if self.latency_median <= 0:
+            return 0.0
+        with self.lock:
+            return self.rng.lognormvariate(0.0, self.latency_sigma) * self.latency_median
+
+    def generation_time(self, tokens):
+        """Время генерации tokens токенов ответа, сек"""
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+class _Bucket:
+    """Token bucket с непрерывным пополнением (так Groq считает RPM/TPM/RPD/TPD)"""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated_at = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def remaining(self, now):
+        self._refill(now)
+        return int(self.tokens)
+
+    def wait_for(self, amount, now):
+        """Через сколько секунд в bucket будет amount (0 - сейчас)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reset_in(self, now):
+        """Через сколько секунд bucket полностью восстановится"""
+        self._refill(now)
+        return (self.capacity - self.tokens) / self.rate
+
+    def add(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+
+class QuotaTracker:
+    """Лимиты RPM/TPM/RPD/TPD на пару (ключ, модель), как их считает Groq"""
+
+    def __init__(self, model_limits=None):
+        self.model_limits = model_limits if model_limits is not None else MODEL_LIMITS
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key, model):
+        pair = (key, model)
+        if pair not in self.windows:
+            limits = dict(DEFAULT_LIMITS)
+            limits.update({name: value for name, value in self.model_limits.get(model, {}).items() if name in limits})
+            self.windows[pair] = {name: _Bucket(limits[name], period) for name, period, _ in WINDOWS}
+        return self.windows[pair]
+
+    def take(self, key, model, tokens):
+        """Списать запрос на tokens токенов → (retry_after или None, заголовки x-ratelimit-*)"""
+        now = time.time()
+        with self.lock:
+            windows = self._get(key, model)
+            amounts = {name: (1 if kind == "requests" else tokens) for name, _, kind in WINDOWS}
+            retry_after = max(windows[name].wait_for(amounts[name], now) for name in windows)
+            if retry_after <= 0:
+                for name, window in windows.items():
+                    window.add(amounts[name], now)
+                retry_after = None
+            return retry_after, self._headers(windows, now)
+
+    @staticmethod
+    def _headers(windows, now):
+        # Groq: requests - дневной лимит запросов, tokens - минутный лимит токенов
+        rpd, tpm = windows["rpd"], windows["tpm"]
+        return {
+            "x-ratelimit-limit-requests": str(rpd.capacity),
+            "x-ratelimit-remaining-requests": str(rpd.remaining(now)),
+            "x-ratelimit-reset-requests": f"{rpd.reset_in(now):.2f}s",
+            "x-ratelimit-limit-tokens": str(tpm.capacity),
+            "x-ratelimit-remaining-tokens": str(tpm.remaining(now)),
+            "x-ratelimit-reset-tokens": f"{tpm.reset_in(now):.2f}s"
+        }
+
+
+class _QuietServer(ThreadingHTTPServer):
+    """Клиент, оборвавший соединение (остановка прогона), - не ошибка сервера"""
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeGroqServer:
+    """HTTP сервер-заменитель Groq (в фоновом потоке или из командной строки)"""
+
+    def __init__(self, host="127.0.0.1", port=8000, profile=None, quotas=None, models=None, batch_delay=2.0):
+        self.profile = profile or FaultProfile()
+        self.quotas = quotas or QuotaTracker()
+        self.models = list(models or MODEL_LIMITS)
+        self.batch_delay = batch_delay
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        
+        # Batch API: загруженные файлы и задания
+        self.files = {}         # file_id -> содержимое (bytes)
+        self.batches = {}       # batch_id -> объект задания
+        self.batch_lock = threading.Lock()
+        self.httpd = _QuietServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, status):
+        with self.stats_lock:
+            self.stats[status] = self.stats.get(status, 0) + 1
+
+    def start(self):
+        """Запустить в фоновом потоке"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="fake-groq")
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ---------- ответы ----------
+
+    def completion(self, body):
+        """Текст и usage ответа на тело chat/completions (без задержек и лимитов)"""
+        messages = body.get("messages", [])
+        text = self.completion_text(messages)
+        completion_tokens = estimate_text_tokens(text)
+        max_tokens = body.get("max_tokens")
+        if max_tokens:
+            completion_tokens = min(completion_tokens, max_tokens)
+            text = text[:completion_tokens * 3]
+        prompt_tokens = estimate_text_tokens("".join(m.get("content", "") for m in messages))
+        return text, {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    @staticmethod
+    def completion_body(model, text, usage):
+        """Тело ответа chat.completion"""
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+
+    # ---------- Batch API ----------
+
+    def add_file(self, content):
+        file_id = f"file_{uuid.uuid4().hex}"
+        with self.batch_lock:
+            self.files[file_id] = content
+        return file_id
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        """Новое задание; выполняется в фоне за batch_delay секунд"""
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        with self.batch_lock:
+            self.batches[batch["id"]] = batch
+        threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+        return dict(batch)
+
+    def get_batch(self, batch_id):
+        with self.batch_lock:
+            batch = self.batches.get(batch_id)
+            return dict(batch) if batch else None
+
+    def _run_batch(self, batch):
+        time.sleep(self.batch_delay / 2)
+        with self.batch_lock:
+            lines = self.files.get(batch["input_file_id"], b"").decode("utf-8").splitlines()
+            batch["status"] = "in_progress"
+            batch["request_counts"]["total"] = len([line for line in lines if line.strip()])
+
+        outputs, errors = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request.get("body", {})
+            record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request.get("custom_id")}
+            if body.get("model") not in self.models or self.profile.pick_fault() in ("500", "timeout"):
+                record["response"] = None
+                record["error"] = {"code": "batch_request_failed", "message": "Request failed"}
+                errors.append(record)
+            else:
+                text, usage = self.completion(body)
+                record["response"] = {
+                    "status_code": 200,
+                    "request_id": f"req_{uuid.uuid4().hex}",
+                    "body": self.completion_body(body["model"], text, usage)
+                }
+                record["error"] = None
+                outputs.append(record)
+
+        time.sleep(self.batch_delay / 2)
+        to_jsonl = lambda records: "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with self.batch_lock:
+            if outputs:
+                batch["output_file_id"] = f"file_{uuid.uuid4().hex}"
+                self.files[batch["output_file_id"]] = to_jsonl(outputs)
+            if errors:
+                batch["error_file_id"] = f"file_{uuid.uuid4().hex}"
+                self.files[batch["error_file_id"]] = to_jsonl(errors)
+            batch["request_counts"]["completed"] = len(outputs)
+            batch["request_counts"]["failed"] = len(errors)
+            batch["status"] = "completed"
+
+    @staticmethod
+    def completion_text(messages):
+        """
+        Текст ответа: N промптов, если system prompt просит "N промптов",
+        иначе - эхо сообщения пользователя (как ответ проверки промптов).
+        Пакет чанков («### ЧАНК k») получает N промптов на каждый чанк под его маркером.
+        """
+        system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+
+        match = re.search(r"(\d+)\s+промпт", system)
+        if not match:
+            return user
+        count = int(match.group(1))
+
+        parts = re.split(r"^### ЧАНК (\d+)$", user, flags=re.MULTILINE)
+        if len(parts) < 3:
+            return FakeGroqServer._prompts(user, count)
+        return "\n".join(
+            f"### ЧАНК {number}\n{FakeGroqServer._prompts(text, count)}"
+            for number, text in zip(parts[1::2], parts[2::2])
+        )
+
+    @staticmethod
+    def _prompts(text, count):
+        topic = " ".join(text.split())[:80] or "пустой чанк"
+        return "\n".join(
+            f"{i}. Тестовый промпт {i} для нагрузочного прогона по тексту: {topic}"
+            for i in range(1, count + 1)
+        )
+
+
+def _make_handler(server):
+    profile = server.profile
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        # ---------- служебное ----------
+
+        def _api_key(self):
+            auth = self.headers.get("Authorization", "")
+            return auth[7:] if auth.startswith("Bearer ") else ""
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            server.count(status)
+
+        def _send_error(self, status, message, error_type, headers=None):
+            self._send_json(status, {"error": {"message": message, "type": error_type}}, headers)
+
+        def _authorized(self, api_key):
+            if not api_key or api_key in profile.invalid_keys:
+                self._send_error(401, "Invalid API Key", "invalid_request_error")
+                return False
+            return True
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length)
+
+        def _read_json(self):
+            return json.loads(self._read_body() or b"{}")
+
+        def _read_upload(self):
+            """Файл из multipart/form-data (поле file)"""
+            message = email.message_from_bytes(
+                b"Content-Type: " + self.headers.get("Content-Type", "").encode("latin-1") + b"\r\n\r\n"
+                + self._read_body()
+            )
+            for part in message.walk():
+                if part.get_param("name", header="content-disposition") == "file":
+                    return part.get_payload(decode=True)
+            return None
+
+        # ---------- эндпоинты ----------
+
+        def do_HEAD(self):
+            # Прогрев соединений: любой ответ оставляет соединение в пуле
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if not self._authorized(self._api_key()):
+                return
+
+            if path == "/openai/v1/models":
+                return self._send_json(200, {
+                    "object": "list",
+                    "data": [{"id": model, "object": "model", "owned_by": "fake-groq"} for model in server.models]
+                })
+
+            match = re.fullmatch(r"/openai/v1/batches/([\w-]+)", path)
+            if match:
+                batch = server.get_batch(match.group(1))
+                if batch is None:
+                    return self._send_error(404, "Batch not found", "not_found")
+                return self._send_json(200, batch)
+
+            match = re.fullmatch(r"/openai/v1/files/([\w-]+)/content", path)
+            if match:
+                with server.batch_lock:
+                    content = server.files.get(match.group(1))
+                if content is None:
+                    return self._send_error(404, "File not found", "not_found")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+                server.count(200)
+                return
+
+            self._send_error(404, "Unknown path", "not_found")
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if path == "/openai/v1/files":
+                return self._upload_file()
+            if path == "/openai/v1/batches":
+                return self._create_batch()
+            if path != "/openai/v1/chat/completions":
+                return self._send_error(404, "Unknown path", "not_found")
+
+            body = self._read_json()
+            api_key = self._api_key()
+            if not self._authorized(api_key):
+                return
+
+            model = body.get("model")
+            if model not in server.models:
+                return self._send_error(404, f"The model `{model}` does not exist", "invalid_request_error")
+
+            fault = profile.pick_fault()
+            if fault == "401":
+                return self._send_error(401, "Invalid API Key", "invalid_request_error")
+            if fault == "500":
+                return self._send_error(500, "Internal Server Error", "internal_server_error")
+            if fault == "timeout":
+                # Ответа не будет: клиент упрётся в свой таймаут чтения
+                time.sleep(profile.timeout_seconds)
+                server.count("timeout")
+                self.close_connection = True
+                return
+
+            text, usage = server.completion(body)
+            completion_tokens = usage["completion_tokens"]
+
+            retry_after, headers = server.quotas.take(api_key, model, usage["total_tokens"])
+            if fault == "429" and retry_after is None:
+                retry_after = 1.0
+            if retry_after is not None:
+                headers["retry-after"] = f"{max(1, round(retry_after))}"
+                return self._send_error(429, f"Rate limit reached for model `{model}`", "tokens", headers)
+
+            queue_time = profile.latency()
+            total_time = profile.generation_time(completion_tokens)
+            usage.update(queue_time=queue_time, total_time=total_time)
+            headers["x-request-id"] = f"req_{uuid.uuid4().hex}"
+            time.sleep(queue_time)
+
+            if body.get("stream"):
+                self._stream(model, text, usage, headers, total_time)
+            else:
+                time.sleep(total_time)
+                self._send_json(200, server.completion_body(model, text, usage), headers)
+
+        def _upload_file(self):
+            content = self._read_upload()
+            if not self._authorized(self._api_key()):
+                return
+            if content is None:
+                return self._send_error(400, "Missing file", "invalid_request_error")
+            file_id = server.add_file(content)
+            self._send_json(200, {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"})
+
+        def _create_batch(self):
+            body = self._read_json()
+            if not self._authorized(self._api_key()):
+                return
+            input_file_id = body.get("input_file_id")
+            with server.batch_lock:
+                known = input_file_id in server.files
+            if not known:
+                return self._send_error(400, "Unknown input_file_id", "invalid_request_error")
+            self._send_json(200, server.create_batch(
+                input_file_id, body.get("endpoint"), body.get("completion_window", "24h")
+            ))
+
+        def _stream(self, model, text, usage, headers, total_time):
+            """SSE ответ: куски текста с темпом генерации, usage - в x_groq последнего чанка"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.close_connection = True
+            server.count(200)
+
+            chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+            pieces = [text[i:i + 24] for i in range(0, len(text), 24)] or [""]
+            pause = total_time / len(pieces)
+
+            def event(delta, finish_reason=None, extra=None):
+                chunk = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                chunk.update(extra or {})
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                for piece in pieces:
+                    event({"content": piece})
+                    if pause:
+                        time.sleep(pause)
+                event({}, "stop", {"x_groq": {"id": headers["x-request-id"], "usage": usage}})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент оборвал поток (набрал нужное число промптов)
+                pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный заменитель Groq API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="медиана задержки до первого байта, сек")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="разброс задержки (логнормальный)")
+    parser.add_argument("--tokens-per-second", type=float, default=500, help="скорость генерации ответа")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-401", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--rate-timeout", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=120, help="сколько висит запрос-таймаут")
+    parser.add_argument("--invalid-key", action="append", default=[], help="ключ, всегда получающий 401")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="время выполнения batch задания, сек")
+    args = parser.parse_args()
+
+    profile = FaultProfile(
+        rate_429=args.rate_429, rate_401=args.rate_401, rate_500=args.rate_500, rate_timeout=args.rate_timeout,
+        latency_median=args.latency, latency_sigma=args.latency_sigma, tokens_per_second=args.tokens_per_second,
+        timeout_seconds=args.timeout_seconds, invalid_keys=args.invalid_key, seed=args.seed
+    )
+    server = FakeGroqServer(args.host, args.port, profile, batch_delay=args.batch_delay)
+    print(f"🧪 Заменитель Groq API: {server.base_url} (Ctrl+C - остановить)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,26 @@
+import queue
+import threading
 from datetime import datetime
 
 class Logger:
     """Простой логгер для записи сообщений"""
     
+    # Как часто поток интерфейса забирает сообщения других потоков (мс)
+    DRAIN_INTERVAL_MS = 50
+    
     def __init__(self, log_widget=None):
-        self.log_widget = log_widget
+        self.log_widget = None
+        self.widget_thread = None
+        self.pending = queue.Queue()
+        if log_widget is not None:
+            self.set_widget(log_widget)
     
     def set_widget(self, log_widget):
-        """Установить виджет для вывода логов"""
+        """Установить виджет для вывода логов (вызывать из потока интерфейса)"""
         self.log_widget = log_widget
+        self.widget_thread = threading.get_ident()
+        if log_widget is not None:
+            log_widget.after(self.DRAIN_INTERVAL_MS, self._drain)
     
     def log(self, message, level="info"):
         """Вывод сообщения в лог"""
@@ -16,8 +28,37 @@ class Logger:
         full_message = f"[{timestamp}] {message}\n"
         
         if self.log_widget:
-            self.log_widget.insert("end", full_message, level)
-            self.log_widget.see("end")
+            # Tk не потокобезопасен: из других потоков (пул воркеров) - через очередь
+            if threading.get_ident() != self.widget_thread:
+                self.pending.put((full_message, level))
+                return
+            self._flush_pending()
+            self._write(full_message, level)
         else:
             # Если виджет не установлен, выводим в консоль
             print(full_message.strip())
+    
+    def _write(self, full_message, level):
+        self.log_widget.insert("end", full_message, level)
+        self.log_widget.see("end")
+    
+    def _flush_pending(self):
+        """Вывести накопленные сообщения других потоков (в потоке интерфейса)"""
+        while True:
+            try:
+                full_message, level = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            self._write(full_message, level)
+    
+    def _drain(self):
+        """Периодический вывод очереди по таймеру after() виджета"""
+        widget = self.log_widget
+        if widget is None:
+            return
+        try:
+            self._flush_pending()
+            widget.after(self.DRAIN_INTERVAL_MS, self._drain)
+        except Exception:
+            # Окно закрыто (TclError) - выводить больше некуда
+            pass
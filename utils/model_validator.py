@@ -1,7 +1,8 @@
-import requests
 import json
 from datetime import datetime
 
+from logic.http_transport import get_shared_transport, GROQ_API_BASE
+
 class ModelValidator:
     """✅ НОВОЕ: Валидация и обновление списка доступных моделей Groq API"""
     
@@ -20,7 +21,8 @@ class ModelValidator:
     
     def __init__(self, logger=None):
         self.logger = logger
-        self.api_url = "https://api.groq.com/openai/v1/models"
+        self.transport = get_shared_transport(logger=logger)
+        self.api_url = f"{GROQ_API_BASE}/openai/v1/models"
     
     def log(self, message, level="info"):
         """Вывод в лог"""
@@ -36,7 +38,7 @@ class ModelValidator:
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             }
-            response = requests.get(self.api_url, headers=headers, timeout=10)
+            response, _ = self.transport.get(self.api_url, headers=headers, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -128,4 +130,5 @@ class ModelValidator:
             return True
         
         except Exception as e:
-            self.log(f"❌
+            self.log(f"❌ Ошибка обновления config: {str(e)}", "error")
+            return False
@@ -0,0 +1,22 @@
+"""
+Звуковые сигналы.
+
+winsound есть только в Windows; на других системах (серверы, запуск
+через cli.py) сигнал просто не звучит.
+"""
+
+try:
+    import winsound
+except ImportError:  # не Windows
+    winsound = None
+
+
+def beep(frequency, duration):
+    """Сигнал frequency Гц длительностью duration мс (без winsound - ничего)"""
+    if winsound is None:
+        return
+    try:
+        winsound.Beep(frequency, duration)
+    except RuntimeError:
+        # Нет звукового устройства
+        pass